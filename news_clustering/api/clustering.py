@@ -0,0 +1,116 @@
+import numpy as np
+
+from news_clustering.api.signature_matrix import calc_band_keys
+
+
+class UnionFind:
+    def __init__(self):
+        """
+        Union-find (disjoint sets) of news URLs, with union by size and path compression,
+        that also keeps the members of each set (so a cluster is listed without scanning all the news).
+        """
+        self.parents = dict()  # {item: parent}
+        self.members = dict()  # {root: [items]}
+
+    def __contains__(self, item):
+        return item in self.parents
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, item):
+        if item not in self.parents:
+            self.parents[item] = item
+            self.members[item] = [item]
+
+    def find(self, item):
+        """
+        Args:
+            item (str): An added item.
+        Returns:
+            str: The root of the set of the item.
+        """
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, item, other_item):
+        """
+        Merges the sets of two added items.
+
+        Returns:
+            str: The root of the merged set.
+        """
+        root = self.find(item)
+        other_root = self.find(other_item)
+        if root == other_root:
+            return root
+        if len(self.members[root]) < len(self.members[other_root]):
+            root, other_root = other_root, root
+        self.parents[other_root] = root
+        self.members[root].extend(self.members.pop(other_root))
+        return root
+
+    def get_members(self, item):
+        """
+        Returns:
+            List[str]: All the items in the set of the item (including it).
+        """
+        return self.members[self.find(item)]
+
+    def get_sets(self):
+        """
+        Returns:
+            Iterator[List[str]]: The members of each set.
+        """
+        return iter(self.members.values())
+
+
+def find_similar_pairs(signatures, b, r, threshold, chunk_size=65536):
+    """
+    Finds the pairs of near-duplicate signatures through the LSH band buckets, in roughly linear time:
+    in each band, the signatures with the same band key are in a bucket, and every bucket member is compared with
+    the first member of the bucket (the members similar to each other, but not to the first one, are usually
+    linked through the buckets of the other bands).
+
+    Args:
+        signatures (np.ndarray):
+            The uint64 signature matrix, of shape (n, num_perm).
+        b (int):
+            The number of LSH bands.
+        r (int):
+            The number of rows (hash values) per band.
+        threshold (float):
+            The minimum estimated jaccard similarity of a pair.
+        chunk_size (int):
+            How many pairs are compared at once (bounds the memory used).
+    Returns:
+        Tuple[np.ndarray, np.ndarray]:
+            The signature rows of the pairs (the first rows, and the second rows).
+    """
+    if len(signatures) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    num_perm = signatures.shape[1]
+    band_keys = calc_band_keys(signatures, b, r)
+
+    pair_keys = []
+    for keys in band_keys:
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        is_bucket_start = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        bucket_firsts = order[np.flatnonzero(is_bucket_start)[np.cumsum(is_bucket_start) - 1]]
+        is_member = ~is_bucket_start
+        # One int64 key per pair, so the pairs found in multiple bands are compared once
+        pair_keys.append(bucket_firsts[is_member].astype(np.int64) * len(signatures) + order[is_member])
+    pair_keys = np.unique(np.concatenate(pair_keys)) if pair_keys else np.empty(0, dtype=np.int64)
+
+    first_rows, second_rows = np.divmod(pair_keys, len(signatures))
+    is_similar = np.empty(len(pair_keys), dtype=bool)
+    for start in range(0, len(pair_keys), chunk_size):
+        end = start + chunk_size
+        equal_cnt = np.count_nonzero(signatures[first_rows[start:end]] == signatures[second_rows[start:end]], axis=1)
+        is_similar[start:end] = equal_cnt >= threshold * num_perm
+    return first_rows[is_similar], second_rows[is_similar]
@@ -1,23 +1,186 @@
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import queue
+import time
+
 from sanic import response
 
+from news_clustering.api.index_backends import INDEX_BACKENDS
+from news_clustering.api.ingestion import IngestionPublisher
+from news_clustering.api.query_cache import QueryCache
+from news_clustering.api.query_executor import QueryExecutor, QueryQueueFull
+from news_clustering.api.shared_index import IndexPublisher, SharedIndex
 from news_clustering.api.similar_texts import SimilarTexts
 
 MAX_QUERY_LEN = 16
-similar_texts = SimilarTexts(
-    threshold=0.6,
-                             num_perm=128,
-                             parameters={
-                                 'title': [(2, 3), 'WORDS'],
-                                 'content': [(5, 11), 'WORDS'],
-                                 'contained_urls': [(3, 4), 'WORDS']
-                             })
+MAX_BATCH_SIZE = 500
+QUERY_WORKERS = 2  # The processes that calculate the MinHashes of the queries, per server worker
+MAX_PENDING_QUERIES = 32  # Over this, the queries are rejected with 503 (backpressure)
+QUERY_TIMEOUT = 10  # Seconds
+QUERY_CACHE_SIZE = 10000  # The cached query results, per server worker
+QUERY_CACHE_TTL = 600  # Seconds
+MAX_INGEST_BATCH_SIZE = 1000
+MAX_PENDING_INGEST_BATCHES = 64  # Over this, the ingested batches are rejected with 503 (backpressure)
+MIN_PUBLISH_INTERVAL = 1.0  # Seconds between the index generations published with the ingested news
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+RESULTS_PATH = os.path.join(PROJECT_DIR, 'results')  # The crawler's JSONL_OUTPUT_DIR
+INDEX_DIR = os.path.join(PROJECT_DIR, 'index')
+SIMILAR_TEXTS_PARAMETERS = {
+    'threshold': 0.6,
+    'num_perm': 128,
+    'parameters': {
+        'title': [(2, 3), 'WORDS'],
+        'content': [(5, 11), 'WORDS'],
+        'contained_urls': [(3, 4), 'WORDS']
+    },
+    'vectorized_hashing': True,
+    'signature_store_dir': os.path.join(INDEX_DIR, 'signatures'),
+    'keep_texts': False,  # Only the signatures are published
+}
+
+# Attached in each server worker, to the index built once by the main process
+similar_index = None
+query_executor = None
+# In the main process, which owns the database and publishes the ingested news
+ingestion_publisher = None
+
+
+def build_similar_texts():
+    """
+    Returns:
+        SimilarTexts:
+            The SimilarTexts of the crawler results, with the server's settings.
+    """
+    return SimilarTexts(results_path=RESULTS_PATH, **SIMILAR_TEXTS_PARAMETERS)
+
+
+async def publish_similar_index(app, loop):
+    """
+    Server listener (main_process_start): builds the database once, and publishes it as a shared index generation.
+    The database is kept, the news pushed to the ingest endpoint are added to it and published as delta generations,
+    the workers switch to them without restarting.
+    """
+    global ingestion_publisher
+    index_publisher = IndexPublisher(build_similar_texts(), INDEX_DIR)
+    index_publisher.publish()
+
+    app.shared_ctx.ingest_queue = multiprocessing.Queue(maxsize=MAX_PENDING_INGEST_BATCHES)
+    ingestion_publisher = IngestionPublisher(index_publisher, app.shared_ctx.ingest_queue,
+                                             min_publish_interval=MIN_PUBLISH_INTERVAL).start()
+
+
+async def stop_ingestion_publisher(app, loop):
+    """
+    Server listener (main_process_stop).
+    """
+    if ingestion_publisher is not None:
+        ingestion_publisher.stop(timeout=QUERY_TIMEOUT)
+
+
+async def start_query_executor(app, loop):
+    """
+    Server listener (before_server_start): attaches the server worker to the shared index,
+    and starts its hashing pool.
+    """
+    global similar_index, query_executor
+    similar_index = SharedIndex(INDEX_DIR)
+    query_executor = QueryExecutor(similar_index,
+                                   workers=QUERY_WORKERS,
+                                   max_pending=MAX_PENDING_QUERIES,
+                                   timeout=QUERY_TIMEOUT,
+                                   cache=QueryCache(max_size=QUERY_CACHE_SIZE,
+                                                    ttl=QUERY_CACHE_TTL,
+                                                    case_sensitive=similar_index.shingles_calc.case_sensitive))
+
+
+async def stop_query_executor(app, loop):
+    """
+    Server listener (after_server_stop).
+    """
+    if query_executor is not None:
+        query_executor.close()
+
+
+async def stop_ingestion(app, loop):
+    """
+    Server listener (after_server_stop): the worker exits without waiting for its queued ingest batches
+    to be read (they're dropped if the publisher is already stopped, the crawler's results have them).
+    """
+    ingest_queue = getattr(app.shared_ctx, 'ingest_queue', None)
+    if ingest_queue is not None:
+        ingest_queue.cancel_join_thread()
+
+
+def get_ranking_params(params):
+    """
+    Args:
+        params (Dict[str, Any]):
+            The request params, with the optional 'top_k', 'min_score' (as numbers or strings) and 'backend'.
+    Returns:
+        Tuple[Optional[int], Optional[float], str]:
+            The top_k, min_score and index backend ('lsh' by default).
+    Raises:
+        ValueError: If they are invalid.
+    """
+    top_k = params.get('top_k')
+    min_score = params.get('min_score')
+    backend = params.get('backend')
+    if isinstance(top_k, list):  # The params from the query string are lists
+        top_k = top_k[0] if top_k else None
+    if isinstance(min_score, list):
+        min_score = min_score[0] if min_score else None
+    if isinstance(backend, list):
+        backend = backend[0] if backend else None
+
+    try:  # A JSON object or list raises a TypeError (e.g. float({})), rejected like the invalid strings
+        top_k = int(top_k) if top_k not in (None, '') else None
+        min_score = float(min_score) if min_score not in (None, '') else None
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid top_k or min_score: {e}')
+    if top_k is not None and top_k < 1:
+        raise ValueError('top_k must be at least 1')
+    if min_score is not None and not (math.isfinite(min_score) and 0 <= min_score <= 1):
+        raise ValueError('min_score must be between 0 and 1')
+    backend = backend or 'lsh'
+    if not isinstance(backend, str) or backend not in INDEX_BACKENDS:
+        raise ValueError(f'backend must be one of {list(INDEX_BACKENDS)}')
+    return top_k, min_score, backend
+
+
+async def get_similar_news_batch(news_infos, top_k=None, min_score=None, backend='lsh'):
+    """
+    Queries the similar news, with the hashing done in the query executor (if it's started).
+
+    Returns:
+        Tuple[Optional[List[Dict[str, float]]], Optional[HTTPResponse]]:
+            The results (ranked from the most to the least similar),
+            or the error response if the query couldn't be answered.
+    """
+    if query_executor is None:
+        return similar_index.get_similar_news_batch(news_infos, top_k=top_k, min_score=min_score,
+                                                    backend=backend), None
+    try:
+        return await query_executor.get_similar_news_batch(news_infos, top_k=top_k, min_score=min_score,
+                                                           backend=backend), None
+    except QueryQueueFull:
+        return None, response.text('Too many pending queries! Try again later.', status=503,
+                                   headers={'Retry-After': '1'})
+    except asyncio.TimeoutError:
+        return None, response.text(f'The query took more than {QUERY_TIMEOUT} seconds!', status=504)
 
 
 async def query(request):
     """
     Main query entry point.
     Params in the request in the following format:
-    {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+    {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}, 'top_k': int, 'min_score': float,
+     'backend': str}
+    The similar news are ranked from the most to the least similar, top_k and min_score are optional.
+    The backend ('lsh', 'forest' or 'ensemble', see SimilarTexts.get_similar_news()) is optional too.
     """
     params = request.json or request.args
     if params is None:
@@ -28,15 +191,119 @@ async def query(request):
     title = params.get('title', '')
     content = params.get('content', '')
     urls = params.get('urls', dict())
+    try:
+        top_k, min_score, backend = get_ranking_params(params)
+    except ValueError:
+        return response.text('Invalid top_k, min_score or backend!', status=400)
+
+    results, error_response = await get_similar_news_batch([{
+        'url': url,
+        'title': title,
+        'content': content,
+        'contained_urls': urls,
+    }], top_k=top_k, min_score=min_score, backend=backend)
+    if error_response is not None:
+        return error_response
 
     result = {
-        'news_clustering': similar_texts.get_similar_news(
-            news_url=url,
-            news_title=title,
-            news_content=content,
-            news_contained_urls=urls
-        )
+        'news_clustering': results[0]
     }
     # return response.text('Invalid args!', status=400)
 
     return response.json(result, status=200)
+
+
+async def query_batch(request):
+    """
+    Batch query entry point, for looking up multiple news with one request.
+    The request JSON is a list (of at most MAX_BATCH_SIZE news) in the following format:
+    [{'url': str, 'title': str, 'content': str, 'urls': {URL: URL_TITLE}}]
+    The results are streamed as NDJSON, one line per news, in the same order:
+    {'url': str, 'news_clustering': {SIMILAR_URL: JACCARD}}
+    The optional top_k, min_score and backend are in the query string (e.g. ?top_k=10&min_score=0.7&backend=forest).
+    """
+    params = request.json
+    if not isinstance(params, list) or not all(isinstance(news, dict) for news in params):
+        return response.text('Invalid JSON parameters! Expected a list of news objects!', status=400)
+    if len(params) > MAX_BATCH_SIZE:
+        return response.text(f'Too many news in the batch! The maximum is {MAX_BATCH_SIZE}.', status=413)
+    try:
+        top_k, min_score, backend = get_ranking_params(dict(request.args))
+    except ValueError:
+        return response.text('Invalid top_k, min_score or backend!', status=400)
+
+    results, error_response = await get_similar_news_batch([
+        {
+            'url': news.get('url', ''),
+            'title': news.get('title', ''),
+            'content': news.get('content', ''),
+            'contained_urls': news.get('urls', dict()),
+        }
+        for news in params
+    ], top_k=top_k, min_score=min_score, backend=backend)
+    if error_response is not None:
+        return error_response
+
+    stream = await request.respond(content_type='application/x-ndjson')
+    for news, result in zip(params, results):
+        await stream.send(json.dumps({'url': news.get('url', ''), 'news_clustering': result}) + '\n')
+    await stream.eof()
+
+
+async def cluster(request):
+    """
+    Cluster lookup entry point.
+    Params in the query string: ?url=NEWS_URL
+    Returns the news in the same cluster (near-duplicates, transitively), including the news itself:
+    {'url': str, 'cluster': [URL]}
+    """
+    url = request.args.get('url')
+    if not url:
+        return response.text('Missing the url parameter!', status=400)
+
+    members = similar_index.get_cluster(url)
+    if members is None:
+        return response.text('The news is not in the index!', status=404)
+    return response.json({'url': url, 'cluster': members}, status=200)
+
+
+async def ingest(request):
+    """
+    Ingestion entry point, for adding the news to the index while the server runs (e.g. by the crawler).
+    The request JSON is a list (of at most MAX_INGEST_BATCH_SIZE news) in the crawler's format:
+    [{'url': str, 'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}]
+    The news are queued and published with the next index generation (usually in a few seconds): 202
+    {'queued': int}
+    When too many batches are already queued, the batch is rejected with 503 (retry it later).
+    """
+    params = request.json
+    if not isinstance(params, list) or not all(isinstance(news, dict) and news.get('url') for news in params):
+        return response.text('Invalid JSON parameters! Expected a list of news objects with urls!', status=400)
+    if len(params) > MAX_INGEST_BATCH_SIZE:
+        return response.text(f'Too many news in the batch! The maximum is {MAX_INGEST_BATCH_SIZE}.', status=413)
+
+    news_items = [{
+        'url': news['url'],
+        'title': news.get('title', ''),
+        'content': news.get('content', ''),
+        'contained_urls': news.get('contained_urls', dict()),
+    } for news in params]
+    try:
+        request.app.shared_ctx.ingest_queue.put_nowait((time.time(), news_items))
+    except queue.Full:
+        return response.text('Too many pending ingested news! Try again later.', status=503,
+                             headers={'Retry-After': '1'})
+    return response.json({'queued': len(news_items)}, status=202)
+
+
+async def stats(request):
+    """
+    The query metrics of the server worker that answers:
+    {'generation': str, 'pending_queries': int, 'cache': {...}}
+    """
+    result = {
+        'generation': similar_index.current_generation() if similar_index is not None else None,
+        'pending_queries': query_executor.pending if query_executor is not None else 0,
+        'cache': query_executor.cache.stats() if query_executor is not None and query_executor.cache else None,
+    }
+    return response.json(result, status=200)
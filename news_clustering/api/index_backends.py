@@ -0,0 +1,181 @@
+import numpy as np
+from datasketch import MinHashLSH, MinHashLSHForest, MinHashLSHEnsemble
+
+from news_clustering.api.signature_matrix import estimate_set_sizes
+
+
+class LSHIndex:
+    name = 'lsh'
+    updatable = True  # The news can be inserted and removed in place
+    containment = False  # The candidates are scored by jaccard similarity
+    default_top_k = None
+    top_k_candidates = False  # The candidates don't depend on top_k
+
+    def __init__(self, threshold, num_perm, **_):
+        """
+        The `MinHashLSH <https://ekzhu.com/datasketch/lsh.html>`_ index:
+        finds the news whose jaccard similarity is probably at least the threshold (fixed when building it).
+
+        Args:
+            threshold (float):
+                The jaccard similarity threshold.
+            num_perm (int):
+                The number of permutations for a MinHash.
+        Returns:
+            LSHIndex:
+                The initialized (empty) index
+        """
+        self.lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+
+    def build(self, entries):
+        """
+        Args:
+            entries (Iterable[Tuple[Hashable, LeanMinHash]]): The (key, minhash) pairs to index.
+        """
+        with self.lsh.insertion_session() as session:
+            for key, minhash in entries:
+                session.insert(key, minhash)
+
+    def insert(self, key, minhash):
+        if key in self.lsh:
+            self.lsh.remove(key)
+        self.lsh.insert(key, minhash)
+
+    def remove(self, key):
+        if key in self.lsh:
+            self.lsh.remove(key)
+
+    def query(self, minhash, top_k=None):
+        """
+        Args:
+            minhash (LeanMinHash): The MinHash of the query.
+            top_k (Optional[int]): The number of wanted results (not used by this index).
+        Returns:
+            List[Hashable]: The keys of the candidates.
+        """
+        return self.lsh.query(minhash)
+
+
+class ForestIndex:
+    name = 'forest'
+    updatable = False  # Rebuilt after the database changes (the forest can't remove a news)
+    containment = False
+    default_top_k = 10
+    top_k_candidates = True
+    CANDIDATES_FACTOR = 2  # The forest is asked for top_k * 2 candidates, which are then ranked by their estimates
+
+    def __init__(self, num_perm, **_):
+        """
+        The `MinHashLSHForest <https://ekzhu.com/datasketch/lshforest.html>`_ index:
+        finds the top-k most similar news, at any similarity (there is no threshold to fix when building it).
+
+        Args:
+            num_perm (int):
+                The number of permutations for a MinHash.
+        Returns:
+            ForestIndex:
+                The initialized (empty) index
+        """
+        self.forest = MinHashLSHForest(num_perm=num_perm)
+
+    def build(self, entries):
+        """
+        Same as LSHIndex.build().
+        """
+        for key, minhash in entries:
+            self.forest.add(key, minhash)
+        self.forest.index()
+
+    def query(self, minhash, top_k=None):
+        """
+        Same as LSHIndex.query(), with at most top_k * CANDIDATES_FACTOR candidates.
+        """
+        if self.forest.is_empty():
+            return []
+        return self.forest.query(minhash, (top_k or self.default_top_k) * self.CANDIDATES_FACTOR)
+
+
+class EnsembleIndex:
+    name = 'ensemble'
+    updatable = False  # Rebuilt after the database changes (the ensemble is partitioned by the set sizes)
+    containment = True  # The candidates are scored by how much of the query they contain
+    default_top_k = None
+    top_k_candidates = False
+    # The false negatives weigh more than the default (0.5, 0.5): with 128 permutations, the default parameters
+    # miss half of the snippets of articles ~7 times longer, and the false positives are cheap to rank
+    FALSE_POSITIVE_WEIGHT = 0.2
+    # The estimated set sizes are rounded to 5% steps (the estimates of 128 permutations are ~9% off anyway),
+    # building the partitions is quadratic in the number of distinct sizes
+    SIZE_STEP = 1.05
+
+    def __init__(self, num_perm, containment_threshold=0.8, **_):
+        """
+        The `MinHashLSHEnsemble <https://ekzhu.com/datasketch/lshensemble.html>`_ index:
+        finds the news that probably contain at least containment_threshold of the query's shingles
+        (e.g. the long articles that a short syndicated snippet was cut from).
+        The set sizes are estimated from the MinHashes, as the shingles aren't always kept.
+        The candidates include false positives, a min_score (e.g. the containment threshold) drops them.
+
+        Args:
+            num_perm (int):
+                The number of permutations for a MinHash.
+            containment_threshold (float):
+                The containment threshold.
+        Returns:
+            EnsembleIndex:
+                The initialized (empty) index
+        """
+        self.ensemble = MinHashLSHEnsemble(threshold=containment_threshold, num_perm=num_perm,
+                                           weights=(self.FALSE_POSITIVE_WEIGHT, 1.0 - self.FALSE_POSITIVE_WEIGHT))
+
+    def build(self, entries):
+        """
+        Same as LSHIndex.build().
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        sizes = self.__round_sizes(estimate_set_sizes(np.array([minhash.hashvalues for _, minhash in entries])))
+        self.ensemble.index((key, minhash, size) for (key, minhash), size in zip(entries, sizes.tolist()))
+
+    def query(self, minhash, top_k=None):
+        """
+        Same as LSHIndex.query().
+        """
+        if self.ensemble.is_empty():
+            return []
+        return list(self.ensemble.query(minhash, int(self.__round_sizes(estimate_set_sizes(minhash.hashvalues)))))
+
+    def __round_sizes(self, sizes):
+        """
+        Args:
+            sizes (Union[float, np.ndarray]): The estimated set sizes.
+        Returns:
+            np.ndarray: The int64 sizes, rounded to the closest power of SIZE_STEP (at least 1).
+        """
+        steps = np.round(np.log(np.maximum(sizes, 1.0)) / np.log(self.SIZE_STEP))
+        return np.maximum(np.round(self.SIZE_STEP ** steps), 1).astype(np.int64)
+
+
+INDEX_BACKENDS = {index_class.name: index_class for index_class in (LSHIndex, ForestIndex, EnsembleIndex)}
+
+
+def create_index(backend, *, threshold, num_perm, containment_threshold):
+    """
+    Args:
+        backend (str):
+            The name of the index backend, one of INDEX_BACKENDS.
+        threshold (float):
+            The jaccard similarity threshold (of the 'lsh' index).
+        num_perm (int):
+            The number of permutations for a MinHash.
+        containment_threshold (float):
+            The containment threshold (of the 'ensemble' index).
+    Returns:
+        Union[LSHIndex, ForestIndex, EnsembleIndex]:
+            The initialized (empty) index.
+    """
+    if backend not in INDEX_BACKENDS:
+        raise Exception(f'Unknown index backend {backend!r}, expected one of {list(INDEX_BACKENDS)}')
+    return INDEX_BACKENDS[backend](threshold=threshold, num_perm=num_perm,
+                                   containment_threshold=containment_threshold)
@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+import time
+
+from news_clustering.api.similar_texts import news_page_dict_from_info
+
+
+class IngestionPublisher:
+    STOP_CHECK_INTERVAL = 1.0  # Seconds, how often an idle publisher checks if it was stopped
+
+    def __init__(self, index_publisher, ingest_queue, *, max_batch_news=2000, min_publish_interval=1.0,
+                 save_interval=600.0):
+        """
+        Adds the news pushed to the ingestion queue (e.g. by the crawler, through the ingest endpoint)
+        to a SimilarTexts database, and publishes them as a delta index generation, which the servers switch to
+        at their next query. Runs in a thread of the process that owns the database (the only publisher).
+        The batches queued while a generation is published are added together, so the freshness stays
+        bounded (about min_publish_interval plus a publish) however fast the news come.
+        The signatures of the ingested news are saved to the database's SignatureStore (if it has one)
+        every save_interval and when the publisher stops, so they aren't hashed again at the next start.
+
+        Args:
+            index_publisher (IndexPublisher):
+                The publisher of the SimilarTexts whose database is updated (that published its first generation).
+            ingest_queue (multiprocessing.Queue):
+                The queue of (enqueue_time, news_items) batches. The news items are in the crawler's format:
+                    {'url': str, 'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+            max_batch_news (int):
+                The maximum number of news added for a generation (the rest wait for the next one).
+            min_publish_interval (float):
+                The minimum seconds between two published generations (each one resets the query caches).
+            save_interval (float):
+                The minimum seconds between two saves of the SignatureStore (each one writes all the signatures).
+        Returns:
+            IngestionPublisher:
+                The initialized (not started) publisher
+        """
+        self.index_publisher = index_publisher
+        self.similar_texts = index_publisher.similar_texts
+        self.ingest_queue = ingest_queue
+        self.max_batch_news = max_batch_news
+        self.min_publish_interval = min_publish_interval
+        self.save_interval = save_interval
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.last_publish_time = 0.0
+        self.last_save_time = time.time()
+        self.unsaved_news_cnt = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.__run, name='ingestion-publisher', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops the publisher after the generation it's publishing (if any), and saves the signatures.
+        The news still queued aren't published (they're in the crawler's results, for the next start).
+        """
+        self.stop_event.set()
+        self.ingest_queue.cancel_join_thread()  # The exit doesn't wait for the queued batches to be read
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def __get_batches(self):
+        """
+        Waits for a batch (at most STOP_CHECK_INTERVAL), then takes the ones already queued too.
+
+        Returns:
+            List[Tuple[float, List[Dict[str, Any]]]]:
+                The (enqueue_time, news_items) batches.
+        """
+        batches = []
+        news_cnt = 0
+        try:
+            batch = self.ingest_queue.get(timeout=self.STOP_CHECK_INTERVAL)
+            while True:
+                batches.append(batch)
+                news_cnt += len(batch[1])
+                if news_cnt >= self.max_batch_news:
+                    break
+                batch = self.ingest_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return batches
+
+    def __run(self):
+        while not self.stop_event.is_set():
+            wait_s = self.last_publish_time + self.min_publish_interval - time.time()
+            if wait_s > 0:
+                time.sleep(wait_s)  # The batches queued meanwhile are published together
+            batches = self.__get_batches()
+            if not batches:
+                continue
+            try:
+                self.publish(batches)
+            except Exception:
+                logging.exception(f'Could not ingest {sum(len(news_items) for _, news_items in batches)} news')
+            if self.last_publish_time - self.last_save_time >= self.save_interval:
+                self.save_signatures()
+        self.save_signatures()
+
+    def save_signatures(self):
+        """
+        Saves the signatures of the database to its SignatureStore, if it has one and news were ingested since
+        the last save.
+        """
+        if self.similar_texts.signature_store is None or not self.unsaved_news_cnt:
+            return
+        try:
+            self.similar_texts.save_signatures()
+            self.unsaved_news_cnt = 0
+        except Exception:
+            logging.exception(f'Could not save the signatures of {self.unsaved_news_cnt} ingested news')
+        self.last_save_time = time.time()
+
+    def publish(self, batches):
+        """
+        Adds the news of the batches to the database, and publishes them as a new index generation.
+
+        Args:
+            batches (List[Tuple[float, List[Dict[str, Any]]]]):
+                The (enqueue_time, news_items) batches.
+        """
+        news_json_obj = {
+            news_item['url']: news_page_dict_from_info(news_item)
+            for _, news_items in batches
+            for news_item in news_items
+        }
+        self.similar_texts.add_many(news_json_obj)
+        self.unsaved_news_cnt += len(news_json_obj)
+        self.index_publisher.publish_changes(news_json_obj.keys())
+        self.last_publish_time = time.time()
+        oldest_enqueue_time = min(enqueue_time for enqueue_time, _ in batches)
+        logging.info(f'Ingested {len(news_json_obj)} news, '
+                     f'{self.last_publish_time - oldest_enqueue_time: .3f} seconds after they were queued')
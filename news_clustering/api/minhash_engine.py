@@ -0,0 +1,306 @@
+import logging
+import random
+import re
+import string
+import time
+import tracemalloc
+
+import numpy as np
+from datasketch import MinHash
+from datasketch.minhash import _mersenne_prime, _max_hash
+
+from news_clustering.api.signature_store import MINHASH_SEED, lean_minhash_from_hashvalues
+
+word_spans_regex = re.compile(r'\w+')  # The words between the separators of `similar_texts.words_regex`
+
+_POLY_BASE = 0x100000001B3  # Odd, so it's invertible modulo 2^64
+_POLY_BASE_INV = pow(_POLY_BASE, -1, 1 << 64)
+
+
+def _fmix64(h):
+    """
+    The MurmurHash3 64-bit finalizer, applied element-wise (modulo 2^64).
+
+    Args:
+        h (np.ndarray): The uint64 values to mix.
+    Returns:
+        np.ndarray: The mixed values.
+    """
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xff51afd7ed558ccd)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xc4ceb3fe1a85ec53)
+    h = h ^ (h >> np.uint64(33))
+    return h
+
+
+class MinHashEngine:
+    def __init__(self, shingles_calc, *, num_perm=128, seed=MINHASH_SEED, chunk_size=1024):
+        """
+        Vectorized alternative to shingling with ShinglesCalc and hashing the shingles with MinHash.update_batch.
+        The shingles are never materialized as strings: every shingle is a (start, end) slice of the text's
+        code points, and its hash is calculated from the polynomial prefix hashes of the whole text.
+        After that, all the permutations are applied at once, as a matrix operation.
+
+        The hash values are not the same as the SHA1 ones of the datasketch MinHash,
+        so the resulting LeanMinHashes should only be compared with ones calculated by a MinHashEngine.
+
+        Args:
+            shingles_calc (ShinglesCalc):
+                The initialized ShinglesCalc object, whose parameters are used.
+            num_perm (int):
+                The number of permutations for a MinHash.
+            seed (int):
+                The seed of the MinHash permutations.
+            chunk_size (int):
+                How many shingles are permuted at once (bounds the memory used to chunk_size * num_perm * 8 bytes).
+        Returns:
+            MinHashEngine:
+                The initialized engine
+        """
+        self.shingles_calc = shingles_calc
+        self.num_perm = num_perm
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+        a, b = MinHash(num_perm=num_perm, seed=seed).permutations
+        self.perm_a = a.astype(np.uint64)
+        self.perm_b = b.astype(np.uint64)
+
+    # region HASHING
+    @staticmethod
+    def __code_points(text):
+        """
+        Args:
+            text (str): The text.
+        Returns:
+            np.ndarray: The uint64 code points of the text.
+        """
+        return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+    @staticmethod
+    def __prefix_hashes(code_points):
+        """
+        Calculates what's needed to hash any slice of the text in O(1).
+        The hash of text[start:end] is base_pows[end - 1] * (prefix[end] - prefix[start]),
+        which equals sum(code_points[i] * base^(end - 1 - i)) (modulo 2^64).
+
+        Args:
+            code_points (np.ndarray): The uint64 code points of the text.
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The base powers and the prefix sums.
+        """
+        n = len(code_points)
+        base_pows = np.full(n, _POLY_BASE, dtype=np.uint64)
+        base_pows[0] = 1
+        base_pows = np.cumprod(base_pows, dtype=np.uint64)
+
+        base_inv_pows = np.full(n, _POLY_BASE_INV, dtype=np.uint64)
+        base_inv_pows[0] = 1
+        base_inv_pows = np.cumprod(base_inv_pows, dtype=np.uint64)
+
+        prefix = np.zeros(n + 1, dtype=np.uint64)
+        np.cumsum(code_points * base_inv_pows, dtype=np.uint64, out=prefix[1:])
+        return base_pows, prefix
+
+    @staticmethod
+    def __slice_hashes(base_pows, prefix, starts, ends):
+        """
+        Args:
+            base_pows (np.ndarray): The base powers of the text.
+            prefix (np.ndarray): The prefix sums of the text.
+            starts (np.ndarray): The (inclusive) starts of the slices.
+            ends (np.ndarray): The (exclusive) ends of the slices.
+        Returns:
+            np.ndarray: The 32-bit hashes of the slices, as uint64.
+        """
+        h = base_pows[ends - 1] * (prefix[ends] - prefix[starts])
+        return _fmix64(h) >> np.uint64(32)
+
+    def hash_shingles(self, text, params):
+        """
+        Calculates the hashes of all the shingles of a text.
+        The shingles are the same as the ones from ShinglesCalc (duplicates included, as they don't change a MinHash).
+
+        Args:
+            text (str): The text to calculate the shingles for.
+            params (List[Union[Tuple[int, int], str]]): The shingling parameters for this text.
+        Returns:
+            np.ndarray: The hashes of the shingles.
+        """
+        if not self.shingles_calc.case_sensitive:
+            text = text.lower()
+        if not text:
+            return np.empty(0, dtype=np.uint64)
+
+        base_pows, prefix = self.__prefix_hashes(self.__code_points(text))
+        n = len(text)
+
+        hashes = []
+        for param in params:
+            if param == 'WORDS':
+                spans = np.fromiter((pos for m in word_spans_regex.finditer(text) for pos in m.span()),
+                                    dtype=np.int64).reshape(-1, 2)
+                if len(spans):
+                    hashes.append(self.__slice_hashes(base_pows, prefix, spans[:, 0], spans[:, 1]))
+            elif isinstance(param, tuple):
+                for shingle_length in range(param[0], min(param[1], n) + 1):
+                    starts = np.arange(n - shingle_length + 1, dtype=np.int64)
+                    hashes.append(self.__slice_hashes(base_pows, prefix, starts, starts + shingle_length))
+
+        if not hashes:
+            return np.empty(0, dtype=np.uint64)
+        return np.concatenate(hashes)
+
+    def apply_permutations(self, hashes, doc_ids=None, docs_cnt=1):
+        """
+        Applies all the MinHash permutations to the hashes, and keeps the minimum for each permutation (and document).
+
+        Args:
+            hashes (np.ndarray): The shingle hashes.
+            doc_ids (Optional[np.ndarray]): The document of each hash (all of them are of document 0, if None).
+            docs_cnt (int): The number of documents.
+        Returns:
+            np.ndarray: The uint64 MinHash hash values, of shape (docs_cnt, num_perm).
+        """
+        hashvalues = np.full((docs_cnt, self.num_perm), _max_hash, dtype=np.uint64)
+        if doc_ids is None:
+            doc_ids = np.zeros(len(hashes), dtype=np.uint64)
+
+        # Duplicates don't change the MinHash. The keys are sorted by document, so each one is a contiguous run.
+        keys = np.sort((doc_ids.astype(np.uint64) << np.uint64(32)) | hashes)
+        if len(keys):
+            keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        hashes = keys & np.uint64(0xffffffff)
+        doc_ids = (keys >> np.uint64(32)).astype(np.int64)
+
+        for start in range(0, len(hashes), self.chunk_size):
+            chunk = hashes[start: start + self.chunk_size]
+            chunk_doc_ids = doc_ids[start: start + self.chunk_size]
+
+            phv = np.outer(chunk, self.perm_a)
+            phv += self.perm_b
+            np.remainder(phv, _mersenne_prime, out=phv)
+            phv &= _max_hash
+
+            run_starts = np.flatnonzero(np.r_[True, chunk_doc_ids[1:] != chunk_doc_ids[:-1]])
+            run_doc_ids = chunk_doc_ids[run_starts]
+            hashvalues[run_doc_ids] = np.minimum(hashvalues[run_doc_ids],
+                                                 np.minimum.reduceat(phv, run_starts, axis=0))
+        return hashvalues
+
+    def __hash_news_page(self, str_dict_to_shingle):
+        hashes = [
+            self.hash_shingles(text, self.shingles_calc.parameters[key])
+            for key, text in str_dict_to_shingle.items()
+        ]
+        return np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+
+    def calc_hashvalues(self, str_dict_to_shingle):
+        """
+        Calculates the MinHash hash values of a news page.
+
+        Args:
+            str_dict_to_shingle (Dict[str, str]):
+                The news page dict, of format:
+                    {'title': STR, 'content': STR, 'contained_urls': URLS_COMBINED_STR}
+        Returns:
+            np.ndarray: The uint64 MinHash hash values.
+        """
+        return self.apply_permutations(self.__hash_news_page(str_dict_to_shingle))[0]
+
+    def calc_hashvalues_batch(self, str_dicts_to_shingle):
+        """
+        Calculates the MinHash hash values of multiple news pages, permuting all their shingles in one pass.
+
+        Args:
+            str_dicts_to_shingle (List[Dict[str, str]]):
+                The news page dicts, of format:
+                    {'title': STR, 'content': STR, 'contained_urls': URLS_COMBINED_STR}
+        Returns:
+            np.ndarray: The uint64 MinHash hash values, of shape (len(str_dicts_to_shingle), num_perm).
+        """
+        hashes = [self.__hash_news_page(str_dict_to_shingle) for str_dict_to_shingle in str_dicts_to_shingle]
+        if not hashes:
+            return np.empty((0, self.num_perm), dtype=np.uint64)
+        doc_ids = np.repeat(np.arange(len(hashes), dtype=np.uint64), [len(h) for h in hashes])
+        return self.apply_permutations(np.concatenate(hashes), doc_ids=doc_ids, docs_cnt=len(hashes))
+
+    def calc_field_hashvalues_batch(self, field_texts):
+        """
+        Calculates the MinHash hash values of single news page fields (each with its field's shingling parameters),
+        permuting all their shingles in one pass. The MinHash of a whole news page is the element-wise minimum
+        of the MinHashes of its fields.
+
+        Args:
+            field_texts (List[Tuple[str, str]]):
+                The (field, text) pairs, e.g. ('title', STR) or ('contained_urls', URLS_COMBINED_STR).
+        Returns:
+            np.ndarray: The uint64 MinHash hash values, of shape (len(field_texts), num_perm).
+        """
+        hashes = [self.hash_shingles(text, self.shingles_calc.parameters[field]) for field, text in field_texts]
+        if not hashes:
+            return np.empty((0, self.num_perm), dtype=np.uint64)
+        doc_ids = np.repeat(np.arange(len(hashes), dtype=np.uint64), [len(h) for h in hashes])
+        return self.apply_permutations(np.concatenate(hashes), doc_ids=doc_ids, docs_cnt=len(hashes))
+
+    def calc_minhash(self, str_dict_to_shingle):
+        """
+        Calculates the `LeanMinHash <https://ekzhu.com/datasketch/documentation.html#datasketch.LeanMinHash>`_
+        of a news page.
+
+        Args:
+            str_dict_to_shingle (Dict[str, str]):
+                The news page dict, of format:
+                    {'title': STR, 'content': STR, 'contained_urls': URLS_COMBINED_STR}
+        Returns:
+            LeanMinHash:
+                The LeanMinHash corresponding to the provided input.
+        """
+        return lean_minhash_from_hashvalues(self.calc_hashvalues(str_dict_to_shingle), seed=self.seed)
+
+    # endregion HASHING
+
+
+if __name__ == '__main__':
+    from news_clustering.api.similar_texts import ShinglesCalc, NewsPage
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    # Throughput of the vectorized engine against the datasketch path, on random articles
+    rnd = random.Random(0)
+    vocabulary = [''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(2, 10))) for _ in range(5000)]
+    articles = [{
+        'title': ' '.join(rnd.choices(vocabulary, k=10)),
+        'content': ' '.join(rnd.choices(vocabulary, k=600)),
+        'contained_urls': {f'https://example.com/{i}/{j}': '' for j in range(3)},
+    } for i in range(50)]
+
+    shingles_calc = ShinglesCalc(parameters={
+        'title': [(2, 3), 'WORDS'],
+        'content': [(5, 11), 'WORDS'],
+        'contained_urls': [(3, 4), 'WORDS']
+    })
+    engine = MinHashEngine(shingles_calc)
+
+    # The datasketch path with the sorted, deduplicated shingle list (keep_shingles) and with the streamed shingles
+    for name, minhash_engine, keep_shingles in (('datasketch (shingle list)', None, True),
+                                                ('datasketch (streamed)', None, False),
+                                                ('vectorized', engine, False)):
+        start_time = time.time()
+        for i, article in enumerate(articles):
+            NewsPage(news_url=str(i), news_page_dict=article, shingles_calc=shingles_calc,
+                     minhash_engine=minhash_engine, keep_shingles=keep_shingles)
+        articles_per_second = len(articles) / (time.time() - start_time)
+
+        tracemalloc.start()
+        NewsPage(news_url='0', news_page_dict=articles[0], shingles_calc=shingles_calc,
+                 minhash_engine=minhash_engine, keep_shingles=keep_shingles)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        logging.info(f'{name}: {articles_per_second: .2f} articles per second, '
+                     f'{peak_memory / 2 ** 20: .2f} MB peak memory per article')
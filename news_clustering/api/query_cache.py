@@ -0,0 +1,119 @@
+import time
+from collections import OrderedDict
+
+from news_clustering.api.signature_store import news_fingerprint
+from news_clustering.api.similar_texts import news_page_dict_from_info
+
+
+class QueryCache:
+    def __init__(self, max_size=10000, ttl=600.0, *, case_sensitive=False):
+        """
+        LRU cache (with a time to live) of the similar news query results.
+        The key is the fingerprint of the normalized fields that enter the MinHash, not the news URL,
+        so the syndicated copies of a news (under other URLs) hit the same entry.
+        All the entries are dropped when the index generation changes.
+
+        Args:
+            max_size (int):
+                The maximum number of cached results (the least recently used are evicted).
+            ttl (float):
+                After how many seconds a cached result expires.
+            case_sensitive (bool):
+                Are the shingles case-sensitive? If not, the fields are lowercased before fingerprinting.
+        Returns:
+            QueryCache:
+                The initialized (empty) cache
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.case_sensitive = case_sensitive
+
+        self.entries = OrderedDict()  # {key: (expires_at, result)}, from the least to the most recently used
+        self.generation = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def make_key(self, news_info):
+        """
+        Args:
+            news_info (Dict[str, Any]):
+                The news info, of format:
+                    {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+        Returns:
+            str:
+                The cache key.
+        """
+        news_page_dict = news_page_dict_from_info(news_info)
+        if not self.case_sensitive:
+            news_page_dict = {
+                'title': news_page_dict['title'].lower(),
+                'content': news_page_dict['content'].lower(),
+                'contained_urls': {url.lower(): None for url in news_page_dict['contained_urls']},
+            }
+        return news_fingerprint(news_page_dict)
+
+    def __check_generation(self, generation):
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.generation = generation
+
+    def get(self, key, generation):
+        """
+        Args:
+            key (Hashable):
+                The cache key (see make_key()).
+            generation (Any):
+                The current index generation.
+        Returns:
+            Optional[Dict[str, float]]:
+                A copy of the cached result, or None if there is none (or it expired).
+        """
+        self.__check_generation(generation)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self.entries[key]
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    def put(self, key, generation, result):
+        """
+        Caches the result of a query answered on the provided index generation.
+        """
+        self.__check_generation(generation)
+        self.entries[key] = (time.monotonic() + self.ttl, dict(result))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns:
+            Dict[str, Any]:
+                The cache metrics.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'generation': self.generation,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
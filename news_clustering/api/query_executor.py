@@ -0,0 +1,139 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+
+import numpy as np
+
+from news_clustering.api.index_backends import INDEX_BACKENDS
+from news_clustering.api.similar_texts import limit_similar_news
+
+
+class QueryQueueFull(Exception):
+    """
+    Raised when the query executor already has the maximum number of pending hashing jobs.
+    """
+
+
+class QueryExecutor:
+    def __init__(self, similar_texts, *, workers=None, max_pending=32, timeout=10.0, chunk_size=64, cache=None):
+        """
+        Answers the similarity queries without blocking the event loop:
+        the shingles and MinHashes (CPU-bound) are calculated in a bounded process pool,
+        and only the (fast) LSH lookup is done in the event loop's process.
+        In daemonic processes (like the Sanic workers), which can't have children, a thread pool is used instead.
+
+        Args:
+            similar_texts (Union[SimilarTexts, SharedIndex]):
+                The fitted SimilarTexts (or the SharedIndex) that is queried.
+            workers (Optional[int]):
+                The number of hashing processes. If None, the number of CPUs is used.
+            max_pending (int):
+                The maximum number of hashing jobs submitted to the pool and not finished yet.
+                Queries over it are rejected with QueryQueueFull (instead of queueing without bound).
+            timeout (float):
+                After how many seconds a query stops waiting for its MinHashes (asyncio.TimeoutError).
+            chunk_size (int):
+                A batch query is split in jobs of at most this many news, so its hashing is spread on the processes.
+            cache (Optional[QueryCache]):
+                If provided, the cached results are reused, and only the other news are hashed and queried.
+        Returns:
+            QueryExecutor:
+                The initialized executor (the processes are started at the first query)
+        """
+        self.similar_texts = similar_texts
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.cache = cache
+
+        processes = not multiprocessing.current_process().daemon
+        self.pool = similar_texts.create_signature_pool(workers, processes=processes)
+        logging.info(f'Hashing the queries in a {"process" if processes else "thread"} pool')
+        self.pending = 0
+
+    def __job_done(self):
+        self.pending -= 1
+
+    def __on_job_done(self, loop, _):
+        """
+        The done callback of a pool job, called in the thread that finished it (a pool thread, or the result thread
+        of a process pool): the pending counter is only changed in the event loop's thread.
+        """
+        try:
+            loop.call_soon_threadsafe(self.__job_done)
+        except RuntimeError:
+            pass  # The loop is closed (the server is stopping)
+
+    async def calc_signatures(self, news_infos):
+        """
+        Calculates the MinHashes of news infos in the process pool.
+
+        Args:
+            news_infos (List[Dict[str, Any]]):
+                The news infos, of format:
+                    [{'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}]
+        Returns:
+            np.ndarray:
+                The uint64 signature matrix, with a row for each news info.
+        """
+        chunks = [news_infos[start: start + self.chunk_size] for start in range(0, len(news_infos), self.chunk_size)]
+        if self.pending + len(chunks) > self.max_pending:
+            raise QueryQueueFull(f'{self.pending} hashing jobs are already pending (max {self.max_pending})')
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for chunk in chunks:
+            future = self.similar_texts.submit_signatures(self.pool, chunk)
+            self.pending += 1
+            # The pending jobs are counted until they finish in the pool, even if their query timed out before
+            future.add_done_callback(functools.partial(self.__on_job_done, loop))
+            futures.append(asyncio.wrap_future(future))
+
+        try:
+            signature_chunks = await asyncio.wait_for(asyncio.gather(*futures), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f'Hashing {len(news_infos)} news took more than {self.timeout} seconds')
+            raise
+        if not signature_chunks:
+            return np.empty((0, self.similar_texts.num_perm), dtype=np.uint64)
+        return np.concatenate(signature_chunks)
+
+    async def get_similar_news_batch(self, news_infos, *, top_k=None, min_score=None, backend='lsh'):
+        """
+        Same as SimilarTexts.get_similar_news_batch(), with the MinHashes calculated in the process pool.
+        The whole ranked results are cached per index backend, and top_k/min_score are applied on them
+        (for the backends whose candidates depend on top_k, like 'forest', top_k is part of the cache key).
+
+        Raises:
+            QueryQueueFull: If the pool has too many pending jobs.
+            asyncio.TimeoutError: If the MinHashes weren't calculated in time.
+        """
+        if self.cache is None:
+            signatures = await self.calc_signatures(news_infos)
+            return self.similar_texts.get_similar_news_batch(news_infos, signatures=signatures,
+                                                             top_k=top_k, min_score=min_score, backend=backend)
+
+        generation = self.similar_texts.current_generation()
+        candidates_top_k = top_k if INDEX_BACKENDS[backend].top_k_candidates else None
+        keys = [(backend, candidates_top_k, self.cache.make_key(news_info)) for news_info in news_infos]
+        results = [self.cache.get(key, generation) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return [limit_similar_news(result, top_k=top_k, min_score=min_score) for result in results]
+
+        missing_news_infos = [news_infos[i] for i in missing]
+        signatures = await self.calc_signatures(missing_news_infos)
+        missing_results = self.similar_texts.get_similar_news_batch(missing_news_infos, signatures=signatures,
+                                                                    top_k=candidates_top_k, backend=backend)
+
+        # Not cached if the index changed while hashing (the results could be of either generation)
+        cacheable = self.similar_texts.current_generation() == generation
+        for i, result in zip(missing, missing_results):
+            results[i] = result
+            if cacheable:
+                self.cache.put(keys[i], generation, result)
+        return [limit_similar_news(result, top_k=top_k, min_score=min_score) for result in results]
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,97 @@
+import gzip
+import json
+import logging
+import os
+
+from typing import Iterator, Tuple, Dict, Any
+
+JSONL_SUFFIXES = ('.jsonl', '.jsonl.gz', '.jsonl.zst')
+
+
+def is_jsonl_results(results_path):
+    """
+    Args:
+        results_path (str): The path to the crawler results.
+    Returns:
+        bool: True if the results are JSON Lines (a directory of them or a single file), not a results.json.
+    """
+    return os.path.isdir(results_path) or results_path.endswith(JSONL_SUFFIXES)
+
+
+def open_results_file(path):
+    """
+    Opens a (possibly compressed) JSON Lines file for reading, based on its suffix.
+
+    Args:
+        path (str): The file path.
+    Returns:
+        TextIO: The opened file.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        import zstandard  # Optional dependency, only needed for zstd compression
+        return zstandard.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def incomplete_file_errors(path):
+    """
+    Args:
+        path (str): The file path.
+    Returns:
+        Tuple[Type[Exception], ...]: The errors raised when reading a file that ends in the middle of a line
+            or of a compressed block (e.g. the part that the crawler is still writing).
+    """
+    if path.endswith('.zst'):
+        import zstandard  # Optional dependency, only needed for zstd compression
+        return EOFError, json.JSONDecodeError, zstandard.ZstdError
+    return EOFError, json.JSONDecodeError
+
+
+def list_results_files(results_path):
+    """
+    Args:
+        results_path (str): A JSON Lines file, or a directory (searched recursively) of them.
+    Returns:
+        List[str]: The JSON Lines files, sorted by path (so the parts of a source are in order).
+    """
+    if not os.path.isdir(results_path):
+        return [results_path]
+    return sorted(
+        os.path.join(dir_path, file_name)
+        for dir_path, _, file_names in os.walk(results_path)
+        for file_name in file_names
+        if file_name.endswith(JSONL_SUFFIXES)
+    )
+
+
+def iter_jsonl_results(results_path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streams the news written by the crawler's JsonLinesPipeline, without loading everything in memory.
+    If a news URL appears multiple times, the consumer should keep the last one (like a dict update).
+
+    Args:
+        results_path (str):
+            A JSON Lines file, or a directory (searched recursively) of them.
+    Returns:
+        Iterator[Tuple[str, Dict[str, Any]]]:
+            The (news_url, news_page_dict) pairs, of format:
+                (news_url, {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}})
+    """
+    for path in list_results_files(results_path):
+        with open_results_file(path) as fin:
+            try:
+                for line in fin:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    yield item['url'], {
+                        'title': item.get('title') or '',
+                        'content': item.get('content') or '',
+                        'contained_urls': item.get('contained_urls') or dict(),
+                    }
+            except incomplete_file_errors(path):
+                # The part that the crawler is still writing can end in the middle of a line/compressed block,
+                # the news read so far are kept
+                logging.warning(f'Stopped reading the incomplete results file {path}')
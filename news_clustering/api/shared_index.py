@@ -0,0 +1,682 @@
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+from datasketch import MinHashLSH
+
+from news_clustering.api.clustering import UnionFind, find_similar_pairs
+from news_clustering.api.index_backends import create_index
+from news_clustering.api.minhash_engine import MinHashEngine
+from news_clustering.api.signature_matrix import calc_band_keys, estimate_containment, estimate_set_sizes
+from news_clustering.api.signature_store import lean_minhash_from_hashvalues
+from news_clustering.api.similar_texts import ShinglesCalc, calc_signatures, news_page_dict_from_info, \
+    create_signature_pool, submit_signatures, rank_similar_news
+
+CURRENT_FILE = 'CURRENT'
+GENERATION_PREFIX = 'gen-'
+REFRESH_ATTEMPTS = 3  # To attach to the current generation, when the publisher deletes it meanwhile
+DELTA_MAX_RATIO = 0.1  # Over this ratio of the base generation's news, a delta is compacted in a full generation
+DELTA_MIN_NEWS = 10000  # The deltas are never compacted under this number of news
+
+
+def publish_index(similar_texts, index_dir, keep_generations=2):
+    """
+    Publishes the whole SimilarTexts database as a new (full) index generation, see IndexPublisher.publish().
+
+    Returns:
+        str:
+            The name of the published generation.
+    """
+    return IndexPublisher(similar_texts, index_dir, keep_generations=keep_generations).publish()
+
+
+def list_generations(index_dir):
+    """
+    Args:
+        index_dir (str): The index directory.
+    Returns:
+        List[str]: The names of the complete generations, from the oldest to the newest.
+    """
+    return sorted(name for name in os.listdir(index_dir)
+                  if name.startswith(GENERATION_PREFIX) and not name.endswith('.tmp'))
+
+
+def find_band_candidates(band_keys, band_rows, query_band_keys):
+    """
+    Finds the signature rows with at least a band equal to the query's (like MinHashLSH.query()),
+    with binary searches in the sorted band keys.
+
+    Args:
+        band_keys (np.ndarray):
+            For each band, the sorted uint64 band keys, of shape (b, n).
+        band_rows (np.ndarray):
+            For each band, the signature rows of the sorted keys, of shape (b, n).
+        query_band_keys (np.ndarray):
+            The uint64 band keys of the query, of shape (b,).
+    Returns:
+        List[np.ndarray]:
+            The candidate rows in each band with a match (a row can be in several bands).
+    """
+    candidate_rows = []
+    for band, key in enumerate(query_band_keys):
+        keys = band_keys[band]
+        start = np.searchsorted(keys, key, side='left')
+        end = np.searchsorted(keys, key, side='right')
+        if start < end:
+            candidate_rows.append(band_rows[band, start:end])
+    return candidate_rows
+
+
+def take_signatures(rows, signatures, delta_signatures=None):
+    """
+    Args:
+        rows (np.ndarray):
+            The signature rows, the rows after the base generation's ones are in the delta.
+        signatures (np.ndarray):
+            The signature matrix of the base generation.
+        delta_signatures (Optional[np.ndarray]):
+            The signature matrix of the delta, if there is one.
+    Returns:
+        np.ndarray:
+            The signatures of the rows, of shape (len(rows), num_perm).
+    """
+    if delta_signatures is None:
+        return signatures[rows]
+    in_base = rows < len(signatures)
+    row_signatures = np.empty((len(rows), signatures.shape[1]), dtype=np.uint64)
+    row_signatures[in_base] = signatures[rows[in_base]]
+    row_signatures[~in_base] = delta_signatures[rows[~in_base] - len(signatures)]
+    return row_signatures
+
+
+class IndexPublisher:
+    def __init__(self, similar_texts, index_dir, *, keep_generations=2, max_delta_ratio=DELTA_MAX_RATIO,
+                 min_delta_news=DELTA_MIN_NEWS):
+        """
+        Publishes a SimilarTexts database as index generations, that the SharedIndex readers switch to
+        at their next query. There must be only one publisher for an index directory.
+        A full generation has the whole database. After it, the changed news can be published as a delta
+        generation, with only the news changed since the full one (its base), which costs about the size
+        of the delta instead of the size of the database. When the delta gets larger than max_delta_ratio of
+        its base, the next publish is a full generation again (a compaction).
+
+        Layout:
+            index_dir/CURRENT                     The name of the current generation
+            index_dir/gen-000042/meta.json        The news URLs, and the hashing and LSH settings
+            index_dir/gen-000042/signatures.npy   The uint64 signature matrix, of shape (n, num_perm)
+            index_dir/gen-000042/band_keys.npy    For each band, the sorted uint64 band keys, of shape (b, n)
+            index_dir/gen-000042/band_rows.npy    For each band, the signature rows of the sorted keys, of shape (b, n)
+            index_dir/gen-000042/clusters.npy     The cluster of each signature row (the row of its cluster's root)
+        A delta generation has the same files for its news, whose rows follow the base's ones
+        (so clusters.npy has the clusters of the base and delta rows), and:
+            index_dir/gen-000043/meta.json        Also the name of the base generation ('base')
+            index_dir/gen-000043/superseded.npy   The rows of the base whose news were updated in the delta
+
+        Args:
+            similar_texts (SimilarTexts):
+                The SimilarTexts whose database is published.
+            index_dir (str):
+                The index directory.
+            keep_generations (int):
+                How many generations are kept (the older ones are deleted, except the base of the current delta).
+            max_delta_ratio (float):
+                The maximum size of a delta, relative to the size of its base (then, it's compacted).
+            min_delta_news (int):
+                The deltas are never compacted under this number of news (so a small base isn't always rebuilt).
+        Returns:
+            IndexPublisher:
+                The initialized publisher (that didn't publish yet)
+        """
+        if similar_texts.field_weights:
+            raise Exception("The shared index only has the merged signatures, it can't serve the field_weights "
+                            "ranking. Remove field_weights from the server's SimilarTexts parameters.")
+        self.similar_texts = similar_texts
+        self.index_dir = index_dir
+        self.keep_generations = keep_generations
+        self.max_delta_ratio = max_delta_ratio
+        self.min_delta_news = min_delta_news
+
+        lsh = MinHashLSH(threshold=similar_texts.threshold, num_perm=similar_texts.num_perm)  # Same bands as the LSH
+        self.b = lsh.b
+        self.r = lsh.r
+
+        # The last full generation, the deltas are published on it
+        self.base_generation = None
+        self.base_rows = dict()  # {news_url: row}
+        self.signatures = None
+        self.band_keys = None
+        self.band_rows = None
+        self.superseded = None  # For each row of the base, True if its news is updated in the delta
+        # The news changed since the base
+        self.delta_rows = dict()  # {news_url: delta row}
+        self.cluster_labels = None  # The cluster of each row of the base and of the delta
+
+    def publish(self):
+        """
+        Writes the signatures and the LSH band tables of the whole database as a new (full) index generation,
+        and atomically makes it the current one.
+
+        Returns:
+            str:
+                The name of the published generation.
+        """
+        start_time = time.time()
+        similar_texts = self.similar_texts
+        news_urls = list(similar_texts.database.keys())
+        signatures = np.empty((len(news_urls), similar_texts.num_perm), dtype=np.uint64)
+        for row, news_page in enumerate(similar_texts.database.values()):
+            signatures[row] = news_page.hashvalues
+
+        band_keys = calc_band_keys(signatures, self.b, self.r)
+        band_rows = np.argsort(band_keys, axis=1, kind='stable')
+        band_keys = np.take_along_axis(band_keys, band_rows, axis=1)
+
+        clusters = UnionFind()
+        for row in range(len(news_urls)):
+            clusters.add(row)
+        for first_row, second_row in zip(*(rows.tolist() for rows in find_similar_pairs(
+                signatures, b=self.b, r=self.r, threshold=similar_texts.threshold))):
+            clusters.union(first_row, second_row)
+        cluster_labels = np.fromiter((clusters.find(row) for row in range(len(news_urls))),
+                                     dtype=np.int64, count=len(news_urls))
+
+        generation = self.__write_generation({
+            'signatures': signatures,
+            'band_keys': band_keys,
+            'band_rows': band_rows,
+            'clusters': cluster_labels,
+        }, news_urls)
+
+        self.base_generation = generation
+        self.base_rows = {news_url: row for row, news_url in enumerate(news_urls)}
+        generation_dir = os.path.join(self.index_dir, generation)
+        # The published files are memory-mapped, instead of keeping a copy of the arrays
+        self.signatures = np.load(os.path.join(generation_dir, 'signatures.npy'), mmap_mode='r')
+        self.band_keys = np.load(os.path.join(generation_dir, 'band_keys.npy'), mmap_mode='r')
+        self.band_rows = np.load(os.path.join(generation_dir, 'band_rows.npy'), mmap_mode='r')
+        self.superseded = np.zeros(len(news_urls), dtype=bool)
+        self.delta_rows = dict()
+        self.cluster_labels = cluster_labels
+        self.__delete_old_generations()
+
+        logging.info(f'Published the index {generation} with {len(news_urls)} news '
+                     f'in {time.time() - start_time: .3f} seconds')
+        return generation
+
+    def publish_changes(self, news_urls):
+        """
+        Publishes the news of the database that were added or updated since the last publish,
+        as a delta generation on the last full one (or as a full generation, if the delta is too large).
+        The added news are clustered with their similar news. An updated news is clustered again too,
+        but its old version's cluster stays merged with it until the next full generation.
+
+        Args:
+            news_urls (Iterable[str]):
+                The URLs of the added or updated news (that are in the database).
+        Returns:
+            str:
+                The name of the published generation.
+        """
+        news_urls = [news_url for news_url in dict.fromkeys(news_urls) if news_url in self.similar_texts.database]
+        max_delta_news = max(self.min_delta_news, self.max_delta_ratio * len(self.base_rows))
+        if (self.base_generation is None or
+                len(self.delta_rows) + sum(news_url not in self.delta_rows for news_url in news_urls) > max_delta_news):
+            return self.publish()
+
+        start_time = time.time()
+        base_cnt = len(self.base_rows)
+        for news_url in news_urls:
+            if news_url not in self.delta_rows:
+                self.delta_rows[news_url] = len(self.delta_rows)
+                base_row = self.base_rows.get(news_url)
+                if base_row is not None:
+                    self.superseded[base_row] = True
+
+        delta_urls = list(self.delta_rows)
+        delta_signatures = np.empty((len(delta_urls), self.similar_texts.num_perm), dtype=np.uint64)
+        for row, news_url in enumerate(delta_urls):
+            delta_signatures[row] = self.similar_texts.database[news_url].hashvalues
+        query_band_keys = calc_band_keys(delta_signatures, self.b, self.r)
+        delta_band_rows = np.argsort(query_band_keys, axis=1, kind='stable')
+        delta_band_keys = np.take_along_axis(query_band_keys, delta_band_rows, axis=1)
+        delta_band_rows += base_cnt
+
+        # The new rows of the delta are in their own clusters, before being clustered
+        self.cluster_labels = np.concatenate([
+            self.cluster_labels, np.arange(len(self.cluster_labels), base_cnt + len(delta_urls), dtype=np.int64)
+        ])
+        self.__cluster_delta_news([self.delta_rows[news_url] for news_url in news_urls], delta_signatures,
+                                  query_band_keys, delta_band_keys, delta_band_rows)
+
+        generation = self.__write_generation({
+            'signatures': delta_signatures,
+            'band_keys': delta_band_keys,
+            'band_rows': delta_band_rows,
+            'clusters': self.cluster_labels,
+            'superseded': np.flatnonzero(self.superseded),
+        }, delta_urls, base=self.base_generation)
+        self.__delete_old_generations()
+
+        logging.info(f'Published the delta index {generation} with {len(news_urls)} changed news '
+                     f'({len(delta_urls)} since {self.base_generation}) in {time.time() - start_time: .3f} seconds')
+        return generation
+
+    def __cluster_delta_news(self, delta_rows, delta_signatures, query_band_keys, delta_band_keys, delta_band_rows):
+        """
+        Merges the clusters of the changed news of the delta with the clusters of their similar news
+        (found through the band tables of the base and of the delta), in self.cluster_labels.
+
+        Args:
+            delta_rows (List[int]):
+                The delta rows of the changed news.
+            delta_signatures (np.ndarray):
+                The signature matrix of the delta.
+            query_band_keys (np.ndarray):
+                The (unsorted) band keys of the delta, of shape (b, delta size).
+            delta_band_keys (np.ndarray):
+                For each band, the sorted band keys of the delta.
+            delta_band_rows (np.ndarray):
+                For each band, the rows of the sorted band keys of the delta.
+        """
+        base_cnt = len(self.base_rows)
+        min_equal_cnt = self.similar_texts.threshold * self.similar_texts.num_perm
+        label_clusters = UnionFind()  # Of the labels, so all the rows of a merged cluster are relabeled at once
+        for delta_row in delta_rows:
+            row = base_cnt + delta_row
+            candidate_rows = (find_band_candidates(self.band_keys, self.band_rows, query_band_keys[:, delta_row]) +
+                              find_band_candidates(delta_band_keys, delta_band_rows, query_band_keys[:, delta_row]))
+            if not candidate_rows:
+                continue
+            candidate_rows = np.unique(np.concatenate(candidate_rows))
+            is_live = candidate_rows != row
+            in_base = candidate_rows < base_cnt
+            is_live[in_base] &= ~self.superseded[candidate_rows[in_base]]
+            candidate_rows = candidate_rows[is_live]
+            equal_cnt = np.count_nonzero(take_signatures(candidate_rows, self.signatures, delta_signatures) ==
+                                         delta_signatures[delta_row], axis=1)
+            label = self.cluster_labels[row]
+            for similar_label in np.unique(self.cluster_labels[candidate_rows[equal_cnt >= min_equal_cnt]]).tolist():
+                if similar_label != label:
+                    label_clusters.add(label)
+                    label_clusters.add(similar_label)
+                    label_clusters.union(label, similar_label)
+        if not len(label_clusters):
+            return
+
+        old_labels = np.fromiter(label_clusters.parents.keys(), dtype=np.int64, count=len(label_clusters))
+        old_labels.sort()
+        new_labels = np.fromiter((label_clusters.find(label) for label in old_labels.tolist()),
+                                 dtype=np.int64, count=len(old_labels))
+        is_relabeled = np.isin(self.cluster_labels, old_labels)
+        self.cluster_labels[is_relabeled] = new_labels[np.searchsorted(old_labels,
+                                                                       self.cluster_labels[is_relabeled])]
+
+    def __write_generation(self, arrays, news_urls, base=None):
+        """
+        Writes a new generation, and atomically makes it the current one.
+
+        Args:
+            arrays (Dict[str, np.ndarray]):
+                The arrays of the generation, by file name (without the .npy).
+            news_urls (List[str]):
+                The news URLs of the rows of the generation.
+            base (Optional[str]):
+                The base generation, if it's a delta.
+        Returns:
+            str:
+                The name of the generation.
+        """
+        similar_texts = self.similar_texts
+        os.makedirs(self.index_dir, exist_ok=True)
+        generations = list_generations(self.index_dir)
+        last_index = int(generations[-1][len(GENERATION_PREFIX):]) if generations else -1
+        generation = f'{GENERATION_PREFIX}{last_index + 1:06d}'
+
+        # Written in a temporary directory, so a generation directory is always complete
+        tmp_dir = os.path.join(self.index_dir, f'{generation}.tmp')
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+        meta = {
+            'threshold': similar_texts.threshold,
+            'containment_threshold': similar_texts.containment_threshold,
+            'num_perm': similar_texts.num_perm,
+            'b': self.b,
+            'r': self.r,
+            'hashing': {
+                'parameters': similar_texts.shingles_calc.parameters,
+                'shingles_unique': similar_texts.shingles_calc.shingles_unique,
+                'case_sensitive': similar_texts.shingles_calc.case_sensitive,
+                'vectorized_hashing': similar_texts.minhash_engine is not None,
+            },
+            'urls': news_urls,
+        }
+        if base is not None:
+            meta['base'] = base
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as fout:
+            json.dump(meta, fout)
+        os.rename(tmp_dir, os.path.join(self.index_dir, generation))
+
+        current_tmp_path = os.path.join(self.index_dir, f'{CURRENT_FILE}.tmp')
+        with open(current_tmp_path, 'w') as fout:
+            fout.write(generation)
+        os.replace(current_tmp_path, os.path.join(self.index_dir, CURRENT_FILE))
+        return generation
+
+    def __delete_old_generations(self):
+        # The readers still attached to a deleted generation keep their memory maps
+        for old_generation in list_generations(self.index_dir)[:-self.keep_generations]:
+            if old_generation != self.base_generation:
+                shutil.rmtree(os.path.join(self.index_dir, old_generation), ignore_errors=True)
+
+
+class SharedIndex:
+    def __init__(self, index_dir):
+        """
+        Read-only view of the current index generation published by an IndexPublisher.
+        The arrays are memory-mapped, so all the processes (e.g. the server workers) attached to a generation
+        share one copy of it in the page cache, instead of building their own database and LSH.
+        A delta generation is queried with its base (whose files are reused if the base didn't change).
+        Can be queried like a fitted SimilarTexts.
+        The 'lsh' queries use the published band tables, the other index backends are built in the process
+        from the memory-mapped signatures, at their first query on each generation (so they aren't shared).
+
+        Args:
+            index_dir (str):
+                The index directory.
+        Returns:
+            SharedIndex:
+                The index, attached to the current generation
+        """
+        self.index_dir = index_dir
+        self.current_path = os.path.join(index_dir, CURRENT_FILE)
+        self.current_stat = None
+
+        self.generation = None
+        self.base_generation = None
+        self.base_urls = None
+        self.hashing = None
+        self.threshold = None
+        self.containment_threshold = None
+        self.num_perm = None
+        self.b = None
+        self.r = None
+        self.news_urls = None
+        self.signatures = None
+        self.band_keys = None
+        self.band_rows = None
+        self.cluster_labels = None
+        self.delta_signatures = None  # The arrays of the delta, None if the generation is a full one
+        self.delta_band_keys = None
+        self.delta_band_rows = None
+        self.superseded = None  # For each row, True if its news is updated in the delta (None without a delta)
+        self.live_cnt = 0
+        self.news_rows = None
+        self.indexes = dict()  # {backend: index}, the non-'lsh' index backends of the current generation
+        self.shingles_calc = None
+        self.minhash_engine = None
+
+        if not self.refresh():
+            raise Exception(f'There is no published index in {index_dir}')
+
+    def __len__(self):
+        return self.live_cnt
+
+    def refresh(self):
+        """
+        Attaches to the current generation, if it changed since the last call.
+        If the publisher deletes the generation while it's being attached (it's already an old one),
+        CURRENT is read again, and the index stays on its generation if it still can't attach.
+
+        Returns:
+            bool:
+                True if a new generation was attached.
+        """
+        for _ in range(REFRESH_ATTEMPTS):
+            try:
+                return self.__attach_current_generation()
+            except FileNotFoundError as e:
+                self.current_stat = None  # So CURRENT is read again
+                logging.warning(f'The index generation was deleted while attaching to it ({e}), retrying')
+        logging.error(f'Could not attach to the current index generation, staying on {self.generation}')
+        return False
+
+    def __attach_current_generation(self):
+        """
+        Same as refresh(), raising FileNotFoundError if the current generation is deleted meanwhile.
+        """
+        try:
+            stat = os.stat(self.current_path)
+        except FileNotFoundError:
+            return False
+        if self.current_stat is not None and (stat.st_ino, stat.st_mtime_ns) == self.current_stat:
+            return False
+
+        with open(self.current_path, 'r') as fin:
+            generation = fin.read().strip()
+        if generation == self.generation:
+            self.current_stat = (stat.st_ino, stat.st_mtime_ns)
+            return False
+
+        generation_dir = os.path.join(self.index_dir, generation)
+        with open(os.path.join(generation_dir, 'meta.json'), 'r') as fin:
+            meta = json.load(fin)
+        if self.hashing is not None and meta['hashing'] != self.hashing:
+            # The query pools were created with the old settings, their MinHashes wouldn't be comparable
+            logging.error(f'The index {generation} was hashed with other settings, staying on {self.generation}')
+            self.current_stat = (stat.st_ino, stat.st_mtime_ns)
+            return False
+
+        # All the files are opened before switching, so a deleted generation leaves the index on the previous one
+        # (once memory-mapped, the arrays stay readable after their files are deleted)
+        base_generation = meta.get('base', generation)
+        if base_generation == generation:
+            base_urls = meta['urls']
+            signatures, band_keys, band_rows = self.__load_band_tables(generation_dir)
+        elif base_generation == self.base_generation:
+            base_urls = self.base_urls
+            signatures, band_keys, band_rows = self.signatures, self.band_keys, self.band_rows
+        else:
+            base_dir = os.path.join(self.index_dir, base_generation)
+            with open(os.path.join(base_dir, 'meta.json'), 'r') as fin:
+                base_urls = json.load(fin)['urls']
+            signatures, band_keys, band_rows = self.__load_band_tables(base_dir)
+        cluster_labels = np.load(os.path.join(generation_dir, 'clusters.npy'), mmap_mode='r')
+        if base_generation == generation:
+            delta_signatures, delta_band_keys, delta_band_rows = None, None, None
+            superseded = None
+        else:
+            delta_signatures, delta_band_keys, delta_band_rows = self.__load_band_tables(generation_dir)
+            superseded = np.zeros(len(base_urls) + len(meta['urls']), dtype=bool)
+            superseded[np.load(os.path.join(generation_dir, 'superseded.npy'))] = True
+
+        self.signatures = signatures
+        self.band_keys = band_keys
+        self.band_rows = band_rows
+        self.cluster_labels = cluster_labels
+        self.delta_signatures = delta_signatures
+        self.delta_band_keys = delta_band_keys
+        self.delta_band_rows = delta_band_rows
+        self.superseded = superseded
+        self.base_generation = base_generation
+        self.base_urls = base_urls
+        self.current_stat = (stat.st_ino, stat.st_mtime_ns)
+        self.news_urls = base_urls if superseded is None else base_urls + meta['urls']
+        self.live_cnt = len(self.news_urls) - (0 if superseded is None else int(np.count_nonzero(superseded)))
+        self.news_rows = None  # {news_url: row}, created at the first cluster lookup
+        self.indexes = dict()
+        self.threshold = meta['threshold']
+        self.containment_threshold = meta['containment_threshold']
+        self.num_perm = meta['num_perm']
+        self.b = meta['b']
+        self.r = meta['r']
+
+        if self.hashing is None:
+            self.hashing = meta['hashing']
+            hashing = self.hashing
+            self.shingles_calc = ShinglesCalc(
+                parameters={key: [tuple(p) if isinstance(p, list) else p for p in params]
+                            for key, params in hashing['parameters'].items()},
+                shingles_unique=hashing['shingles_unique'],
+                case_sensitive=hashing['case_sensitive'])
+            if hashing['vectorized_hashing']:
+                self.minhash_engine = MinHashEngine(self.shingles_calc, num_perm=self.num_perm)
+
+        self.generation = generation
+        logging.info(f'Attached to the index {generation} with {len(self)} news')
+        return True
+
+    @staticmethod
+    def __load_band_tables(generation_dir):
+        """
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]:
+                The memory-mapped signatures, band keys and band rows of a generation.
+        """
+        return tuple(np.load(os.path.join(generation_dir, f'{name}.npy'), mmap_mode='r')
+                     for name in ('signatures', 'band_keys', 'band_rows'))
+
+    # region SIMILARITY
+    def current_generation(self):
+        """
+        Returns:
+            str:
+                The current generation (refreshed before), the query results can change when it changes.
+        """
+        self.refresh()
+        return self.generation
+
+    def create_signature_pool(self, workers=None, processes=True):
+        """
+        Same as SimilarTexts.create_signature_pool().
+        """
+        return create_signature_pool(self.shingles_calc, self.num_perm, self.minhash_engine, workers, processes)
+
+    @staticmethod
+    def submit_signatures(pool, news_infos):
+        """
+        Same as SimilarTexts.submit_signatures().
+        """
+        return submit_signatures(pool, news_infos)
+
+    def get_similar_news(self, news_url, news_title=None, news_content=None, news_contained_urls=None,
+                         *, top_k=None, min_score=None, backend='lsh'):
+        """
+        Same as SimilarTexts.get_similar_news() (without the exact re-ranking, the shingles aren't in the index).
+        """
+        return self.get_similar_news_batch([{
+            'url': news_url,
+            'title': news_title,
+            'content': news_content,
+            'contained_urls': news_contained_urls,
+        }], top_k=top_k, min_score=min_score, backend=backend)[0]
+
+    def get_similar_news_batch(self, news_infos, *, signatures=None, top_k=None, min_score=None, backend='lsh'):
+        """
+        Same as SimilarTexts.get_similar_news_batch(), on the current generation (refreshed before the query).
+        """
+        self.refresh()
+        if signatures is None:
+            signatures = calc_signatures([news_page_dict_from_info(news_info) for news_info in news_infos],
+                                         self.shingles_calc, self.num_perm, self.minhash_engine)
+
+        if backend != 'lsh':
+            index = self.__get_index(backend)
+            return [self.__query_index(index, signature, top_k=top_k, min_score=min_score)
+                    for signature in signatures]
+        query_band_keys = calc_band_keys(signatures, self.b, self.r)
+        return [self.__query_signature(signature, query_band_keys[:, row], top_k=top_k, min_score=min_score)
+                for row, signature in enumerate(signatures)]
+
+    def __query_signature(self, signature, query_band_keys, top_k=None, min_score=None):
+        """
+        Finds the candidates with at least a band equal to the query's (like MinHashLSH.query()),
+        with binary searches in the sorted band keys (of the base and of the delta),
+        and ranks them by their estimated jaccard similarities.
+        """
+        candidate_rows = find_band_candidates(self.band_keys, self.band_rows, query_band_keys)
+        if self.superseded is not None:
+            candidate_rows += find_band_candidates(self.delta_band_keys, self.delta_band_rows, query_band_keys)
+        if not candidate_rows:
+            return dict()
+
+        candidate_rows = np.unique(np.concatenate(candidate_rows))
+        if self.superseded is not None:
+            candidate_rows = candidate_rows[~self.superseded[candidate_rows]]
+        candidate_signatures = take_signatures(candidate_rows, self.signatures, self.delta_signatures)
+        similarities = np.count_nonzero(candidate_signatures == signature, axis=1) / self.num_perm
+        return rank_similar_news([self.news_urls[row] for row in candidate_rows], similarities,
+                                 top_k=top_k, min_score=min_score)
+
+    def __get_index(self, backend):
+        """
+        Returns:
+            Union[LSHIndex, ForestIndex, EnsembleIndex]:
+                The index of the backend on the current generation (keyed by signature row), built if needed.
+        """
+        index = self.indexes.get(backend)
+        if index is None:
+            logging.info(f'Started building the {backend} index of {self.generation}')
+            start_time = time.time()
+            index = create_index(backend, threshold=self.threshold, num_perm=self.num_perm,
+                                 containment_threshold=self.containment_threshold)
+            index.build((row, lean_minhash_from_hashvalues(signature)) for row, signature in self.__iter_signatures())
+            self.indexes[backend] = index
+            logging.info(f'It took {time.time() - start_time: .3f} seconds to build the {backend} index.')
+        return index
+
+    def __iter_signatures(self):
+        """
+        Returns:
+            Iterator[Tuple[int, np.ndarray]]:
+                The (row, signature) of the current news (of the base and of the delta, without the superseded ones).
+        """
+        if self.superseded is None:
+            return enumerate(self.signatures)
+        return ((row, signature) for row, signature in enumerate(itertools.chain(self.signatures,
+                                                                                 self.delta_signatures))
+                if not self.superseded[row])
+
+    def __query_index(self, index, signature, top_k=None, min_score=None):
+        """
+        Same as SimilarTexts.__query_news_page(), with an index keyed by signature row.
+        """
+        if top_k is None:
+            top_k = index.default_top_k
+        candidate_rows = np.array(index.query(lean_minhash_from_hashvalues(signature), top_k=top_k), dtype=np.intp)
+        if not len(candidate_rows):
+            return dict()
+
+        candidate_signatures = take_signatures(candidate_rows, self.signatures, self.delta_signatures)
+        similarities = np.count_nonzero(candidate_signatures == signature, axis=1) / self.num_perm
+        if index.containment:
+            similarities = estimate_containment(similarities, estimate_set_sizes(signature),
+                                                estimate_set_sizes(candidate_signatures))
+        return rank_similar_news([self.news_urls[row] for row in candidate_rows], similarities,
+                                 top_k=top_k, min_score=min_score)
+
+    # endregion SIMILARITY
+
+    # region CLUSTERING
+    def get_cluster(self, news_url):
+        """
+        Same as SimilarTexts.get_cluster(), on the clusters of the current generation.
+        """
+        self.refresh()
+        if self.news_rows is None:
+            self.news_rows = {url: row for row, url in enumerate(self.news_urls)}
+        row = self.news_rows.get(news_url)
+        if row is None:
+            return None
+        is_member = self.cluster_labels == self.cluster_labels[row]
+        if self.superseded is not None:
+            is_member &= ~self.superseded
+        member_rows = np.flatnonzero(is_member)
+        return [self.news_urls[member_row] for member_row in member_rows]
+
+    # endregion CLUSTERING
+
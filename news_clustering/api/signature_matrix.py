@@ -0,0 +1,162 @@
+import numpy as np
+from datasketch.minhash import _max_hash
+
+_BAND_HASH_SEED = np.uint64(0xcbf29ce484222325)
+_BAND_HASH_PRIME = np.uint64(0x100000001b3)
+
+
+def calc_band_keys(signatures, b, r):
+    """
+    Hashes the LSH bands of the signatures (like the MinHashLSH hash tables, one 64 bits key per band).
+
+    Args:
+        signatures (np.ndarray): The uint64 signature matrix, of shape (n, num_perm).
+        b (int): The number of bands.
+        r (int): The number of rows (hash values) per band.
+    Returns:
+        np.ndarray: The uint64 band keys, of shape (b, n).
+    """
+    band_keys = np.empty((b, len(signatures)), dtype=np.uint64)
+    for band in range(b):
+        keys = np.full(len(signatures), _BAND_HASH_SEED, dtype=np.uint64)
+        for column in signatures[:, band * r: (band + 1) * r].T:
+            keys ^= column
+            keys *= _BAND_HASH_PRIME
+        band_keys[band] = keys
+    return band_keys
+
+
+def estimate_set_sizes(signatures):
+    """
+    Estimates the number of (unique) shingles hashed in MinHashes, like MinHash.count(), for many at once.
+
+    Args:
+        signatures (np.ndarray): The uint64 hash values, of shape (num_perm,) or (n, num_perm).
+    Returns:
+        Union[float, np.ndarray]: The estimated set sizes (one per signature).
+    """
+    return signatures.shape[-1] / np.sum(signatures / float(_max_hash), axis=-1) - 1.0
+
+
+def estimate_containment(jaccard, query_size, sizes):
+    """
+    Estimates how much of a query set is contained in other sets, from their jaccard similarities and set sizes:
+    |Q & X| = J * (|Q| + |X|) / (1 + J), and the containment is |Q & X| / |Q|.
+
+    Args:
+        jaccard (np.ndarray): The jaccard similarities between the query and the other sets.
+        query_size (float): The size of the query set.
+        sizes (np.ndarray): The sizes of the other sets.
+    Returns:
+        np.ndarray: The float64 containments, between [0, 1].
+    """
+    return np.minimum(jaccard * (query_size + sizes) / ((1.0 + jaccard) * max(query_size, 1.0)), 1.0)
+
+
+class SignatureMatrix:
+    def __init__(self, num_perm, capacity=1024):
+        """
+        The MinHash signatures of the indexed news, as the rows of one uint64 matrix,
+        so the jaccard similarities of many news are estimated with one NumPy comparison.
+        The rows of the removed news are reused, the other rows don't move (until the matrix grows).
+
+        Args:
+            num_perm (int):
+                The number of permutations for a MinHash (the number of columns).
+            capacity (int):
+                The initial number of rows.
+        Returns:
+            SignatureMatrix:
+                The initialized (empty) matrix
+        """
+        self.num_perm = num_perm
+        self.matrix = np.empty((capacity, num_perm), dtype=np.uint64)
+        self.rows = dict()  # {news_url: row}
+        self.free_rows = []
+        self.used_rows_cnt = 0  # The rows [0, used_rows_cnt) were used at least once
+
+    @classmethod
+    def from_database(cls, database, num_perm):
+        """
+        Args:
+            database (Dict[str, NewsPage]):
+                The news pages, with the news URLs as keys.
+            num_perm (int):
+                The number of permutations for a MinHash.
+        Returns:
+            SignatureMatrix:
+                The matrix with the signatures of all the news pages.
+        """
+        signature_matrix = cls(num_perm, capacity=max(len(database), 1024))
+        for news_url, news_page in database.items():
+            signature_matrix.set(news_url, news_page.hashvalues)
+        return signature_matrix
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, news_url):
+        return news_url in self.rows
+
+    def set(self, news_url, hashvalues):
+        """
+        Adds the signature of a news, or replaces it if the news is already in the matrix.
+        """
+        row = self.rows.get(news_url)
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                if self.used_rows_cnt == len(self.matrix):
+                    self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+                row = self.used_rows_cnt
+                self.used_rows_cnt += 1
+            self.rows[news_url] = row
+        self.matrix[row] = hashvalues
+
+    def remove(self, news_url):
+        row = self.rows.pop(news_url, None)
+        if row is not None:
+            self.free_rows.append(row)
+
+    def get_rows(self, news_urls):
+        """
+        Args:
+            news_urls (List[str]): The news URLs (they must be in the matrix).
+        Returns:
+            np.ndarray: The uint64 signatures of the news, of shape (len(news_urls), num_perm).
+        """
+        rows = np.fromiter((self.rows[news_url] for news_url in news_urls), dtype=np.intp, count=len(news_urls))
+        return self.matrix[rows]
+
+    def jaccard(self, news_urls, hashvalues):
+        """
+        Estimates the jaccard similarities between a signature and the signatures of some news in the matrix.
+
+        Args:
+            news_urls (List[str]):
+                The news URLs (they must be in the matrix).
+            hashvalues (np.ndarray):
+                The uint64 hash values of the other MinHash.
+        Returns:
+            np.ndarray:
+                The float64 jaccard similarity estimates, in the same order as the news URLs.
+        """
+        return np.count_nonzero(self.get_rows(news_urls) == hashvalues, axis=1) / self.num_perm
+
+    def containment(self, news_urls, hashvalues):
+        """
+        Estimates how much of a set (the query) is contained in the sets of some news in the matrix.
+
+        Args:
+            news_urls (List[str]):
+                The news URLs (they must be in the matrix).
+            hashvalues (np.ndarray):
+                The uint64 hash values of the query MinHash.
+        Returns:
+            np.ndarray:
+                The float64 containment estimates, in the same order as the news URLs.
+        """
+        signatures = self.get_rows(news_urls)
+        jaccard = np.count_nonzero(signatures == hashvalues, axis=1) / self.num_perm
+        return estimate_containment(jaccard, estimate_set_sizes(hashvalues), estimate_set_sizes(signatures))
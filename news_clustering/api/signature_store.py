@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+from datasketch import LeanMinHash
+from typing import Dict, List, Optional
+
+MINHASH_SEED = 1  # The default seed used by datasketch's MinHash
+
+
+def news_fingerprint(news_page_dict):
+    """
+    Calculates a fingerprint of the news page fields that enter the MinHash.
+    Only the contained URLs themselves are shingled, so their titles don't change the fingerprint.
+
+    Args:
+        news_page_dict (Dict[str, Any]):
+            The news page dict, of format:
+                {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+    Returns:
+        str:
+            The hex fingerprint.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(news_page_dict['title'].encode('utf-8'))
+    h.update(b'\0')
+    h.update(news_page_dict['content'].encode('utf-8'))
+    h.update(b'\0')
+    h.update('\0'.join(news_page_dict['contained_urls'].keys()).encode('utf-8'))
+    return h.hexdigest()
+
+
+def field_fingerprint(text):
+    """
+    Args:
+        text (str): The text of a news page field, as it's shingled.
+    Returns:
+        str: The hex fingerprint of the field.
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def lean_minhash_from_hashvalues(hashvalues, seed=MINHASH_SEED):
+    """
+    Creates a `LeanMinHash <https://ekzhu.com/datasketch/documentation.html#datasketch.LeanMinHash>`_
+    that uses the provided hash values array as is (without copying it, so it can be a memory-mapped row).
+
+    Args:
+        hashvalues (np.ndarray):
+            The uint64 hash values.
+        seed (int):
+            The seed used when calculating the hash values.
+    Returns:
+        LeanMinHash:
+            The LeanMinHash viewing the hash values.
+    """
+    lean_minhash = LeanMinHash.__new__(LeanMinHash)
+    lean_minhash.seed = seed
+    lean_minhash.hashvalues = hashvalues
+    return lean_minhash
+
+
+class SignatureStore:
+    def __init__(self, store_dir, parameters, num_perm, *, shingles_unique=True, case_sensitive=False,
+                 vectorized_hashing=False, fields=None):
+        """
+        On-disk store of the news MinHash signatures, so they don't have to be recalculated at every start.
+        The signatures are kept in a memory-mapped uint64 matrix (one row per news), next to a JSON index
+        with the news URLs and the fingerprints of the content that was hashed.
+        With fields, the per-field signatures of a news are stored side by side (a (len(fields), num_perm) row),
+        with a fingerprint per field, so only the changed fields are rehashed.
+
+        Args:
+            store_dir (str):
+                The directory where the store files are kept.
+            parameters (Dict[str, list]):
+                The shingling parameters the signatures were calculated with.
+            num_perm (int):
+                The number of permutations for a MinHash.
+            shingles_unique (bool):
+                Are the shingles unique?
+            case_sensitive (bool):
+                Are the shingles case-sensitive?
+            vectorized_hashing (bool):
+                Were the signatures calculated by the MinHashEngine?
+            fields (Optional[List[str]]):
+                If provided, the per-field signatures of these fields are stored, instead of the merged ones.
+        Returns:
+            SignatureStore:
+                The initialized (but not loaded) store
+        """
+        self.store_dir = store_dir
+        self.num_perm = num_perm
+        self.fields = list(fields) if fields else None
+        config = dict(parameters=parameters,
+                      num_perm=num_perm,
+                      shingles_unique=shingles_unique,
+                      case_sensitive=case_sensitive,
+                      vectorized_hashing=vectorized_hashing)
+        if self.fields:
+            config['fields'] = self.fields  # Not added otherwise, so the existing merged stores keep their key
+        self.key = self.calc_store_key(**config)
+        self.row_shape = (len(self.fields), num_perm) if self.fields else (num_perm,)
+
+        self.matrix_path = os.path.join(store_dir, f'signatures-{self.key}.npy')
+        self.index_path = os.path.join(store_dir, f'signatures-{self.key}.json')
+
+        self.signatures: Optional[np.ndarray] = None
+        self.rows: Dict[str, int] = dict()
+        self.fingerprints: Dict[str, str] = dict()
+        self.field_fingerprints: Dict[str, List[str]] = dict()
+
+    @staticmethod
+    def calc_store_key(**config):
+        """
+        Calculates the key of a store, so signatures calculated with other settings are never mixed.
+
+        Args:
+            **config:
+                The settings the signatures depend on.
+        Returns:
+            str:
+                The store key.
+        """
+        config_str = json.dumps(config, sort_keys=True, default=list)
+        return hashlib.blake2b(config_str.encode('utf-8'), digest_size=8).hexdigest()
+
+    def load(self):
+        """
+        Memory-maps the stored signatures, if there are any.
+
+        Returns:
+            bool:
+                True if the store was found and loaded.
+        """
+        if not os.path.exists(self.matrix_path) or not os.path.exists(self.index_path):
+            return False
+
+        with open(self.index_path, 'r') as fin:
+            index = json.load(fin)
+        signatures = np.load(self.matrix_path, mmap_mode='r')
+
+        if (index.get('key') != self.key or
+                signatures.shape != (len(index['urls']), *self.row_shape)):
+            logging.warning(f'Ignoring the inconsistent signature store at {self.matrix_path}')
+            return False
+
+        self.signatures = signatures
+        self.rows = {news_url: row for row, news_url in enumerate(index['urls'])}
+        self.fingerprints = dict(zip(index['urls'], index['fingerprints']))
+        if self.fields:
+            self.field_fingerprints = dict(zip(index['urls'], index['field_fingerprints']))
+        logging.info(f'Loaded {len(self.rows)} signatures from {self.matrix_path}')
+        return True
+
+    def get_minhash(self, news_url, fingerprint):
+        """
+        Gets the stored signature of a news, if the content it was calculated from didn't change.
+
+        Args:
+            news_url (str):
+                The news website URL.
+            fingerprint (str):
+                The fingerprint of the current news content.
+        Returns:
+            Optional[LeanMinHash]:
+                The stored LeanMinHash (viewing the memory-mapped row), or None if it needs to be recalculated.
+        """
+        row = self.rows.get(news_url)
+        if row is None or self.fingerprints[news_url] != fingerprint:
+            return None
+        return lean_minhash_from_hashvalues(self.signatures[row])
+
+    def get_field_hashvalues(self, news_url, field_fingerprints):
+        """
+        Gets the stored per-field signatures of a news, and which fields didn't change since they were calculated.
+
+        Args:
+            news_url (str):
+                The news website URL.
+            field_fingerprints (List[str]):
+                The fingerprints of the current fields of the news (in the order of the store's fields).
+        Returns:
+            Optional[Tuple[np.ndarray, List[bool]]]:
+                The stored (memory-mapped) field signatures and, for each field, True if its signature can be reused.
+                None if the news isn't stored.
+        """
+        row = self.rows.get(news_url)
+        if row is None:
+            return None
+        return self.signatures[row], [stored == current for stored, current in
+                                      zip(self.field_fingerprints[news_url], field_fingerprints)]
+
+    def save(self, news_pages):
+        """
+        Writes the signatures of the provided news pages, replacing the stored ones.
+        The files are written next to the old ones and then atomically moved over them.
+
+        Args:
+            news_pages (Dict[str, NewsPage]):
+                The news pages to store, by news URL.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        urls = list(news_pages.keys())
+
+        tmp_matrix_path = self.matrix_path + '.tmp.npy'
+        signatures = np.lib.format.open_memmap(tmp_matrix_path, mode='w+', dtype=np.uint64,
+                                               shape=(len(urls), *self.row_shape))
+        for row, news_url in enumerate(urls):
+            if self.fields:
+                signatures[row] = news_pages[news_url].field_hashvalues
+            else:
+                signatures[row] = news_pages[news_url].hashvalues
+        signatures.flush()
+        del signatures
+
+        index = {
+            'key': self.key,
+            'urls': urls,
+            'fingerprints': [news_pages[news_url].fingerprint for news_url in urls],
+        }
+        if self.fields:
+            index['field_fingerprints'] = [news_pages[news_url].field_fingerprints for news_url in urls]
+        tmp_index_path = self.index_path + '.tmp'
+        with open(tmp_index_path, 'w') as fout:
+            json.dump(index, fout)
+
+        os.replace(tmp_matrix_path, self.matrix_path)
+        os.replace(tmp_index_path, self.index_path)
+        logging.info(f'Saved {len(urls)} signatures to {self.matrix_path}')
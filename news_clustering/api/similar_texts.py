@@ -1,13 +1,29 @@
+import itertools
 import json
 import logging
+import os
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-from datasketch import MinHash, MinHashLSH, LeanMinHash
+import numpy as np
+from datasketch import MinHash, LeanMinHash
+from datasketch.minhash import _max_hash
 from typing import Tuple, List, Dict, Any
 
+from news_clustering.api.clustering import UnionFind, find_similar_pairs
+from news_clustering.api.index_backends import INDEX_BACKENDS, create_index
+from news_clustering.api.minhash_engine import MinHashEngine
+from news_clustering.api.results_reader import is_jsonl_results, iter_jsonl_results
+from news_clustering.api.signature_matrix import SignatureMatrix
+from news_clustering.api.signature_store import SignatureStore, news_fingerprint, field_fingerprint, \
+    lean_minhash_from_hashvalues
+from news_clustering.api.text_store import TextStore, TextRef
+
 words_regex = re.compile(r'\W+')
 
+SHINGLES_CHUNK_SIZE = 1024  # The shingles hashed at once, bounds the (chunk, num_perm) matrix of MinHash.update_batch
+
 
 class ShinglesCalc:
     def __init__(self, parameters, *, shingles_unique=True, case_sensitive=False):
@@ -31,9 +47,33 @@ class ShinglesCalc:
         self.shingles_unique = shingles_unique
         self.case_sensitive = case_sensitive
 
+    def iter_shingles(self, str_dict_to_shingle):
+        """
+        Generates all the shingles using the parameters the class was initialized with,
+        without sorting them and without removing the duplicates (a MinHash depends on neither).
+
+        Args:
+            str_dict_to_shingle (Dict[str, str]):
+                The news page dict, of format:
+                    {'title': STR, 'content': STR, 'contained_urls': URLS_COMBINED_STR}
+        Returns:
+            Iterator[str]: The shingles.
+        """
+        for key, text in str_dict_to_shingle.items():
+            if not self.case_sensitive:
+                text = text.lower()
+            for param in self.parameters[key]:
+                if param == 'WORDS':
+                    yield from filter(None, words_regex.split(text))
+                elif isinstance(param, tuple):
+                    for shingle_length in range(param[0], param[1] + 1):
+                        for start in range(len(text) - shingle_length + 1):
+                            yield text[start: start + shingle_length]
+
     def create_all_shingles(self, str_dict_to_shingle):
         """
-        Calculates all the shingles using the parameters the class was initialized with.
+        Calculates all the shingles using the parameters the class was initialized with, as a sorted list.
+        Only used for debugging (keep_shingles), the MinHashes are calculated from iter_shingles().
 
         Args:
             str_dict_to_shingle (Dict[str, str]):
@@ -125,9 +165,17 @@ class ShinglesCalc:
 
 
 class NewsPage:
-    def __init__(self, news_url, news_page_dict, shingles_calc, *, num_perm=128):
+    # No __dict__ per news page, there is one for every news of the database
+    __slots__ = ('news_url', 'num_perm', 'fingerprint', 'hashvalues', 'field_hashvalues', 'field_fingerprints',
+                 'shingle_list', 'texts')
+
+    def __init__(self, news_url, news_page_dict, shingles_calc, *, num_perm=128, minhash=None, fingerprint=None,
+                 minhash_engine=None, field_hashvalues=None, field_fingerprints=None, keep_shingles=False,
+                 keep_texts=True, texts=None):
         """
         Calculates the MinHash for the news page.
+        Only its hash values are kept (the MinHash is a view of them), which SimilarTexts points to a row
+        of its shared signature matrix once the news page is indexed.
 
         Args:
             news_url (str):
@@ -139,42 +187,98 @@ class NewsPage:
                 The initialized ShinglesCalc object.
             num_perm (int):
                 The number of permutations for a MinHash.
+            minhash (Optional[LeanMinHash]):
+                An already calculated MinHash for this news page (e.g. from a SignatureStore).
+                If provided, the shingles aren't calculated anymore.
+            fingerprint (Optional[Union[str, bool]]):
+                The already calculated fingerprint of the news page dict.
+                If None, it's calculated. If False, it isn't (e.g. for a signature that isn't stored).
+            minhash_engine (Optional[MinHashEngine]):
+                If provided, the MinHash is calculated by this vectorized engine,
+                without creating the shingle list.
+            field_hashvalues (Optional[np.ndarray]):
+                The already calculated uint64 MinHash hash values of each field, of shape (fields, num_perm).
+                If provided (and not the minhash), the MinHash is their element-wise minimum.
+            field_fingerprints (Optional[List[str]]):
+                The fingerprints of the fields the field_hashvalues were calculated from.
+            keep_shingles (bool):
+                Should the sorted shingle list be created and kept (for debugging)?
+                If not, the shingles are hashed as they are generated. Ignored when the minhash is provided.
+            keep_texts (bool):
+                Should the title, content and contained URLs be kept (they are needed for the exact similarities)?
+            texts (Optional[TextRef]):
+                If provided, the reference to the texts stored in a TextStore, kept instead of the texts.
         Returns:
             NewsPage:
                 The initialized news page class
         """
-
-        self.title = news_page_dict['title']
-        self.content = news_page_dict['content']
-        self.contained_urls = news_page_dict['contained_urls']
+        self.texts = texts
+        if texts is None and keep_texts:
+            self.texts = (news_page_dict['title'], news_page_dict['content'], news_page_dict['contained_urls'])
 
         self.news_url = news_url
         self.num_perm = num_perm
-
-        self.shingle_list = shingles_calc.create_all_shingles(str_dict_to_shingle={
+        if fingerprint is None:
+            fingerprint = news_fingerprint(news_page_dict)
+        self.fingerprint = fingerprint or None
+        self.field_hashvalues = field_hashvalues
+        self.field_fingerprints = field_fingerprints
+
+        self.shingle_list = None
+        if minhash is not None:
+            self.hashvalues = minhash.hashvalues
+            return
+        if field_hashvalues is not None:
+            # The MinHash of the union of the fields' shingles
+            self.hashvalues = field_hashvalues.min(axis=0)
+            return
+
+        str_dict_to_shingle = {
             **news_page_dict,
             'contained_urls': ''.join(news_page_dict['contained_urls'].keys())
-        })
-        self.minhash = self.__calc_minhash(shingle_list=self.shingle_list)
-
-    def __calc_minhash(self, shingle_list):
+        }
+        if keep_shingles:
+            self.shingle_list = shingles_calc.create_all_shingles(str_dict_to_shingle=str_dict_to_shingle)
+
+        if minhash_engine is not None:
+            minhash = minhash_engine.calc_minhash(str_dict_to_shingle)
+        elif self.shingle_list is not None:
+            minhash = calc_minhash(self.shingle_list, num_perm=self.num_perm)
+        else:
+            minhash = calc_minhash(shingles_calc.iter_shingles(str_dict_to_shingle), num_perm=self.num_perm)
+        self.hashvalues = minhash.hashvalues
+
+    @property
+    def minhash(self):
+        """
+        Returns:
+            LeanMinHash: The MinHash of the news page, viewing its hash values.
         """
-        Calculate the `MinHash <https://ekzhu.com/datasketch/minhash.html>`_
-        for the provided key/shingles.
-        Usually, you'd want to convert to a `LeanMinHash
-        <https://ekzhu.com/datasketch/documentation.html#datasketch.LeanMinHash>`_.
+        return lean_minhash_from_hashvalues(self.hashvalues)
 
-        Args:
-            shingle_list (List[str]):
-                The shingles to calculate the MinHash for.
+    @property
+    def title(self):
+        return self.get_texts()[0]
+
+    @property
+    def content(self):
+        return self.get_texts()[1]
+
+    @property
+    def contained_urls(self):
+        return self.get_texts()[2]
 
+    def get_texts(self):
+        """
         Returns:
-            LeanMinHash:
-                The LeanMinHash corresponding to the provided input.
+            Tuple[str, str, Dict[str, str]]:
+                The (title, content, contained_urls) of the news page (read from the TextStore, if they are stored).
         """
-        m = MinHash(num_perm=self.num_perm)
-        m.update_batch([s.encode('utf-8') for s in shingle_list])
-        return LeanMinHash(m)
+        if self.texts is None:
+            raise Exception(f'The texts of the news page {self.news_url} were not kept')
+        if isinstance(self.texts, TextRef):
+            return self.texts.load()
+        return self.texts
 
     def jaccard(self, other):
         """Estimate the `Jaccard similarity`_ (resemblance) between the sets
@@ -188,10 +292,368 @@ class NewsPage:
         """
         return self.minhash.jaccard(other.minhash)
 
+    def get_shingle_set(self, shingles_calc):
+        """
+        Args:
+            shingles_calc (ShinglesCalc): The ShinglesCalc the news page was hashed with.
+        Returns:
+            Set[str]: The shingles of the news page (recalculated, if the shingle list wasn't kept).
+        """
+        if self.shingle_list is not None:
+            return set(self.shingle_list)
+        title, content, contained_urls = self.get_texts()
+        return set(shingles_calc.iter_shingles({
+            'title': title,
+            'content': content,
+            'contained_urls': ''.join(contained_urls.keys()),
+        }))
+
+    def exact_jaccard(self, other, shingles_calc):
+        """
+        Calculates the exact `Jaccard similarity`_ between the shingle sets of this NewsPage and the other
+        (instead of estimating it from the MinHashes).
+
+        Args:
+            other (NewsPage): The other NewsPage.
+            shingles_calc (ShinglesCalc): The ShinglesCalc both news pages were hashed with.
+        Returns:
+            float: The Jaccard similarity, which is between 0.0 and 1.0.
+        """
+        shingles = self.get_shingle_set(shingles_calc)
+        other_shingles = other.get_shingle_set(shingles_calc)
+        union_len = len(shingles | other_shingles)
+        return len(shingles & other_shingles) / union_len if union_len else 1.0
+
+    def exact_containment(self, other, shingles_calc):
+        """
+        Calculates the exact fraction of the shingles of this NewsPage that are also in the other's.
+
+        Args:
+            other (NewsPage): The other NewsPage.
+            shingles_calc (ShinglesCalc): The ShinglesCalc both news pages were hashed with.
+        Returns:
+            float: The containment, which is between 0.0 and 1.0.
+        """
+        shingles = self.get_shingle_set(shingles_calc)
+        return len(shingles & other.get_shingle_set(shingles_calc)) / len(shingles) if shingles else 1.0
+
+
+def calc_minhash(shingles, num_perm):
+    """
+    Calculate the `MinHash <https://ekzhu.com/datasketch/minhash.html>`_
+    for the provided shingles, as a `LeanMinHash
+    <https://ekzhu.com/datasketch/documentation.html#datasketch.LeanMinHash>`_.
+    The shingles are hashed in chunks while they are generated, so neither a list of all of them,
+    nor the matrix of all their permuted hashes is created.
+
+    Args:
+        shingles (Iterable[str]):
+            The shingles to calculate the MinHash for (in any order, duplicates included).
+        num_perm (int):
+            The number of permutations for a MinHash.
+    Returns:
+        LeanMinHash:
+            The LeanMinHash corresponding to the provided input.
+    """
+    m = MinHash(num_perm=num_perm)
+    shingles = iter(shingles)
+    while True:
+        chunk = [s.encode('utf-8') for s in itertools.islice(shingles, SHINGLES_CHUNK_SIZE)]
+        if not chunk:
+            break
+        m.update_batch(chunk)
+    return LeanMinHash(m)
+
+
+def is_empty_signature(hashvalues):
+    """
+    Args:
+        hashvalues (np.ndarray): The uint64 MinHash hash values.
+    Returns:
+        bool: True if they're the ones of an empty set (e.g. of an empty field).
+    """
+    return bool(np.all(hashvalues == _max_hash))
+
+
+def rank_similar_news(news_urls, similarities, top_k=None, min_score=None):
+    """
+    Args:
+        news_urls (List[str]):
+            The similar news URLs.
+        similarities (np.ndarray):
+            Their jaccard similarities.
+        top_k (Optional[int]):
+            If provided, only the top_k most similar news are kept.
+        min_score (Optional[float]):
+            If provided, only the news with the similarity at least min_score are kept.
+    Returns:
+        Dict[str, float]:
+            The similar news URLs with their similarities, from the most to the least similar.
+    """
+    indexes = np.arange(len(news_urls))
+    if min_score is not None:
+        indexes = indexes[similarities >= min_score]
+    if top_k is not None and top_k < len(indexes):
+        # Only the top_k are sorted, so the large candidate sets (popular topics) are cheap
+        indexes = indexes[np.argpartition(-similarities[indexes], top_k - 1)[:top_k]]
+    indexes = indexes[np.argsort(-similarities[indexes], kind='stable')]
+    return {news_urls[i]: float(similarities[i]) for i in indexes}
+
+
+def limit_similar_news(similar_news, top_k=None, min_score=None):
+    """
+    Args:
+        similar_news (Dict[str, float]):
+            The similar news, ranked by rank_similar_news().
+        top_k (Optional[int]):
+            If provided, only the top_k most similar news are kept.
+        min_score (Optional[float]):
+            If provided, only the news with the similarity at least min_score are kept.
+    Returns:
+        Dict[str, float]:
+            The kept similar news, in the same order.
+    """
+    ranked = ((news_url, score) for news_url, score in similar_news.items()
+              if min_score is None or score >= min_score)
+    return dict(itertools.islice(ranked, top_k))
+
+
+# region SIGNATURE WORKERS
+_worker_shingles_calc = None
+_worker_num_perm = None
+_worker_minhash_engine = None
+_worker_fields = None
+
+
+def _init_signature_worker(shingles_calc, num_perm, minhash_engine, fields=None):
+    """
+    Initializes a process of the indexing pool, so the hashing settings are sent only once per process.
+    """
+    global _worker_shingles_calc, _worker_num_perm, _worker_minhash_engine, _worker_fields
+    _worker_shingles_calc = shingles_calc
+    _worker_num_perm = num_perm
+    _worker_minhash_engine = minhash_engine
+    _worker_fields = fields
+
+
+def _calc_signatures(news_page_dicts):
+    """
+    Calculates the MinHashes of a chunk of news, in a process of the indexing (or query) pool.
+
+    Args:
+        news_page_dicts (List[Dict[str, Any]]):
+            The news page dicts, of format:
+                {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+    Returns:
+        np.ndarray:
+            The uint64 signature matrix, with a row for each news (instead of pickling whole NewsPage objects back).
+    """
+    return calc_signatures(news_page_dicts, _worker_shingles_calc, _worker_num_perm, _worker_minhash_engine)
+
+
+def _calc_field_signatures(field_texts):
+    """
+    Calculates the MinHashes of news page fields, with the settings of the worker (see calc_field_signatures()).
+    """
+    return calc_field_signatures(field_texts, _worker_shingles_calc, _worker_num_perm, _worker_minhash_engine)
+
+
+def _calc_news_field_signatures(news_page_dicts):
+    """
+    Calculates the per-field MinHashes of a chunk of news, in a process of a pool created with fields.
+
+    Returns:
+        np.ndarray:
+            The uint64 field signatures, of shape (len(news_page_dicts), len(fields), num_perm).
+    """
+    return calc_news_field_signatures(news_page_dicts, _worker_fields, _worker_shingles_calc, _worker_num_perm,
+                                      _worker_minhash_engine)
+
+
+def calc_signatures(news_page_dicts, shingles_calc, num_perm, minhash_engine=None):
+    """
+    Calculates the MinHashes of multiple news, in one vectorized pass if there is a MinHashEngine.
+
+    Args:
+        news_page_dicts (List[Dict[str, Any]]):
+            The news page dicts, of format:
+                {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+        shingles_calc (ShinglesCalc):
+            The initialized ShinglesCalc object.
+        num_perm (int):
+            The number of permutations for a MinHash.
+        minhash_engine (Optional[MinHashEngine]):
+            The vectorized engine, if the MinHashes are calculated with it.
+    Returns:
+        np.ndarray:
+            The uint64 signature matrix, with a row for each news.
+    """
+    if minhash_engine is not None:
+        return minhash_engine.calc_hashvalues_batch([
+            {**news_page_dict, 'contained_urls': ''.join(news_page_dict['contained_urls'].keys())}
+            for news_page_dict in news_page_dicts
+        ])
+
+    signatures = np.empty((len(news_page_dicts), num_perm), dtype=np.uint64)
+    for row, news_page_dict in enumerate(news_page_dicts):
+        signatures[row] = NewsPage(news_url=None,
+                                   news_page_dict=news_page_dict,
+                                   shingles_calc=shingles_calc,
+                                   num_perm=num_perm,
+                                   fingerprint=False,
+                                   keep_texts=False).hashvalues
+    return signatures
+
+
+def calc_field_signatures(field_texts, shingles_calc, num_perm, minhash_engine=None):
+    """
+    Calculates the MinHashes of single news page fields, each shingled with its field's parameters.
+
+    Args:
+        field_texts (List[Tuple[str, str]]):
+            The (field, text) pairs (see news_page_field_texts()).
+        shingles_calc (ShinglesCalc):
+            The initialized ShinglesCalc object.
+        num_perm (int):
+            The number of permutations for a MinHash.
+        minhash_engine (Optional[MinHashEngine]):
+            If provided, all the fields are hashed in one vectorized pass.
+    Returns:
+        np.ndarray:
+            The uint64 signature matrix, with a row for each field text.
+    """
+    if minhash_engine is not None:
+        return minhash_engine.calc_field_hashvalues_batch(field_texts)
+
+    signatures = np.empty((len(field_texts), num_perm), dtype=np.uint64)
+    for row, (field, text) in enumerate(field_texts):
+        signatures[row] = calc_minhash(shingles_calc.iter_shingles({field: text}), num_perm=num_perm).hashvalues
+    return signatures
+
+
+def calc_news_field_signatures(news_page_dicts, fields, shingles_calc, num_perm, minhash_engine=None):
+    """
+    Calculates the per-field MinHashes of multiple news (see calc_field_signatures()).
+
+    Args:
+        news_page_dicts (List[Dict[str, Any]]):
+            The news page dicts, of format:
+                {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+        fields (List[str]):
+            The hashed fields, in the order of the signatures.
+        shingles_calc (ShinglesCalc):
+            The initialized ShinglesCalc object.
+        num_perm (int):
+            The number of permutations for a MinHash.
+        minhash_engine (Optional[MinHashEngine]):
+            The vectorized engine, if the MinHashes are calculated with it.
+    Returns:
+        np.ndarray:
+            The uint64 field signatures, of shape (len(news_page_dicts), len(fields), num_perm).
+    """
+    field_texts = [(field, news_page_field_texts(news_page_dict)[field])
+                   for news_page_dict in news_page_dicts
+                   for field in fields]
+    signatures = calc_field_signatures(field_texts, shingles_calc, num_perm, minhash_engine)
+    return signatures.reshape(len(news_page_dicts), len(fields), num_perm)
+
+
+def news_page_field_texts(news_page_dict):
+    """
+    Args:
+        news_page_dict (Dict[str, Any]):
+            The news page dict, of format:
+                {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+    Returns:
+        Dict[str, str]:
+            The texts that are shingled, of format:
+                {'title': STR, 'content': STR, 'contained_urls': URLS_COMBINED_STR}
+    """
+    return {
+        **news_page_dict,
+        'contained_urls': ''.join(news_page_dict['contained_urls'].keys())
+    }
+
+
+def news_page_dict_from_info(news_info):
+    """
+    Args:
+        news_info (Dict[str, Any]):
+            The news info, of format:
+                {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+            Any of the keys can be missing or None.
+    Returns:
+        Dict[str, Any]:
+            The news page dict, with all the keys.
+    """
+    return {
+        'title': news_info.get('title') or '',
+        'content': news_info.get('content') or '',
+        'contained_urls': news_info.get('contained_urls') or dict(),
+    }
+
+
+def create_signature_pool(shingles_calc, num_perm, minhash_engine=None, workers=None, processes=True, fields=None):
+    """
+    Creates a process pool whose processes calculate MinHashes with the provided settings,
+    so the hashing doesn't block the caller (see submit_signatures()).
+    A thread pool can be used instead in the processes that can't have children (e.g. the daemonic server workers),
+    the vectorized hashing releases the GIL in the NumPy operations.
+
+    Args:
+        shingles_calc (ShinglesCalc):
+            The initialized ShinglesCalc object.
+        num_perm (int):
+            The number of permutations for a MinHash.
+        minhash_engine (Optional[MinHashEngine]):
+            The vectorized engine, if the MinHashes are calculated with it.
+        workers (Optional[int]):
+            The number of processes (or threads). If None, the number of CPUs is used.
+        processes (bool):
+            Should the pool use processes? If False, threads are used.
+        fields (Optional[List[str]]):
+            If provided, the pool can calculate the per-field MinHashes of these fields (see submit_signatures()).
+    Returns:
+        Executor:
+            The pool (the caller must shut it down).
+    """
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    return executor_class(max_workers=workers or os.cpu_count(),
+                          initializer=_init_signature_worker,
+                          initargs=(shingles_calc, num_perm, minhash_engine, fields))
+
+
+def submit_signatures(pool, news_infos, per_field=False):
+    """
+    Submits the MinHash calculation of news infos to a pool created by create_signature_pool().
+
+    Args:
+        pool (Executor):
+            The signature pool.
+        news_infos (List[Dict[str, Any]]):
+            The news infos, of format:
+                [{'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}]
+        per_field (bool):
+            Should the per-field MinHashes be calculated (the pool must have been created with fields)?
+    Returns:
+        concurrent.futures.Future:
+            The future of the uint64 signature matrix, with a row for each news info
+            (with per_field, of shape (len(news_infos), len(fields), num_perm)).
+    """
+    return pool.submit(_calc_news_field_signatures if per_field else _calc_signatures,
+                       [news_page_dict_from_info(news_info) for news_info in news_infos])
+
+
+# endregion SIGNATURE WORKERS
+
 
 class SimilarTexts:
+    EXACT_RERANK_FACTOR = 3  # With top_k, the exact similarity is calculated for the best top_k * 3 estimates
+
     def __init__(self, news_json_obj=None, *, results_path=None, threshold=0.6, num_perm=128, parameters=None,
-                 shingles_unique=True, case_sensitive=False):
+                 shingles_unique=True, case_sensitive=False, signature_store_dir=None, vectorized_hashing=False,
+                 workers=1, chunk_size=256, index_backends=('lsh',), containment_threshold=0.8, field_weights=None,
+                 keep_shingles=False, keep_texts=True, text_store_dir=None):
         """
         Text similarity of a string with a database of other strings using MinHash and LSH.
 
@@ -209,6 +671,8 @@ class SimilarTexts:
                 That after processing has the format:
                     {news_url: {'title': str, 'content': str,
                     'contained_urls': {URL: URL_TITLE}}}
+                Or the path to the JSON Lines written by the crawler's JsonLinesPipeline
+                (a directory, or a .jsonl/.jsonl.gz/.jsonl.zst file), which is streamed.
 
                 If None, database must not be None.
             threshold (float):
@@ -222,6 +686,39 @@ class SimilarTexts:
                 Should the shingles be unique?
             case_sensitive (bool):
                 Should the shingles be case-sensitive?
+            signature_store_dir (Optional[str]):
+                The directory of a SignatureStore. If provided, the MinHashes are loaded from it,
+                only the news whose content changed are rehashed, and the store is updated after that.
+            vectorized_hashing (bool):
+                Should the MinHashes be calculated by the vectorized MinHashEngine?
+                Its MinHashes can't be compared with the ones calculated without it.
+            workers (Optional[int]):
+                The number of processes used to calculate the MinHashes of the database.
+                If 1, no process pool is used. If None, the number of CPUs is used.
+                The NewsPages hashed in the pool don't keep their shingle list.
+            chunk_size (int):
+                How many news are sent at once to a process of the pool.
+            index_backends (Iterable[str]):
+                The indexes built by fit_similarity(), from INDEX_BACKENDS ('lsh' is always built, it's used
+                for clustering). The other ones are built at the first query that selects them.
+            containment_threshold (float):
+                Between [0, 1]. The minimum containment of a query in the news found by the 'ensemble' index.
+            field_weights (Optional[Dict[str, float]]):
+                If provided, every field of the parameters is hashed into its own MinHash (only when it changes),
+                and the 'lsh' queries find their candidates in an LSH per weighted field,
+                ranked by the weighted average of their per-field jaccard similarities, e.g.:
+                    {'title': 2.0, 'content': 1.0}
+                A field shared by many news (like the links of a site) makes them all candidates, better leave it out.
+                The merged MinHash (for clustering and the other index backends) is derived from the fields' ones.
+            keep_shingles (bool):
+                Should the NewsPages hashed in this process keep their sorted shingle list (for debugging)?
+                If not, their shingles are hashed as they are generated, without creating any list.
+            keep_texts (bool):
+                Should the database news pages keep their title, content and contained URLs?
+                They are only needed for the exact similarities (exact=True), which can't be used without them.
+            text_store_dir (Optional[str]):
+                The directory of a TextStore. If provided, the texts of the database news pages are kept in it
+                instead of in memory, and only read when they are needed (exact similarities, get_news_texts()).
         Returns:
             SimilarTexts:
                 The initialized similarity class
@@ -240,46 +737,256 @@ class SimilarTexts:
                                           case_sensitive=case_sensitive,
                                           parameters=parameters)
         self.threshold = threshold
+        self.containment_threshold = containment_threshold
         self.num_perm = num_perm
+        for backend in index_backends:
+            if backend not in INDEX_BACKENDS:
+                raise Exception(f'Unknown index backend {backend!r}, expected one of {list(INDEX_BACKENDS)}')
+        self.index_backends = ('lsh',) + tuple(backend for backend in index_backends if backend != 'lsh')
+        self.fields = list(parameters.keys())
+        self.field_weights = self.__check_field_weights(field_weights) if field_weights else None
+        self.minhash_engine = MinHashEngine(self.shingles_calc, num_perm=num_perm) if vectorized_hashing else None
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.keep_shingles = keep_shingles
+        self.keep_texts = keep_texts
+
+        self.signature_store = None
+        if signature_store_dir:
+            self.signature_store = SignatureStore(store_dir=signature_store_dir,
+                                                  parameters=parameters,
+                                                  num_perm=num_perm,
+                                                  shingles_unique=shingles_unique,
+                                                  case_sensitive=case_sensitive,
+                                                  vectorized_hashing=vectorized_hashing,
+                                                  fields=self.fields if self.field_weights else None)
+            self.signature_store.load()
+
+        self.text_store = TextStore(text_store_dir).load() if text_store_dir else None
 
         # Initialize the object for clusterization (same as self.__init_clusterization())
         self.fitted_clustering = False
         self.clusters = None
+        self.stale_clustering = False  # An updated or removed news still links its old cluster (refit when read)
 
         # Initialize the object for LSH similarity queries (same as self.__init_similarity())
         self.fitted_similarity = False
         self.lsh = None
+        self.indexes = dict()  # {backend: index}
+        self.stale_indexes = set()  # The backends to rebuild before their next query
+        self.signature_matrix = None
+        self.field_matrices = dict()  # {field: SignatureMatrix}, with field_weights
+        self.field_indexes = dict()  # {field: LSHIndex}, for the weighted fields
+
+        # Incremented whenever the query results can change (the database or the LSH changed)
+        self.generation = 0
 
         # Init the database
+        self.database: Dict[str, NewsPage] = dict()
         if news_json_obj:
-            self.database: Dict[str, NewsPage] = {
-                news_url: NewsPage(news_url=news_url,
-                                   news_page_dict=news_page_dict,
-                                   shingles_calc=self.shingles_calc,
-                                   num_perm=self.num_perm)
-                for news_url, news_page_dict in news_json_obj.items()
-            }
+            self.database: Dict[str, NewsPage] = self.__build_database(news_json_obj.items())
             logging.info('Loaded the database')
+        elif results_path and is_jsonl_results(results_path):
+            logging.info('Started streaming the database and calculating the minhashes')
+            start_time = time.time()
+            self.database: Dict[str, NewsPage] = self.__build_database(iter_jsonl_results(results_path))
+            logging.info(f'It took {time.time() - start_time: .3f} seconds to load the database.')
         elif results_path:
             with open(results_path, 'r') as fin:
                 logging.info('Started loading the database and calculating the minhashes')
                 start_time = time.time()
 
                 results = json.load(fin)
-                self.database: Dict[str, NewsPage] = dict(sum([
-                    [
-                        (news_url, NewsPage(news_url=news_url,
-                                            news_page_dict=news_page_dict,
-                                            shingles_calc=self.shingles_calc,
-                                            num_perm=self.num_perm))
-                        for news_url, news_page_dict in results_per_site['results'].items()
-                    ] for results_per_site in results.values()
-                ], []))
+                self.database: Dict[str, NewsPage] = self.__build_database(itertools.chain.from_iterable(
+                    results_per_site['results'].items() for results_per_site in results.values()
+                ))
 
                 logging.info(f'It took {time.time() - start_time: .3f} seconds to load the database.')
 
+        if self.signature_store is not None and (
+                len(self.database) != len(self.signature_store.rows) or
+                any(self.signature_store.fingerprints.get(news_url) != news_page.fingerprint
+                    for news_url, news_page in self.database.items())):
+            self.signature_store.save(self.database)
+
     # region HELPERS
-    def __get_news_page_from_info(self, news_url, news_title=None, news_content=None, news_contained_urls=None):
+    def __build_database(self, news_items):
+        """
+        Creates the NewsPage objects for all the provided news.
+        If there is a SignatureStore, the stored MinHashes of the unchanged news are reused.
+
+        Args:
+            news_items (Iterable[Tuple[str, Dict[str, Any]]]):
+                The (news_url, news_page_dict) pairs.
+        Returns:
+            Dict[str, NewsPage]:
+                The database, with the news URLs as keys.
+        """
+        if self.field_weights:
+            return self.__build_field_database(news_items)
+
+        database = dict()
+        # The news without a stored MinHash, if they're hashed by the process pool: {news_url: (news_page_dict,
+        # fingerprint)}, so the last version of a news wins (e.g. a recrawled news is in the results twice)
+        news_to_hash = dict()
+        rehashed_urls = set()
+        for news_url, news_page_dict in news_items:
+            fingerprint = news_fingerprint(news_page_dict)
+            news_to_hash.pop(news_url, None)
+            rehashed_urls.discard(news_url)
+            minhash = None
+            if self.signature_store is not None:
+                minhash = self.signature_store.get_minhash(news_url, fingerprint)
+            if minhash is None:
+                rehashed_urls.add(news_url)
+                if self.workers > 1:
+                    database[news_url] = None  # Keeps the database order, until it's hashed
+                    news_to_hash[news_url] = (news_page_dict, fingerprint)
+                    continue
+
+            database[news_url] = NewsPage(news_url=news_url,
+                                          news_page_dict=news_page_dict,
+                                          shingles_calc=self.shingles_calc,
+                                          num_perm=self.num_perm,
+                                          minhash=minhash,
+                                          fingerprint=fingerprint,
+                                          minhash_engine=self.minhash_engine,
+                                          keep_shingles=self.keep_shingles,
+                                          keep_texts=self.keep_texts,
+                                          texts=self.__store_texts(news_url, news_page_dict, fingerprint))
+
+        if news_to_hash:
+            self.__calc_news_pages_in_parallel([(news_url, news_page_dict, fingerprint) for news_url, (
+                news_page_dict, fingerprint) in news_to_hash.items()], database)
+        if self.text_store is not None:
+            self.text_store.flush()
+
+        if self.signature_store is not None:
+            logging.info(f'Reused {len(database) - len(rehashed_urls)} stored signatures, rehashed {len(rehashed_urls)}')
+        return database
+
+    def __build_field_database(self, news_items):
+        """
+        Same as __build_database(), with the per-field MinHashes: a field is only rehashed if it changed since
+        its MinHash was calculated (by the news already in the database, or the one in the SignatureStore).
+        """
+        news_to_build = []  # The (news_url, news_page_dict, field_fingerprints, field_hashvalues) of the news
+        field_texts = []  # The fields to hash, as (field, text)
+        field_targets = []  # Where their hash values go, as (field_hashvalues, field index)
+        for news_url, news_page_dict in news_items:
+            texts = news_page_field_texts(news_page_dict)
+            fingerprints = [field_fingerprint(texts[field]) for field in self.fields]
+            field_hashvalues = np.empty((len(self.fields), self.num_perm), dtype=np.uint64)
+            reusable = self.__get_reusable_field_hashvalues(news_url, fingerprints)
+            for i, field in enumerate(self.fields):
+                if reusable is not None and reusable[1][i]:
+                    field_hashvalues[i] = reusable[0][i]
+                else:
+                    field_texts.append((field, texts[field]))
+                    field_targets.append((field_hashvalues, i))
+            news_to_build.append((news_url, news_page_dict, fingerprints, field_hashvalues))
+
+        for (field_hashvalues, i), hashvalues in zip(field_targets, self.__calc_field_signatures(field_texts)):
+            field_hashvalues[i] = hashvalues
+
+        database = dict()
+        for news_url, news_page_dict, fingerprints, field_hashvalues in news_to_build:
+            fingerprint = news_fingerprint(news_page_dict)
+            database[news_url] = NewsPage(news_url=news_url,
+                                          news_page_dict=news_page_dict,
+                                          shingles_calc=self.shingles_calc,
+                                          num_perm=self.num_perm,
+                                          fingerprint=fingerprint,
+                                          field_hashvalues=field_hashvalues,
+                                          field_fingerprints=fingerprints,
+                                          keep_texts=self.keep_texts,
+                                          texts=self.__store_texts(news_url, news_page_dict, fingerprint))
+        if self.text_store is not None:
+            self.text_store.flush()
+        logging.info(f'Rehashed {len(field_texts)} of the {len(database) * len(self.fields)} fields')
+        return database
+
+    def __get_reusable_field_hashvalues(self, news_url, fingerprints):
+        """
+        Returns:
+            Optional[Tuple[np.ndarray, List[bool]]]:
+                The known field hash values of the news, and for each field, True if they're still up-to-date.
+        """
+        news_page = self.database.get(news_url)
+        if news_page is not None and news_page.field_fingerprints is not None:
+            return news_page.field_hashvalues, [old == new for old, new in
+                                                zip(news_page.field_fingerprints, fingerprints)]
+        if self.signature_store is not None:
+            return self.signature_store.get_field_hashvalues(news_url, fingerprints)
+        return None
+
+    def __calc_field_signatures(self, field_texts):
+        """
+        Calculates the MinHashes of news page fields, in chunks in a process pool if there are many of them.
+        """
+        if self.workers == 1 or len(field_texts) <= self.chunk_size:
+            return calc_field_signatures(field_texts, self.shingles_calc, self.num_perm, self.minhash_engine)
+
+        logging.info(f'Hashing {len(field_texts)} fields with {self.workers} processes')
+        chunks = [field_texts[start: start + self.chunk_size] for start in range(0, len(field_texts), self.chunk_size)]
+        with create_signature_pool(self.shingles_calc, self.num_perm, self.minhash_engine, self.workers) as executor:
+            return np.concatenate(list(executor.map(_calc_field_signatures, chunks)))
+
+    def __check_field_weights(self, field_weights):
+        """
+        Returns:
+            Dict[str, float]:
+                The field weights, if they're valid (the fields of the parameters, at least one positive weight).
+        """
+        unknown_fields = set(field_weights) - set(self.fields)
+        if unknown_fields:
+            raise Exception(f'Unknown fields {sorted(unknown_fields)} in the field weights, expected {self.fields}')
+        if any(weight < 0 for weight in field_weights.values()) or not any(field_weights.values()):
+            raise Exception('The field weights must be non-negative, and at least one of them positive')
+        return dict(field_weights)
+
+    def __calc_news_pages_in_parallel(self, news_to_hash, database):
+        """
+        Calculates the MinHashes of the news in chunks, using a process pool, and adds their NewsPages to the database.
+
+        Args:
+            news_to_hash (List[Tuple[str, Dict[str, Any], str]]):
+                The (news_url, news_page_dict, fingerprint) of the news to hash.
+            database (Dict[str, NewsPage]):
+                The database to add the NewsPages to.
+        """
+        logging.info(f'Hashing {len(news_to_hash)} news with {self.workers} processes')
+        chunks = [news_to_hash[start: start + self.chunk_size]
+                  for start in range(0, len(news_to_hash), self.chunk_size)]
+
+        with self.create_signature_pool(self.workers) as executor:
+            signature_chunks = executor.map(_calc_signatures, [
+                [news_page_dict for _, news_page_dict, _ in chunk] for chunk in chunks
+            ])
+            for chunk, signatures in zip(chunks, signature_chunks):
+                for (news_url, news_page_dict, fingerprint), hashvalues in zip(chunk, signatures):
+                    database[news_url] = NewsPage(news_url=news_url,
+                                                  news_page_dict=news_page_dict,
+                                                  shingles_calc=self.shingles_calc,
+                                                  num_perm=self.num_perm,
+                                                  minhash=lean_minhash_from_hashvalues(hashvalues),
+                                                  fingerprint=fingerprint,
+                                                  keep_texts=self.keep_texts,
+                                                  texts=self.__store_texts(news_url, news_page_dict, fingerprint))
+        return
+
+    def __store_texts(self, news_url, news_page_dict, fingerprint):
+        """
+        Returns:
+            Optional[TextRef]:
+                The reference to the texts of the news, stored in the TextStore (None if there isn't one).
+        """
+        if self.text_store is None:
+            return None
+        return self.text_store.put(news_url, news_page_dict, fingerprint)
+
+    def __get_news_page_from_info(self, news_url, news_title=None, news_content=None, news_contained_urls=None,
+                                  in_database=False):
         """
         Gets a NewsPage object from news info.
 
@@ -292,32 +999,108 @@ class SimilarTexts:
                 The news website's content.
             news_contained_urls (Optional[Dict[str, str]]):
                 The news website's contained URLs.
+            in_database (bool):
+                Is the NewsPage added to the database (its texts are then kept like the database's ones)?
         Returns:
             NewsPage:
                 The created NewsPage object.
         """
-        if not news_title:
-            news_title = ''
-        if not news_content:
-            news_content = ''
-        if not news_contained_urls:
-            news_contained_urls = dict()
-
-        news_page_dict = {
-            'title': news_title,
-            'content': news_content,
-            'contained_urls': news_contained_urls,
-        }
+        if self.field_weights:
+            return self.__get_news_pages_from_infos([{
+                'url': news_url,
+                'title': news_title,
+                'content': news_content,
+                'contained_urls': news_contained_urls,
+            }])[0]
+        news_page_dict = news_page_dict_from_info({'title': news_title,
+                                                   'content': news_content,
+                                                   'contained_urls': news_contained_urls})
+        fingerprint = news_fingerprint(news_page_dict)
+        news_page = NewsPage(news_url=news_url,
+                             news_page_dict=news_page_dict,
+                             shingles_calc=self.shingles_calc,
+                             num_perm=self.num_perm,
+                             fingerprint=fingerprint,
+                             minhash_engine=self.minhash_engine,
+                             keep_shingles=self.keep_shingles,
+                             keep_texts=self.keep_texts if in_database else True,
+                             texts=self.__store_texts(news_url, news_page_dict, fingerprint) if in_database else None)
+        if in_database and self.text_store is not None:
+            self.text_store.flush()
+        return news_page
+
+    def __get_news_pages_from_infos(self, news_infos, signatures=None):
+        """
+        Gets the NewsPage objects of multiple news infos.
+        With the MinHashEngine, all their MinHashes are calculated in one vectorized pass.
+
+        Args:
+            news_infos (List[Dict[str, Any]]):
+                The news infos, of format:
+                    [{'url': str, 'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}]
+                Any of the keys can be missing.
+            signatures (Optional[np.ndarray]):
+                The already calculated uint64 signature matrix of the news infos (e.g. by a signature pool).
+                With field_weights, the per-field signatures, of shape (len(news_infos), len(fields), num_perm).
+        Returns:
+            List[NewsPage]:
+                The created NewsPage objects, in the same order.
+        """
+        news_page_dicts = [news_page_dict_from_info(news_info) for news_info in news_infos]
+        if self.field_weights:
+            if signatures is None:
+                # Hashed inline: a query batch is small, and the pool of the queries is the caller's
+                signatures = calc_news_field_signatures(news_page_dicts, self.fields, self.shingles_calc,
+                                                        self.num_perm, self.minhash_engine)
+            return [
+                NewsPage(news_url=news_info.get('url'),
+                         news_page_dict=news_page_dict,
+                         shingles_calc=self.shingles_calc,
+                         num_perm=self.num_perm,
+                         field_hashvalues=field_hashvalues)
+                for news_info, news_page_dict, field_hashvalues in zip(news_infos, news_page_dicts, signatures)
+            ]
+
+        if signatures is None and self.minhash_engine is None:
+            return [
+                NewsPage(news_url=news_info.get('url'),
+                         news_page_dict=news_page_dict,
+                         shingles_calc=self.shingles_calc,
+                         num_perm=self.num_perm,
+                         keep_shingles=self.keep_shingles)
+                for news_info, news_page_dict in zip(news_infos, news_page_dicts)
+            ]
+
+        if signatures is None:
+            signatures = calc_signatures(news_page_dicts, self.shingles_calc, self.num_perm, self.minhash_engine)
+        return [
+            NewsPage(news_url=news_info.get('url'),
+                     news_page_dict=news_page_dict,
+                     shingles_calc=self.shingles_calc,
+                     num_perm=self.num_perm,
+                     minhash=lean_minhash_from_hashvalues(hashvalues))
+            for news_info, news_page_dict, hashvalues in zip(news_infos, news_page_dicts, signatures)
+        ]
 
-        return NewsPage(news_url=news_url,
-                        news_page_dict=news_page_dict,
-                        shingles_calc=self.shingles_calc,
-                        num_perm=self.num_perm)
+    def create_signature_pool(self, workers=None, processes=True):
+        """
+        Creates a pool that calculates MinHashes with the settings of this SimilarTexts (see create_signature_pool()).
+        With field_weights, the pool calculates the per-field MinHashes.
+        """
+        return create_signature_pool(self.shingles_calc, self.num_perm, self.minhash_engine, workers, processes,
+                                     fields=self.fields if self.field_weights else None)
+
+    def submit_signatures(self, pool, news_infos):
+        """
+        Same as submit_signatures() (per field, with field_weights).
+        """
+        return submit_signatures(pool, news_infos, per_field=bool(self.field_weights))
 
     def add_to_database(self, news_url, news_title=None, news_content=None, news_contained_urls=None,
-                        *, reinit_clusterization=True, reinit_similarity=True):
+                        *, reinit_clusterization=False, reinit_similarity=False):
         """
-        Add 1 new news to the database.
+        Add 1 new news to the database (or update it, if the URL is already there).
+        If the similarity is fitted, the news is also inserted in the LSH (after removing its old version).
 
         Args:
             news_url (str):
@@ -329,20 +1112,214 @@ class SimilarTexts:
             news_contained_urls (Optional[Dict[str, str]]):
                 The news website's contained URLs.
             reinit_clusterization (Optional[bool]):
-                Should reinitialize the clusterization fitting after adding to the db?
+                Should reinitialize the clusterization fitting after adding to the db,
+                instead of adding the news to the clusters in place (only possible while the LSH is fitted)?
+                In place, an updated news keeps the links of its old version, so the clusters are refitted
+                the next time they're read.
             reinit_similarity (Optional[bool]):
-                Should reinitialize the similarity fitting after adding to the db?
+                Should reinitialize the similarity fitting after adding to the db,
+                instead of updating the LSH in place?
         """
 
-        self.database[news_url] = self.__get_news_page_from_info(news_url=news_url,
-                                                                 news_title=news_title,
-                                                                 news_content=news_content,
-                                                                 news_contained_urls=news_contained_urls)
+        if self.field_weights:
+            # Only the changed fields of an updated news are rehashed
+            news_page = self.__build_database([(news_url, news_page_dict_from_info({
+                'title': news_title,
+                'content': news_content,
+                'contained_urls': news_contained_urls,
+            }))])[news_url]
+        else:
+            news_page = self.__get_news_page_from_info(news_url=news_url,
+                                                       news_title=news_title,
+                                                       news_content=news_content,
+                                                       news_contained_urls=news_contained_urls,
+                                                       in_database=True)
+        self.__mark_updated_news_stale([news_url])
+        self.database[news_url] = news_page
+        self.generation += 1
 
-        if reinit_clusterization:
+        if reinit_similarity:
+            self.__init_similarity()
+        elif self.fitted_similarity:
+            self.__index_news_page(news_page)
+        if reinit_clusterization or not self.fitted_similarity:
             self.__init_clusterization()
+        elif self.fitted_clustering:
+            self.__cluster_news_page(news_page)
+        return
+
+    def add_many(self, news_json_obj, *, reinit_clusterization=False, reinit_similarity=False):
+        """
+        Add (or update) multiple news to the database.
+        They are hashed like the initial database (so using the process pool, if there is one).
+
+        Args:
+            news_json_obj (Dict[str, Dict[str, Any]]):
+                The news to add, of format:
+                    {news_url: {'title': str, 'content': str,
+                    'contained_urls': {URL: URL_TITLE}}}
+            reinit_clusterization (Optional[bool]):
+                Should reinitialize the clusterization fitting after adding to the db,
+                instead of adding the news to the clusters in place (only possible while the LSH is fitted)?
+                In place, an updated news keeps the links of its old version, so the clusters are refitted
+                the next time they're read.
+            reinit_similarity (Optional[bool]):
+                Should reinitialize the similarity fitting after adding to the db,
+                instead of updating the LSH in place?
+        """
+        news_pages = self.__build_database(news_json_obj.items())
+        self.__mark_updated_news_stale(news_pages.keys())
+        self.database.update(news_pages)
+        self.generation += 1
+
         if reinit_similarity:
             self.__init_similarity()
+        elif self.fitted_similarity:
+            for news_page in news_pages.values():
+                self.__index_news_page(news_page)
+        if reinit_clusterization or not self.fitted_similarity:
+            self.__init_clusterization()
+        elif self.fitted_clustering:
+            for news_page in news_pages.values():
+                self.__cluster_news_page(news_page)
+        return
+
+    def remove_from_database(self, news_url, *, reinit_clusterization=False):
+        """
+        Remove 1 news from the database, and from the LSH if the similarity is fitted.
+
+        Args:
+            news_url (str):
+                The news website's URL.
+            reinit_clusterization (Optional[bool]):
+                Should reinitialize the clusterization fitting after removing from the db?
+                If not, the news is hidden from its cluster, and as the clusters it linked stay merged,
+                they're refitted the next time they're read.
+        Returns:
+            bool:
+                True if the news was in the database.
+        """
+        news_page = self.database.pop(news_url, None)
+        if news_page is None:
+            return False
+        self.generation += 1
+
+        if reinit_clusterization:
+            self.__init_clusterization()
+        else:
+            self.__mark_updated_news_stale([news_url])
+        if self.fitted_similarity and news_url in self.lsh:
+            for backend, index in self.indexes.items():
+                if index.updatable:
+                    index.remove(news_url)
+                else:
+                    self.stale_indexes.add(backend)
+            news_page.hashvalues = news_page.hashvalues.copy()  # Its row is reused by the next added news
+            self.signature_matrix.remove(news_url)
+            for field_matrix in self.field_matrices.values():
+                field_matrix.remove(news_url)
+            for field_index in self.field_indexes.values():
+                field_index.remove(news_url)
+        return True
+
+    def __mark_updated_news_stale(self, news_urls):
+        """
+        Marks the fitted clusters as stale if any of the news is already clustered: a union-find can't unlink
+        its old version, so the clusters are refitted when they're read next (see __ensure_fresh_clustering()).
+
+        Args:
+            news_urls (Iterable[str]):
+                The URLs of the news that are being updated or removed.
+        """
+        if self.fitted_clustering and not self.stale_clustering:
+            self.stale_clustering = any(news_url in self.clusters for news_url in news_urls)
+
+    def __ensure_fresh_clustering(self):
+        if self.stale_clustering:
+            logging.info('Refitting the clusters, some clustered news were updated or removed')
+            self.fit_clustering()
+
+    def __cluster_news_page(self, news_page):
+        """
+        Adds a news page (already inserted in the LSH) to the fitted clusters,
+        merging the clusters of all its LSH candidates that are similar enough.
+        If the news was already clustered, its old links are kept (the clusters are marked stale meanwhile).
+
+        Args:
+            news_page (NewsPage):
+                The news page to cluster.
+        """
+        news_url = news_page.news_url
+        self.clusters.add(news_url)
+        candidates = [candidate for candidate in self.lsh.query(news_page.minhash) if candidate != news_url]
+        if not candidates:
+            return
+        similarities = self.signature_matrix.jaccard(candidates, news_page.hashvalues)
+        for candidate, similarity in zip(candidates, similarities):
+            if similarity >= self.threshold:
+                self.clusters.add(candidate)  # It can be a news added in the same batch, not clustered yet
+                self.clusters.union(news_url, candidate)
+        return
+
+    def __index_news_page(self, news_page):
+        """
+        Inserts a news page in the fitted LSH, replacing its old version if there is one.
+        The indexes that can't be updated in place are marked for rebuilding.
+
+        Args:
+            news_page (NewsPage):
+                The news page to insert.
+        """
+        for backend, index in self.indexes.items():
+            if index.updatable:
+                index.insert(news_page.news_url, news_page.minhash)
+            else:
+                self.stale_indexes.add(backend)
+        matrix = self.signature_matrix.matrix
+        self.signature_matrix.set(news_page.news_url, news_page.hashvalues)
+        if self.signature_matrix.matrix is matrix:
+            self.__bind_signatures([news_page])
+        else:  # The matrix grew, the news pages viewing the old one would keep it in memory
+            self.__bind_signatures(self.database.values())
+        for i, field in enumerate(self.fields):
+            if field in self.field_matrices:
+                self.field_matrices[field].set(news_page.news_url, news_page.field_hashvalues[i])
+            if field not in self.field_indexes:
+                continue
+            if is_empty_signature(news_page.field_hashvalues[i]):
+                self.field_indexes[field].remove(news_page.news_url)
+            else:
+                self.field_indexes[field].insert(news_page.news_url,
+                                                 lean_minhash_from_hashvalues(news_page.field_hashvalues[i]))
+        return
+
+    def get_news_texts(self, news_url):
+        """
+        Gets the texts of a database news (e.g. to display a result), reading them from the TextStore if there is one.
+
+        Args:
+            news_url (str):
+                The news website's URL.
+        Returns:
+            Optional[Dict[str, Any]]:
+                The news page dict, of format:
+                    {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+                None if the news isn't in the database.
+        """
+        news_page = self.database.get(news_url)
+        if news_page is None:
+            return None
+        title, content, contained_urls = news_page.get_texts()
+        return {'title': title, 'content': content, 'contained_urls': contained_urls}
+
+    def save_signatures(self):
+        """
+        Writes the MinHashes of the whole database to the SignatureStore (e.g. after adding news to the database).
+        """
+        if self.signature_store is None:
+            logging.error("There is no signature store. Please provide `signature_store_dir` when initializing.")
+            return
+        self.signature_store.save(self.database)
         return
 
     # endregion HELPERS
@@ -354,6 +1331,7 @@ class SimilarTexts:
         """
         self.fitted_clustering = False
         self.clusters = None
+        self.stale_clustering = False  # An updated or removed news still links its old cluster (refit when read)
         return
 
     def __init_similarity(self):
@@ -362,6 +1340,12 @@ class SimilarTexts:
         """
         self.fitted_similarity = False
         self.lsh = None
+        self.indexes = dict()
+        self.stale_indexes = set()
+        self.signature_matrix = None
+        self.field_matrices = dict()
+        self.field_indexes = dict()
+        self.generation += 1
         return
 
     # endregion INIT
@@ -370,27 +1354,117 @@ class SimilarTexts:
     def fit_similarity(self):
         """
         Uses the already calculated `MinHashes <https://ekzhu.com/datasketch/minhash.html>`_
-        to create the `LSH <https://ekzhu.com/datasketch/lsh.html>`_.
+        to create the `LSH <https://ekzhu.com/datasketch/lsh.html>`_ (and the other index_backends),
+        and the signature matrix used for ranking the LSH candidates.
 
         Returns:
             SimilarTexts:
                 The fitted SimilarTexts self.
         """
-        logging.info('Started calculating lsh')
-        start_time = time.time()
-
-        self.lsh = MinHashLSH(threshold=self.threshold, num_perm=self.num_perm)
-        with self.lsh.insertion_session() as session:
-            for news_url, news_page in self.database.items():
-                session.insert(news_url, news_page.minhash)
-        logging.info(f'It took {time.time() - start_time: .3f} seconds to build the lsh.')
+        self.indexes = dict()
+        self.stale_indexes = set()
+        for backend in self.index_backends:
+            self.__build_index(backend)
+        self.lsh = self.indexes['lsh'].lsh
+        self.signature_matrix = SignatureMatrix.from_database(self.database, self.num_perm)
+        self.__bind_signatures(self.database.values())
+        if self.field_weights:
+            self.field_matrices = dict()
+            for i, field in enumerate(self.fields):
+                self.field_matrices[field] = SignatureMatrix(self.num_perm, capacity=max(len(self.database), 1024))
+                for news_url, news_page in self.database.items():
+                    self.field_matrices[field].set(news_url, news_page.field_hashvalues[i])
+            self.field_indexes = dict()
+            for field, weight in self.field_weights.items():
+                if weight > 0:
+                    self.__build_field_index(field)
 
         self.fitted_similarity = True
+        self.generation += 1
         return self
 
-    def get_similar_news(self, news_url, news_title=None, news_content=None, news_contained_urls=None):
+    def __bind_signatures(self, news_pages):
+        """
+        Points the hash values of the news pages to their rows in the signature matrix,
+        so the signatures of the database are stored once, in one array (instead of one array per news page).
+
+        Args:
+            news_pages (Iterable[NewsPage]):
+                The news pages of the database (already set in the signature matrix).
+        """
+        matrix, rows = self.signature_matrix.matrix, self.signature_matrix.rows
+        for news_page in news_pages:
+            news_page.hashvalues = matrix[rows[news_page.news_url]]
+        return
+
+    def __build_index(self, backend):
+        """
+        Builds an index backend with the whole database.
+
+        Args:
+            backend (str):
+                The name of the index backend, one of INDEX_BACKENDS.
+        Returns:
+            Union[LSHIndex, ForestIndex, EnsembleIndex]:
+                The built index.
         """
-        Get the news that are similar to the provided news info.
+        logging.info(f'Started building the {backend} index')
+        start_time = time.time()
+
+        index = create_index(backend, threshold=self.threshold, num_perm=self.num_perm,
+                             containment_threshold=self.containment_threshold)
+        index.build((news_url, news_page.minhash) for news_url, news_page in self.database.items())
+        self.indexes[backend] = index
+        self.stale_indexes.discard(backend)
+        logging.info(f'It took {time.time() - start_time: .3f} seconds to build the {backend} index.')
+        return index
+
+    def __build_field_index(self, field):
+        """
+        Builds the LSH of the MinHashes of a field (the news with the field empty aren't in it).
+
+        Args:
+            field (str):
+                The field, one of the parameters' keys.
+        Returns:
+            LSHIndex:
+                The built index.
+        """
+        logging.info(f'Started building the {field} index')
+        start_time = time.time()
+
+        i = self.fields.index(field)
+        index = create_index('lsh', threshold=self.threshold, num_perm=self.num_perm,
+                             containment_threshold=self.containment_threshold)
+        index.build((news_url, lean_minhash_from_hashvalues(news_page.field_hashvalues[i]))
+                    for news_url, news_page in self.database.items()
+                    if not is_empty_signature(news_page.field_hashvalues[i]))
+        self.field_indexes[field] = index
+        logging.info(f'It took {time.time() - start_time: .3f} seconds to build the {field} index.')
+        return index
+
+    def __get_index(self, backend):
+        """
+        Returns:
+            Union[LSHIndex, ForestIndex, EnsembleIndex]:
+                The index of the backend, built (or rebuilt, if the database changed) if needed.
+        """
+        if backend not in self.indexes or backend in self.stale_indexes:
+            return self.__build_index(backend)
+        return self.indexes[backend]
+
+    def current_generation(self):
+        """
+        Returns:
+            int:
+                The generation of the database and LSH, the query results can change when it changes.
+        """
+        return self.generation
+
+    def get_similar_news(self, news_url, news_title=None, news_content=None, news_contained_urls=None,
+                         *, top_k=None, min_score=None, exact=False, backend='lsh', field_weights=None):
+        """
+        Get the news that are similar to the provided news info, from the most to the least similar.
 
         Args:
             news_url (Optional[str]):
@@ -401,6 +1475,22 @@ class SimilarTexts:
                 The news website's content.
             news_contained_urls (Optional[Dict[str, str]]):
                 The news website's contained URLs.
+            top_k (Optional[int]):
+                If provided, only the top_k most similar news are returned.
+            min_score (Optional[float]):
+                If provided, only the news with the similarity at least min_score are returned.
+            exact (bool):
+                Should the best MinHash candidates be re-ranked by their exact jaccard similarity
+                (calculated on the shingles)? Slower, the shingles of the candidates are recalculated if not kept.
+            backend (str):
+                The index that finds the candidates, one of INDEX_BACKENDS:
+                    'lsh': the news with a jaccard similarity probably over the threshold.
+                    'forest': the top_k (by default ForestIndex.default_top_k) most similar news, at any similarity.
+                    'ensemble': the news that contain the query (the scores are containments, not similarities).
+            field_weights (Optional[Dict[str, float]]):
+                With field_weights (see __init__()), other weights for this query (e.g. {'title': 1.0} for a lookup
+                by title only). The candidates are found by the 'lsh' of each weighted field that isn't empty
+                in the query, exact and the other backends use the merged MinHash.
         Returns:
             Dict[str, float]:
                 A dict with keys as the similar news URLs, and the values the jaccard distances to those URLs web pages.
@@ -415,11 +1505,173 @@ class SimilarTexts:
                                                    news_title=news_title,
                                                    news_content=news_content,
                                                    news_contained_urls=news_contained_urls)
+        return self.__query_news_page(news_page, top_k=top_k, min_score=min_score, exact=exact, backend=backend,
+                                      field_weights=field_weights)
 
-        similar_news = self.lsh.query(news_page.minhash)
-        return {
-            similar_news_url: self.database[similar_news_url].jaccard(news_page)
-            for similar_news_url in similar_news
-        }
+    def get_similar_news_batch(self, news_infos, *, signatures=None, top_k=None, min_score=None, exact=False,
+                               backend='lsh', field_weights=None):
+        """
+        Get the similar news of multiple news infos at once.
+        With the MinHashEngine, the MinHashes of the whole batch are calculated in one vectorized pass.
+
+        Args:
+            news_infos (List[Dict[str, Any]]):
+                The news infos, of format:
+                    [{'url': str, 'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}]
+                Any of the keys can be missing.
+            signatures (Optional[np.ndarray]):
+                The already calculated uint64 signature matrix of the news infos (e.g. by submit_signatures()),
+                so only the LSH is queried here. With field_weights, the per-field signatures
+                (see calc_field_signatures()), of shape (len(news_infos), len(fields), num_perm).
+            top_k (Optional[int]):
+                Same as for get_similar_news().
+            min_score (Optional[float]):
+                Same as for get_similar_news().
+            exact (bool):
+                Same as for get_similar_news().
+            backend (str):
+                Same as for get_similar_news().
+            field_weights (Optional[Dict[str, float]]):
+                Same as for get_similar_news().
+        Returns:
+            List[Dict[str, float]]:
+                For each news info (in the same order), a dict with keys as the similar news URLs,
+                and the values the jaccard distances to those URLs web pages.
+        """
+
+        if not self.fitted_similarity:
+            logging.error("LSH Similarity wasn't fitted. "
+                          "Please call fit_similarity() before trying to get the similar news!")
+            return [dict() for _ in news_infos]
+
+        return [self.__query_news_page(news_page, top_k=top_k, min_score=min_score, exact=exact, backend=backend,
+                                       field_weights=field_weights)
+                for news_page in self.__get_news_pages_from_infos(news_infos, signatures=signatures)]
+
+    def __query_news_page(self, news_page, top_k=None, min_score=None, exact=False, backend='lsh',
+                          field_weights=None):
+        """
+        Queries the index backend, and ranks the candidates by their jaccard similarities (or containments),
+        estimated for all of them at once from the signature matrix.
+        """
+        if self.field_weights and backend == 'lsh' and not exact:
+            field_weights = self.__check_field_weights(field_weights) if field_weights else self.field_weights
+            return self.__query_news_page_fields(news_page, field_weights, top_k=top_k, min_score=min_score)
+
+        index = self.__get_index(backend)
+        if top_k is None:
+            top_k = index.default_top_k
+        similar_news = index.query(news_page.minhash, top_k=top_k)
+        if not similar_news:
+            return dict()
+        if index.containment:
+            similarities = self.signature_matrix.containment(similar_news, news_page.hashvalues)
+        else:
+            similarities = self.signature_matrix.jaccard(similar_news, news_page.hashvalues)
+        if not exact:
+            return rank_similar_news(similar_news, similarities, top_k=top_k, min_score=min_score)
+
+        # Only the best estimates are re-ranked, the exact similarity is close to the estimate
+        candidates = list(rank_similar_news(similar_news, similarities,
+                                            top_k=top_k * self.EXACT_RERANK_FACTOR if top_k else None))
+        if index.containment:
+            exact_similarities = np.array([news_page.exact_containment(self.database[news_url], self.shingles_calc)
+                                           for news_url in candidates])
+        else:
+            exact_similarities = np.array([self.database[news_url].exact_jaccard(news_page, self.shingles_calc)
+                                           for news_url in candidates])
+        return rank_similar_news(candidates, exact_similarities, top_k=top_k, min_score=min_score)
+
+    def __query_news_page_fields(self, news_page, field_weights, top_k=None, min_score=None):
+        """
+        Queries the LSH of each weighted field that isn't empty in the query, and ranks the union of the candidates
+        by the weighted average of their per-field jaccard similarities (over the same fields).
+        """
+        fields = [(i, field, field_weights[field]) for i, field in enumerate(self.fields)
+                  if field_weights.get(field, 0) > 0 and not is_empty_signature(news_page.field_hashvalues[i])]
+        if not fields:
+            return dict()
+
+        similar_news = list(dict.fromkeys(itertools.chain.from_iterable(
+            (self.field_indexes.get(field) or self.__build_field_index(field)).query(
+                lean_minhash_from_hashvalues(news_page.field_hashvalues[i]))
+            for i, field, _ in fields
+        )))
+        if not similar_news:
+            return dict()
+        similarities = sum(weight * self.field_matrices[field].jaccard(similar_news, news_page.field_hashvalues[i])
+                           for i, field, weight in fields) / sum(weight for _, _, weight in fields)
+        return rank_similar_news(similar_news, similarities, top_k=top_k, min_score=min_score)
 
     # endregion SIMILARITY
+
+    # region CLUSTERING
+    def fit_clustering(self):
+        """
+        Clusters the whole database: the news whose estimated jaccard similarity is at least the threshold
+        (found through the LSH band buckets) are in the same cluster, transitively (using a union-find).
+        The LSH is fitted first if needed, as it's used for adding news to the clusters later.
+
+        Returns:
+            SimilarTexts:
+                The fitted SimilarTexts self.
+        """
+        if not self.fitted_similarity:
+            self.fit_similarity()
+
+        logging.info('Started clustering')
+        start_time = time.time()
+
+        news_urls = list(self.signature_matrix.rows.keys())
+        rows = np.fromiter(self.signature_matrix.rows.values(), dtype=np.intp, count=len(news_urls))
+        first_rows, second_rows = find_similar_pairs(self.signature_matrix.matrix[rows],
+                                                     b=self.lsh.b, r=self.lsh.r, threshold=self.threshold)
+
+        self.clusters = UnionFind()
+        for news_url in news_urls:
+            self.clusters.add(news_url)
+        for first_row, second_row in zip(first_rows.tolist(), second_rows.tolist()):
+            self.clusters.union(news_urls[first_row], news_urls[second_row])
+        logging.info(f'It took {time.time() - start_time: .3f} seconds to find {len(first_rows)} similar pairs '
+                     f'and cluster {len(news_urls)} news.')
+
+        self.fitted_clustering = True
+        self.stale_clustering = False
+        return self
+
+    def get_cluster(self, news_url):
+        """
+        Args:
+            news_url (str):
+                A news URL from the database.
+        Returns:
+            Optional[List[str]]:
+                The news URLs in the same cluster (including news_url), or None if the news isn't clustered.
+        """
+        if not self.fitted_clustering:
+            logging.error("The clustering wasn't fitted. "
+                          "Please call fit_clustering() before trying to get the clusters!")
+            return None
+        self.__ensure_fresh_clustering()
+        if news_url not in self.clusters or news_url not in self.database:
+            return None
+        return [member for member in self.clusters.get_members(news_url) if member in self.database]
+
+    def get_clusters(self, min_size=2):
+        """
+        Args:
+            min_size (int):
+                The minimum number of news in a returned cluster (by default, the news without duplicates are skipped).
+        Returns:
+            List[List[str]]:
+                The news URLs of each cluster, from the largest cluster to the smallest.
+        """
+        if not self.fitted_clustering:
+            logging.error("The clustering wasn't fitted. "
+                          "Please call fit_clustering() before trying to get the clusters!")
+            return []
+        self.__ensure_fresh_clustering()
+        clusters = ([member for member in members if member in self.database] for members in self.clusters.get_sets())
+        return sorted((cluster for cluster in clusters if len(cluster) >= min_size), key=len, reverse=True)
+
+    # endregion CLUSTERING
@@ -0,0 +1,155 @@
+import json
+import logging
+import mmap
+import os
+
+from typing import Dict, Optional, Tuple
+
+
+class TextRef:
+    # One per news of the database, instead of its texts
+    __slots__ = ('store', 'offset', 'length')
+
+    def __init__(self, store, offset, length):
+        """
+        A reference to the texts of a news in a TextStore, loaded only when they are needed.
+
+        Args:
+            store (TextStore):
+                The store the texts are in.
+            offset (int):
+                The offset of the texts record in the store's data file.
+            length (int):
+                The length of the texts record, in bytes.
+        Returns:
+            TextRef:
+                The initialized reference
+        """
+        self.store = store
+        self.offset = offset
+        self.length = length
+
+    def load(self):
+        """
+        Returns:
+            Tuple[str, str, Dict[str, str]]: The (title, content, contained_urls) of the news.
+        """
+        return self.store.read(self.offset, self.length)
+
+
+class TextStore:
+    def __init__(self, store_dir):
+        """
+        Append-only on-disk store of the news texts (title, content and contained URLs),
+        so the database doesn't keep them in memory: they are read from the memory-mapped data file when needed.
+        Every record is appended to the data file (a JSON array per news), and its offset to the index
+        (a JSON Lines file, the last line of a news URL wins). An unchanged news isn't appended again.
+        The records of the updated news stay in the data file.
+
+        Args:
+            store_dir (str):
+                The directory where the store files are kept.
+        Returns:
+            TextStore:
+                The initialized (but not loaded) store
+        """
+        self.store_dir = store_dir
+        self.data_path = os.path.join(store_dir, 'texts.bin')
+        self.index_path = os.path.join(store_dir, 'texts-index.jsonl')
+
+        self.records: Dict[str, Tuple[int, int, str]] = dict()  # {news_url: (offset, length, fingerprint)}
+        self.data_file = None
+        self.index_file = None
+        self.size = 0  # The size of the data file, including the records not flushed yet
+        self.mapped: Optional[mmap.mmap] = None
+
+    def load(self):
+        """
+        Reads the index of the store (creating the store files if there aren't any) and opens it for appending.
+
+        Returns:
+            TextStore:
+                The loaded store.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.data_file = open(self.data_path, 'ab')
+        self.size = self.data_file.tell()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as fin:
+                for line in fin:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # The last line of an interrupted write
+                    if record['offset'] + record['length'] > self.size:
+                        break  # The index was written, but not its record
+                    self.records[record['url']] = (record['offset'], record['length'], record['fingerprint'])
+        self.index_file = open(self.index_path, 'a', encoding='utf-8')
+        logging.info(f'Loaded the texts of {len(self.records)} news from {self.data_path}')
+        return self
+
+    def put(self, news_url, news_page_dict, fingerprint):
+        """
+        Stores the texts of a news, unless they are already stored with the same fingerprint.
+
+        Args:
+            news_url (str):
+                The news website URL.
+            news_page_dict (Dict[str, Any]):
+                The news page dict, of format:
+                    {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+            fingerprint (str):
+                The fingerprint of the news page dict.
+        Returns:
+            TextRef:
+                The reference to the stored texts.
+        """
+        record = self.records.get(news_url)
+        if record is None or record[2] != fingerprint:
+            data = json.dumps([news_page_dict['title'], news_page_dict['content'],
+                               news_page_dict['contained_urls']], ensure_ascii=False).encode('utf-8')
+            record = (self.size, len(data), fingerprint)
+            self.data_file.write(data)
+            self.size += len(data)
+            self.index_file.write(json.dumps({'url': news_url, 'offset': record[0], 'length': record[1],
+                                              'fingerprint': fingerprint}) + '\n')
+            self.records[news_url] = record
+        return TextRef(self, record[0], record[1])
+
+    def flush(self):
+        """
+        Writes the appended records to the files (the data before its index).
+        """
+        self.data_file.flush()
+        self.index_file.flush()
+
+    def read(self, offset, length):
+        """
+        Args:
+            offset (int): The offset of the texts record in the data file.
+            length (int): The length of the texts record, in bytes.
+        Returns:
+            Tuple[str, str, Dict[str, str]]: The (title, content, contained_urls) of the news.
+        """
+        if self.mapped is None or offset + length > len(self.mapped):
+            self.__remap()
+        title, content, contained_urls = json.loads(self.mapped[offset: offset + length])
+        return title, content, contained_urls
+
+    def __remap(self):
+        """
+        Memory-maps the data file again, after records were appended to it.
+        """
+        self.flush()
+        if self.mapped is not None:
+            self.mapped.close()
+        with open(self.data_path, 'rb') as fin:
+            self.mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.flush()
+        self.data_file.close()
+        self.index_file.close()
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
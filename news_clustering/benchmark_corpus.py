@@ -0,0 +1,55 @@
+import json
+import random
+import string
+
+
+def make_corpus(articles_cnt, duplicates_ratio, seed):
+    """
+    A synthetic corpus of random articles, with some near-duplicates (a few words changed).
+    """
+    rng = random.Random(seed)
+    # Random words, a shared prefix (like 'word123') would make all the articles share the character shingles
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(20000)]
+    corpus = dict()
+    for i in range(articles_cnt):
+        article = {
+            'title': ' '.join(rng.choices(vocabulary, k=8)),
+            'content': ' '.join(rng.choices(vocabulary, k=rng.randint(200, 800))),
+            'contained_urls': {f'https://example.com/link/{i}': 'link'},
+        }
+        corpus[f'https://example.com/news/{i}'] = article
+        if rng.random() < duplicates_ratio:
+            words = article['content'].split()
+            for _ in range(5):
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            corpus[f'https://syndicated.example.com/news/{i}'] = {**article, 'content': ' '.join(words)}
+    return corpus
+
+
+def make_queries(corpus, queries_cnt, seed):
+    """
+    The near-duplicate queries (whole articles with a few words changed),
+    and the snippet queries (30 to 120 consecutive words of an article, without its title).
+    """
+    rng = random.Random(seed)
+    articles = rng.sample(list(corpus.values()), queries_cnt)
+    duplicates, snippets = [], []
+    for article in articles[:queries_cnt // 2]:
+        words = article['content'].split()
+        words[rng.randrange(len(words))] = 'changed'
+        duplicates.append({**article, 'content': ' '.join(words)})
+    for article in articles[queries_cnt // 2:]:
+        words = article['content'].split()
+        length = rng.randint(30, 120)
+        start = rng.randrange(len(words) - length)
+        snippets.append({'title': '', 'content': ' '.join(words[start: start + length]), 'contained_urls': {}})
+    return duplicates, snippets
+
+
+def write_jsonl_corpus(corpus, path):
+    """
+    Writes the corpus like the crawler's JsonLinesPipeline, so the benchmark loads it the way production does.
+    """
+    with open(path, 'w', encoding='utf-8') as fout:
+        for news_url, article in corpus.items():
+            fout.write(json.dumps({'url': news_url, **article}) + '\n')
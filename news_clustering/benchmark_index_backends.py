@@ -0,0 +1,102 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from news_clustering.api.index_backends import INDEX_BACKENDS, create_index
+from news_clustering.api.signature_matrix import estimate_containment, estimate_set_sizes
+from news_clustering.api.similar_texts import SimilarTexts, calc_signatures, news_page_dict_from_info
+from news_clustering.benchmark_corpus import make_corpus, make_queries
+
+
+def brute_force_truth(backend, similar_texts, signatures, top_k, min_similarity):
+    """
+    The news each backend should find, from the MinHash estimates of the whole database:
+    'lsh' the jaccard similarity at least the threshold, 'forest' the top_k with a similarity at least min_similarity
+    (the random articles share a few shingles), 'ensemble' the containment at least the containment threshold.
+    So the recall is the recall of the index, not of the MinHash estimates.
+    """
+    news_urls = list(similar_texts.signature_matrix.rows.keys())
+    database_signatures = similar_texts.signature_matrix.get_rows(news_urls)
+    sizes = estimate_set_sizes(database_signatures)
+    truth = []
+    for signature in signatures:
+        similarities = np.count_nonzero(database_signatures == signature, axis=1) / similar_texts.num_perm
+        if backend == 'lsh':
+            rows = np.flatnonzero(similarities >= similar_texts.threshold)
+        elif backend == 'forest':
+            # The ties of the top_k-th similarity are all accepted
+            rows = np.flatnonzero(similarities >= max(np.sort(similarities)[-top_k], min_similarity))
+        else:
+            containments = estimate_containment(similarities, estimate_set_sizes(signature), sizes)
+            rows = np.flatnonzero(containments >= similar_texts.containment_threshold)
+        truth.append({news_urls[row] for row in rows})
+    return truth
+
+
+def calc_recall(results, truth, top_k=None):
+    found = sum(len(set(result) & expected) for result, expected in zip(results, truth))
+    expected_cnt = sum(min(len(expected), top_k) if top_k else len(expected) for expected in truth)
+    return round(found / expected_cnt, 4) if expected_cnt else None
+
+
+def benchmark_backend(backend, similar_texts, queries, top_k, min_similarity):
+    entries = [(news_url, news_page.minhash) for news_url, news_page in similar_texts.database.items()]
+    start_time = time.perf_counter()
+    create_index(backend, threshold=similar_texts.threshold, num_perm=similar_texts.num_perm,
+                 containment_threshold=similar_texts.containment_threshold).build(entries)
+    build_time = time.perf_counter() - start_time
+
+    # Measured in a second build, tracemalloc slows down the allocations
+    tracemalloc.start()
+    index = create_index(backend, threshold=similar_texts.threshold, num_perm=similar_texts.num_perm,
+                         containment_threshold=similar_texts.containment_threshold)
+    index.build(entries)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+
+    similar_texts.get_similar_news_batch(queries['duplicates'][:1], backend=backend)  # Builds the index
+    report = {'build_seconds': round(build_time, 3), 'memory_mb': round(memory / 2 ** 20, 2)}
+    for name, news_infos in queries.items():
+        signatures = calc_signatures([news_page_dict_from_info(news_info) for news_info in news_infos],
+                                     similar_texts.shingles_calc, similar_texts.num_perm, similar_texts.minhash_engine)
+        start_time = time.perf_counter()
+        results = similar_texts.get_similar_news_batch(news_infos, signatures=signatures,
+                                                       top_k=top_k if backend == 'forest' else None, backend=backend)
+        query_time = time.perf_counter() - start_time
+        truth = brute_force_truth(backend, similar_texts, signatures, top_k, min_similarity)
+        report[name] = {
+            'query_ms': round(query_time / len(news_infos) * 1000, 3),
+            'candidates_per_query': round(sum(len(result) for result in results) / len(results), 1),
+            'recall': calc_recall(results, truth, top_k if backend == 'forest' else None),
+        }
+    return report
+
+
+if __name__ == '__main__':
+    # Compares the index backends of SimilarTexts (see index_backends.py) on a synthetic corpus
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--duplicates-ratio', type=float, default=0.2)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--min-similarity', type=float, default=0.05)
+    parser.add_argument('--backends', nargs='+', default=list(INDEX_BACKENDS), choices=list(INDEX_BACKENDS))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.articles, args.duplicates_ratio, args.seed)
+    duplicates, snippets = make_queries(corpus, args.queries, args.seed)
+    similar_texts = SimilarTexts(corpus, vectorized_hashing=True).fit_similarity()
+
+    print(json.dumps({
+        'news': len(similar_texts.database),
+        'queries': {'duplicates': len(duplicates), 'snippets': len(snippets)},
+        'backends': {backend: benchmark_backend(backend, similar_texts,
+                                                {'duplicates': duplicates, 'snippets': snippets},
+                                                args.top_k, args.min_similarity)
+                     for backend in args.backends},
+    }, indent=4))
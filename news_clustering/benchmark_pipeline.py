@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import datasketch
+import numpy as np
+
+from news_clustering.api.similar_texts import NewsPage, SimilarTexts
+from news_clustering.benchmark_corpus import make_corpus, make_queries, write_jsonl_corpus
+
+# The metrics are all "lower is better", a metric regresses when it's above its baseline by more than the tolerance
+METRIC_UNITS = {
+    'shingles_ms_per_article': 'ms',
+    'news_page_ms': 'ms',
+    'load_seconds': 's',
+    'fit_similarity_seconds': 's',
+    'query_ms_p50': 'ms',
+    'query_ms_p99': 'ms',
+    'batch_query_ms_per_news': 'ms',
+    'peak_traced_memory_mb': 'MB',
+    'retained_mb_per_100k_news': 'MB',
+    'max_rss_mb': 'MB',
+}
+
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def benchmark_pipeline(args):
+    corpus = make_corpus(args.articles, args.duplicates_ratio, args.seed)
+    duplicates, snippets = make_queries(corpus, min(args.queries, len(corpus)), args.seed)
+    queries = duplicates + snippets
+    similar_texts_kwargs = dict(vectorized_hashing=args.vectorized, workers=args.workers)
+    metrics = dict()
+
+    sample = list(corpus.items())[:args.sample]
+    # The default shingling parameters and hashing of SimilarTexts
+    one_news_texts = SimilarTexts(dict(sample[:1]), **similar_texts_kwargs)
+    shingles_calc, minhash_engine = one_news_texts.shingles_calc, one_news_texts.minhash_engine
+    _, seconds = timed(lambda: [
+        sum(1 for _ in shingles_calc.iter_shingles({**article, 'contained_urls': ''.join(article['contained_urls'])}))
+        for _, article in sample
+    ])
+    metrics['shingles_ms_per_article'] = seconds / len(sample) * 1000
+
+    _, seconds = timed(lambda: [
+        NewsPage(news_url=news_url, news_page_dict=article, shingles_calc=shingles_calc, minhash_engine=minhash_engine)
+        for news_url, article in sample
+    ])
+    metrics['news_page_ms'] = seconds / len(sample) * 1000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results_path = os.path.join(tmp_dir, 'results.jsonl')
+        write_jsonl_corpus(corpus, results_path)
+
+        similar_texts, metrics['load_seconds'] = timed(SimilarTexts, results_path=results_path,
+                                                       **similar_texts_kwargs)
+        _, metrics['fit_similarity_seconds'] = timed(similar_texts.fit_similarity)
+
+        latencies = []
+        for news_info in queries:
+            _, seconds = timed(similar_texts.get_similar_news, None, news_info['title'], news_info['content'],
+                               news_info['contained_urls'])
+            latencies.append(seconds * 1000)
+        metrics['query_ms_p50'] = float(np.percentile(latencies, 50))
+        metrics['query_ms_p99'] = float(np.percentile(latencies, 99))
+
+        start_time = time.perf_counter()
+        for start in range(0, len(queries), args.batch_size):
+            similar_texts.get_similar_news_batch(queries[start: start + args.batch_size])
+        metrics['batch_query_ms_per_news'] = (time.perf_counter() - start_time) / len(queries) * 1000
+        del similar_texts
+
+        # Measured in a second load, tracemalloc slows down the allocations
+        tracemalloc.start()
+        similar_texts = SimilarTexts(results_path=results_path, **similar_texts_kwargs).fit_similarity()
+        retained_memory, metrics['peak_traced_memory_mb'] = (memory / 2 ** 20 for memory in
+                                                              tracemalloc.get_traced_memory())
+        tracemalloc.stop()
+        news_cnt = len(similar_texts.database)
+        # What the fitted SimilarTexts keeps in memory (the corpus is streamed from the JSON Lines file)
+        metrics['retained_mb_per_100k_news'] = retained_memory / news_cnt * 100000
+        del similar_texts
+
+    metrics['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10  # In KB on Linux
+    return news_cnt, {name: round(value, 3) for name, value in metrics.items()}
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    Returns:
+        Dict[str, Dict[str, float]]: The regressed metrics, with their baseline and current values.
+    """
+    if baseline['config'] != report['config']:
+        raise Exception(f'The baseline was measured with another config: {baseline["config"]}')
+    regressions = dict()
+    for name, value in report['metrics'].items():
+        baseline_value = baseline['metrics'].get(name)
+        if baseline_value and value > baseline_value * (1 + tolerance):
+            regressions[name] = {'baseline': baseline_value, 'current': value,
+                                 'change': f'{(value / baseline_value - 1) * 100:+.1f}%'}
+    return regressions
+
+
+if __name__ == '__main__':
+    # Benchmarks the similarity pipeline (shingling, hashing, loading, fitting, querying and memory)
+    # on a synthetic corpus. Save a run with --output, and compare the next ones with --baseline
+    # (the exit code is 1 when a metric regressed), e.g.:
+    #   python -m news_clustering.benchmark_pipeline --output baseline.json
+    #   python -m news_clustering.benchmark_pipeline --baseline baseline.json
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=2000)
+    parser.add_argument('--duplicates-ratio', type=float, default=0.2)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--sample', type=int, default=200, help='The articles shingled and hashed one by one')
+    parser.add_argument('--vectorized', action='store_true', help='Hash with the vectorized MinHashEngine')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='The path the results are saved to (JSON)')
+    parser.add_argument('--baseline', help='The path of saved results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='The accepted slowdown, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    config = {name: getattr(args, name) for name in ('articles', 'duplicates_ratio', 'queries', 'batch_size',
+                                                      'sample', 'vectorized', 'workers', 'seed')}
+    news_cnt, metrics = benchmark_pipeline(args)
+    report = {
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'datasketch': datasketch.__version__,
+            'cpus': os.cpu_count(),
+        },
+        'news': news_cnt,
+        'metrics': metrics,
+        'units': METRIC_UNITS,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'r') as fin:
+            report['regressions'] = compare_with_baseline(report, json.load(fin), args.tolerance)
+    print(json.dumps(report, indent=4))
+    if report.get('regressions'):
+        sys.exit(1)
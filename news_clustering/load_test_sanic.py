@@ -0,0 +1,62 @@
+import argparse
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+def make_news(i, content_words):
+    """
+    A synthetic news query, with a long content (so its hashing is expensive) every 10 news.
+    """
+    words = [f'word{(i * 7919 + j) % 5000}' for j in range(content_words * (10 if i % 10 == 0 else 1))]
+    return {
+        'url': f'https://example.com/news/{i}',
+        'title': f'Synthetic news number {i}',
+        'content': ' '.join(words),
+    }
+
+
+def timed_post(session, url, news):
+    start_time = time.perf_counter()
+    try:
+        status = session.post(url, json=news, timeout=60).status_code
+    except requests.RequestException:
+        status = 'error'
+    return status, time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    # Measures the tail latency of the query endpoint under concurrent load (start main.py first)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000/news_clustering/query')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--content-words', type=int, default=800)
+    args = parser.parse_args()
+
+    all_news = [make_news(i, args.content_words) for i in range(args.requests)]
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda news: timed_post(session, args.url, news), all_news))
+    total_time = time.perf_counter() - start
+
+    latencies = np.array([latency for status, latency in results if status == 200]) * 1000
+    report = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'throughput_rps': round(args.requests / total_time, 2),
+        'statuses': {str(status): cnt for status, cnt in Counter(status for status, _ in results).items()},
+    }
+    if len(latencies):
+        report['latency_ms'] = {
+            f'p{p}': round(float(np.percentile(latencies, p)), 1) for p in (50, 90, 99)
+        }
+        report['latency_ms']['max'] = round(float(latencies.max()), 1)
+    print(json.dumps(report, indent=4))
@@ -2,8 +2,19 @@ from api import handlers
 from sanic import Sanic
 import logging
 
+WORKERS = 2  # The server processes, they share the index built by the main process
+
 app = Sanic('news')
 app.add_route(handlers.query, '/news_clustering/query', methods=['GET', 'POST'])
+app.add_route(handlers.query_batch, '/news_clustering/query_batch', methods=['POST'])
+app.add_route(handlers.cluster, '/news_clustering/cluster', methods=['GET'])
+app.add_route(handlers.ingest, '/news_clustering/ingest', methods=['POST'])
+app.add_route(handlers.stats, '/news_clustering/stats', methods=['GET'])
+app.register_listener(handlers.publish_similar_index, 'main_process_start')
+app.register_listener(handlers.stop_ingestion_publisher, 'main_process_stop')
+app.register_listener(handlers.start_query_executor, 'before_server_start')
+app.register_listener(handlers.stop_query_executor, 'after_server_stop')
+app.register_listener(handlers.stop_ingestion, 'after_server_stop')
 
 if __name__ == '__main__':
     # debug = not getattr(app.config, 'NO_DEBUG', False)
@@ -19,4 +30,4 @@ if __name__ == '__main__':
             ]
         )
 
-    app.run(host='0.0.0.0', port=8000, backlog=5, debug=debug, auto_reload=False)
+    app.run(host='0.0.0.0', port=8000, backlog=100, workers=WORKERS, debug=debug, auto_reload=False)
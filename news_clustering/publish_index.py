@@ -0,0 +1,9 @@
+from api import handlers
+from api.shared_index import publish_index
+import logging
+
+if __name__ == '__main__':
+    # Rebuilds the database from the crawler results, and publishes it as a new index generation.
+    # The running servers switch to it at their next query, without restarting.
+    logging.basicConfig(level=logging.INFO)
+    publish_index(handlers.build_similar_texts(), handlers.INDEX_DIR)
@@ -0,0 +1,169 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+
+from scrapy.utils.project import get_project_settings
+
+from news_crawler.news_url_retriever import get_results, save_results_json
+from news_crawler.pipelines import JSONL_EXTENSIONS, open_jsonl, source_dir_name
+from news_crawler.source_registry import DEFAULT_SOURCES_PATH, get_source_domain, load_sources
+
+SHARD_STATS_KEYS = ('item_scraped_count', 'downloader/response_count', 'log_count/ERROR', 'finish_reason',
+                    'elapsed_time_seconds')
+
+
+def make_shards(sources, shards_cnt):
+    """
+    Splits the sources in shards of about the same size, each crawled by its own process.
+    The sources of a domain are always in the same shard, so two processes never crawl the same site
+    (and share its throttling and frontier rows): the domains are assigned whole, the largest first,
+    each to the smallest shard.
+
+    Args:
+        sources (List[Dict[str, Any]]):
+            The registry sources.
+        shards_cnt (int):
+            The maximum number of shards (there are fewer when there are fewer domains).
+    Returns:
+        List[List[Dict[str, Any]]]:
+            The (non-empty) shards.
+    """
+    domain_sources = defaultdict(list)
+    for source in sorted(sources, key=lambda source: source['name']):
+        domain_sources[get_source_domain(source)].append(source)
+
+    shards = [[] for _ in range(max(1, min(shards_cnt, len(domain_sources))))]
+    for domain in sorted(domain_sources, key=lambda domain: (-len(domain_sources[domain]), domain)):
+        min(shards, key=len).extend(domain_sources[domain])
+    return [shard for shard in shards if shard]
+
+
+def crawl_shard(sources):
+    """
+    Crawls a shard of sources in a CrawlerProcess (in a new process, since a Twisted reactor can't be restarted).
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The main stats of each source, by name.
+    """
+    source_stats, _ = get_results(sources)
+    return {
+        name: {key: stats.get(key) for key in SHARD_STATS_KEYS}
+        for name, stats in source_stats.items()
+    }
+
+
+def list_source_parts(output_dir, sources):
+    """
+    Returns:
+        Dict[str, Set[str]]: The JSON Lines part files of each source (by base URL) in the output directory.
+    """
+    source_parts = dict()
+    for source in sources:
+        source_dir = os.path.join(output_dir, source_dir_name(source['base_url']))
+        source_parts[source['base_url']] = set(
+            os.path.join(source_dir, name) for name in os.listdir(source_dir) if name.startswith('part-')
+        ) if os.path.isdir(source_dir) else set()
+    return source_parts
+
+
+def merge_new_parts(output_dir, sources, parts_before):
+    """
+    Reads the items written by the crawl processes (the part files that weren't there before the crawl).
+
+    Args:
+        output_dir (str):
+            The JSONL_OUTPUT_DIR of the crawl.
+        sources (List[Dict[str, Any]]):
+            The crawled sources.
+        parts_before (Dict[str, Set[str]]):
+            The part files of each source before the crawl (see list_source_parts()).
+    Returns:
+        Dict[str, Dict[str, Dict[str, Any]]]:
+            The results of each source, of format:
+                {base_url: {news_url: {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}}}
+    """
+    compressions = {extension: compression for compression, extension in JSONL_EXTENSIONS.items()}
+    source_results = defaultdict(dict)
+    for base_url, parts in list_source_parts(output_dir, sources).items():
+        for path in sorted(parts - parts_before[base_url]):  # The parts are numbered, the last item of a URL wins
+            compression = compressions.get('.' + os.path.basename(path).split('.', 1)[-1])
+            with open_jsonl(path, 'r', compression) as fin:
+                for line in fin:
+                    if line.strip():
+                        item = json.loads(line)
+                        source_results[base_url][item['url']] = {
+                            key: value for key, value in item.items() if key not in ('url', 'source')
+                        }
+    return source_results
+
+
+def crawl_sources(sources, *, processes=None, shards_cnt=None, results_json_path=None):
+    """
+    Crawls the sources on all the cores: the sources are split in shards, each crawled by a CrawlerProcess
+    in its own process, and at most `processes` shards are crawled at the same time.
+    The processes stream their items to the per-source files of JSONL_OUTPUT_DIR (that news_clustering reads).
+
+    Args:
+        sources (List[Dict[str, Any]]):
+            The registry sources (see source_registry.load_sources()).
+        processes (Optional[int]):
+            The maximum number of crawl processes running at the same time (defaults to the number of CPUs).
+        shards_cnt (Optional[int]):
+            The number of shards (defaults to `processes`). More, smaller shards balance the load better,
+            when some sources are much longer to crawl.
+        results_json_path (Optional[str]):
+            If provided, the items crawled by all the processes are merged in a single sorted JSON, at this path.
+    Returns:
+        Dict[str, Dict[str, Any]]:
+            The main stats of each source, by name (the sources of a failed shard have {'error': str}).
+    """
+    if not sources:
+        return dict()
+    processes = min(processes or os.cpu_count() or 1, len(sources))
+    shards = make_shards(sources, shards_cnt or processes)
+    output_dir = get_project_settings().get('JSONL_OUTPUT_DIR', 'results')
+    parts_before = list_source_parts(output_dir, sources) if results_json_path else None
+
+    start_time = time.time()
+    source_stats = dict()
+    # A new process for each shard (maxtasksperchild=1), since a Twisted reactor can't be restarted
+    with multiprocessing.get_context('spawn').Pool(processes, maxtasksperchild=1) as pool:
+        shard_results = [pool.apply_async(crawl_shard, (shard,)) for shard in shards]
+        for shard, shard_result in zip(shards, shard_results):
+            try:
+                source_stats.update(shard_result.get())
+            except Exception as e:
+                logging.exception(f'Could not crawl the shard of {[source["name"] for source in shard]}')
+                source_stats.update({source['name']: {'error': repr(e)} for source in shard})
+    logging.info(f'Crawled {len(sources)} sources in {len(shards)} shards ({processes} processes) '
+                 f'in {time.time() - start_time: .1f} seconds')
+
+    if results_json_path:
+        save_results_json(merge_new_parts(output_dir, sources, parts_before), results_json_path)
+    return source_stats
+
+
+if __name__ == '__main__':
+    # Crawls the enabled sources of the registry on all the cores, e.g.:
+    #   python -m news_crawler.crawl_scheduler --processes 4 --stats crawl_stats.json
+    #   python -m news_crawler.crawl_scheduler --sources my_sources.yaml --only zyte bitdefender
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', default=DEFAULT_SOURCES_PATH, help='The source registry (JSON or YAML)')
+    parser.add_argument('--only', nargs='+', help='The names of the sources to crawl (even if disabled)')
+    parser.add_argument('--processes', type=int, help='The maximum crawl processes at a time (default: CPUs)')
+    parser.add_argument('--shards', type=int, help='The number of shards (default: --processes)')
+    parser.add_argument('--results-json', help='Also merge the crawled items in a single sorted JSON')
+    parser.add_argument('--stats', help='The path the stats of each source are saved to (JSON)')
+    args = parser.parse_args()
+
+    stats = crawl_sources(load_sources(args.sources, args.only), processes=args.processes, shards_cnt=args.shards,
+                          results_json_path=args.results_json)
+    if args.stats:
+        with open(args.stats, 'w') as fout:
+            json.dump(stats, fout, indent=4, default=str)
+    print(json.dumps(stats, indent=4, default=str))
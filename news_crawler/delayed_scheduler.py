@@ -0,0 +1,75 @@
+import heapq
+import itertools
+import time
+
+from scrapy.core.scheduler import Scheduler
+
+NOT_BEFORE_META_KEY = 'not_before'
+
+
+class DelayedRequestScheduler(Scheduler):
+    """
+    Scheduler that holds the requests with a `not_before` meta (a time.time() timestamp) until that time,
+    e.g. the delayed retries of the CustomRetryMiddleware. They wait here instead of in the downloader,
+    so they don't take the download slots (CONCURRENT_REQUESTS) of the other domains meanwhile.
+    The held requests are pending requests, the spider isn't closed while there are some.
+
+    Stats: scheduler/delayed
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DelayedRequestScheduler, self).__init__(*args, **kwargs)
+        self.delayed = []  # Heap of (not_before, sequence, request)
+        self.sequence = itertools.count()  # So the requests with the same time stay in order (and aren't compared)
+        self.wake_up_call = None
+
+    def __len__(self):
+        return super(DelayedRequestScheduler, self).__len__() + len(self.delayed)
+
+    def enqueue_request(self, request):
+        not_before = request.meta.get(NOT_BEFORE_META_KEY)
+        if not_before is None or not_before <= time.time():
+            return super(DelayedRequestScheduler, self).enqueue_request(request)
+
+        heapq.heappush(self.delayed, (not_before, next(self.sequence), request))
+        self.stats.inc_value('scheduler/delayed', spider=self.spider)
+        self.__schedule_wake_up()
+        return True
+
+    def next_request(self):
+        self.__release_due_requests()
+        return super(DelayedRequestScheduler, self).next_request()
+
+    def close(self, reason):
+        # Queued normally, so they are kept in the disk queue of a paused crawl (with JOBDIR)
+        if self.wake_up_call is not None and self.wake_up_call.active():
+            self.wake_up_call.cancel()
+        while self.delayed:
+            super(DelayedRequestScheduler, self).enqueue_request(heapq.heappop(self.delayed)[2])
+        return super(DelayedRequestScheduler, self).close(reason)
+
+    def __release_due_requests(self):
+        now = time.time()
+        while self.delayed and self.delayed[0][0] <= now:
+            super(DelayedRequestScheduler, self).enqueue_request(heapq.heappop(self.delayed)[2])
+
+    def __schedule_wake_up(self):
+        """
+        Makes the engine ask for the next request when the first held request is due
+        (otherwise, it would only ask at its next heartbeat, up to 5 seconds later).
+        """
+        from twisted.internet import reactor  # Imported here, so the reactor installed by Scrapy is used
+        delay = max(0., self.delayed[0][0] - time.time())
+        if self.wake_up_call is not None and self.wake_up_call.active():
+            if self.wake_up_call.getTime() <= reactor.seconds() + delay:
+                return
+            self.wake_up_call.cancel()
+        self.wake_up_call = reactor.callLater(delay, self.__wake_up)
+
+    def __wake_up(self):
+        self.wake_up_call = None
+        engine = self.crawler.engine if self.crawler is not None else None
+        if engine is not None and engine.slot is not None:
+            engine.slot.nextcall.schedule()
+        if self.delayed:
+            self.__schedule_wake_up()
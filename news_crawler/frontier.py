@@ -0,0 +1,65 @@
+import sqlite3
+
+SQLITE_TIMEOUT = 30  # Seconds a write waits for the other crawl processes to flush theirs
+
+
+class SeenUrlIndex:
+    def __init__(self, path, base_url, commit_every=100):
+        """
+        Disk-backed set of the article URLs already scraped from a source, kept between crawls.
+
+        Args:
+            path (str):
+                The SQLite database path (shared by all the sources).
+            base_url (str):
+                The source the URLs belong to.
+            commit_every (int):
+                After how many additions they are written (they are also written when closing).
+                They are kept in memory until then, and written in one short transaction,
+                so the other sources (and crawl processes) sharing the database aren't locked out meanwhile.
+        Returns:
+            SeenUrlIndex:
+                The opened index
+        """
+        self.base_url = base_url
+        self.connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS seen_urls (
+                base_url TEXT,
+                url TEXT,
+                PRIMARY KEY (base_url, url)
+            ) WITHOUT ROWID
+        ''')
+        self.commit_every = commit_every
+        self.pending_urls = set()
+
+    def __flush(self):
+        if self.pending_urls:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO seen_urls (base_url, url) VALUES (?, ?)',
+                                            [(self.base_url, url) for url in self.pending_urls])
+            self.pending_urls.clear()
+
+    def __contains__(self, url):
+        if url in self.pending_urls:
+            return True
+        return self.connection.execute(
+            'SELECT 1 FROM seen_urls WHERE base_url = ? AND url = ?', (self.base_url, url)
+        ).fetchone() is not None
+
+    def __len__(self):
+        self.__flush()
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM seen_urls WHERE base_url = ?', (self.base_url,)
+        ).fetchone()[0]
+
+    def add(self, url):
+        self.pending_urls.add(url)
+        if len(self.pending_urls) >= self.commit_every:
+            self.__flush()
+
+    def close(self):
+        self.__flush()
+        self.connection.close()
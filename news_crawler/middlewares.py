@@ -2,14 +2,24 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-from time import sleep
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.response import response_status_message
+from twisted.internet.task import LoopingCall
+
+from news_crawler.delayed_scheduler import NOT_BEFORE_META_KEY
 
 
 # class NewsCrawlerSpiderMiddleware:
@@ -106,18 +116,319 @@ from scrapy.utils.response import response_status_message
 #         spider.logger.info('Spider opened: %s' % spider.name)
 
 
+def get_request_domain(request):
+    """
+    Args:
+        request (scrapy.Request): The request.
+    Returns:
+        str: The domain of the page, also for the requests rendered by Splash (that are sent to the Splash server).
+    """
+    splash_url = request.meta.get('splash', {}).get('args', {}).get('url')
+    if splash_url:
+        return urlparse(splash_url).hostname or ''
+    return urlparse_cached(request).hostname or ''
+
+
+def get_retry_after(response):
+    """
+    Args:
+        response (scrapy.http.Response): The response.
+    Returns:
+        Optional[float]: The seconds to wait from the Retry-After header (delay-seconds or HTTP-date), if there is one.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.decode('latin-1').strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0., (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
 class CustomRetryMiddleware(RetryMiddleware):
+    """
+    RetryMiddleware that waits before retrying, without blocking the reactor (so the other downloads go on).
+    The retry request is returned at once, with the time it can be sent at in its `not_before` meta,
+    and the DelayedRequestScheduler (SCHEDULER setting) holds it until then, so it doesn't take a download slot
+    while it waits.
+
+    The delay grows exponentially with the consecutive retryable responses of the domain,
+    starting from the request's `delay_retries_by` meta (or RETRY_DELAY), up to RETRY_MAX_DELAY,
+    with +/- RETRY_JITTER relative jitter. A Retry-After header is honored (also capped by RETRY_MAX_DELAY).
+    Each domain has a retry budget of RETRY_BUDGET_MIN_RETRIES + RETRY_BUDGET_RATIO * responses,
+    so a failing site can't keep the crawl busy with retries.
+
+    Stats: retry/delayed, retry/delay_seconds, retry/delay_seconds/<domain>, retry/retry_after, retry/budget_exhausted
+    """
+
+    def __init__(self, settings, stats=None):
+        super(CustomRetryMiddleware, self).__init__(settings)
+        self.stats = stats
+        self.retry_delay = settings.getfloat('RETRY_DELAY', 0)
+        self.max_delay = settings.getfloat('RETRY_MAX_DELAY', 60)
+        self.jitter = settings.getfloat('RETRY_JITTER', 0.5)
+        self.budget_ratio = settings.getfloat('RETRY_BUDGET_RATIO', 0.2)
+        self.budget_min_retries = settings.getint('RETRY_BUDGET_MIN_RETRIES', 10)
+
+        self.domain_responses = defaultdict(int)
+        self.domain_retries = defaultdict(int)
+        self.domain_failures = defaultdict(int)  # Consecutive retryable responses
+        self.domain_not_before = defaultdict(float)  # The time before which no retry of the domain is sent
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler.settings, crawler.stats)
+        o.crawler = crawler
+        return o
+
+    def __has_retry_budget(self, domain):
+        return self.domain_retries[domain] < self.budget_min_retries + self.budget_ratio * self.domain_responses[domain]
+
+    def __calc_delay(self, request, response, domain):
+        """
+        Calculates how long to wait before retrying, and reserves that time for the domain,
+        so the retries of a domain are spread out instead of all being sent at the same time.
+
+        Returns:
+            Tuple[float, float]: The delay in seconds, and the time.time() the retry can be sent at.
+        """
+        base_delay = request.meta.get('delay_retries_by', self.retry_delay) or 0
+        delay = min(self.max_delay, base_delay * 2 ** (self.domain_failures[domain] - 1))
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            self.stats.inc_value('retry/retry_after')
+            delay = max(delay, min(retry_after, self.max_delay))
+
+        # The next free time of the domain is reserved, so its concurrent retries are spread `delay` apart
+        now = time.time()
+        fire_at = max(now, self.domain_not_before[domain]) + delay
+        self.domain_not_before[domain] = fire_at
+        return fire_at - now, fire_at
 
     def process_response(self, request, response, spider):
         if request.meta.get('dont_retry', False):
             return response
-        if response.status in self.retry_http_codes:
-            reason = response_status_message(response.status)
 
-            delay_s = request.meta.get('delay_retries_by', None)
-            if delay_s:
-                sleep(delay_s)
+        domain = get_request_domain(request)
+        self.domain_responses[domain] += 1
+        if response.status not in self.retry_http_codes:
+            self.domain_failures[domain] = 0
+            return response
+
+        reason = response_status_message(response.status)
+        retry_times = request.meta.get('retry_times', 0) + 1
+        if retry_times > request.meta.get('max_retry_times', self.max_retry_times):
+            return self._retry(request, reason, spider) or response  # Gives up (and logs it) without waiting
+        if not self.__has_retry_budget(domain):
+            self.stats.inc_value('retry/budget_exhausted')
+            spider.logger.debug(f'Not retrying {request}, the retry budget of {domain} is exhausted')
+            return response
+
+        self.domain_failures[domain] += 1
+        self.domain_retries[domain] += 1
+        retry_request = self._retry(request, reason, spider)
+        if retry_request is None:
+            return response
+        delay_s, fire_at = self.__calc_delay(request, response, domain)
+        if delay_s > 0:
+            self.stats.inc_value('retry/delayed')
+            self.stats.inc_value('retry/delay_seconds', delay_s)
+            self.stats.inc_value(f'retry/delay_seconds/{domain}', delay_s)
+            retry_request.meta[NOT_BEFORE_META_KEY] = fire_at
+        return retry_request
+
+
+class DomainThrottle:
+    # One per downloader slot (domain)
+    __slots__ = ('concurrency', 'delay', 'latency', 'error_rate', 'last_decrease', 'responses')
+
+    def __init__(self, concurrency, delay):
+        """
+        The adaptive concurrency and delay of a domain, and the signals they are adjusted from.
 
-            return self._retry(request, reason, spider) or response
+        Args:
+            concurrency (float):
+                The concurrent requests (fractional, so it can grow by less than one request per response).
+            delay (float):
+                The seconds between two requests (when above 0, Scrapy sends a request per delay).
+        Returns:
+            DomainThrottle:
+                The initialized throttle
+        """
+        self.concurrency = concurrency
+        self.delay = delay
+        self.latency = None  # Exponential moving average, in seconds
+        self.error_rate = 0.
+        self.last_decrease = 0.  # The responses of the requests sent before it don't decrease again
+        self.responses = 0  # Since the last stats update
 
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    Sets the concurrency and the download delay of each domain (downloader slot) from its responses, AIMD-style,
+    so the fast sites are crawled faster, and the slow or overloaded ones are backed off.
+
+    Each domain starts at CONCURRENT_REQUESTS_PER_DOMAIN and DOWNLOAD_DELAY (or the spider's
+    max_concurrent_requests and download_delay). Then, for each response:
+        - Additive increase, while the latency (moving average) is under the target and the error rate under
+          ADAPTIVE_MAX_ERROR_RATE: the delay decreases by ADAPTIVE_DELAY_STEP down to the minimum delay,
+          then the concurrency grows by one request per window of `concurrency` responses, up to the maximum.
+        - Multiplicative decrease, on 429/503 responses, download errors (e.g. timeouts), a latency over the target
+          or too many 5xx responses: the concurrency is halved down to the minimum, then the delay is doubled
+          (at least ADAPTIVE_DELAY_STEP * 10) up to the maximum. A Retry-After raises the delay to it.
+          Only the responses of the requests sent after the last decrease decrease again.
+    The latency of the rendered (Splash or Playwright) responses includes the rendering, it's not compared.
+
+    The limits are the ADAPTIVE_* settings, a spider can declare its own as attributes (or process.crawl() arguments):
+    min_concurrency, max_concurrency, min_download_delay, max_download_delay and target_latency.
+
+    Stats (updated every ADAPTIVE_STATS_INTERVAL seconds, also logged):
+        adaptive/<domain>/concurrency, adaptive/<domain>/delay, adaptive/<domain>/latency,
+        adaptive/<domain>/responses_per_minute, adaptive/decreases
+    """
+    LATENCY_SMOOTHING = 0.3  # The weight of the last response in the moving averages
+    RENDER_META_KEYS = ('splash', 'playwright')
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = settings.getint('ADAPTIVE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('ADAPTIVE_MAX_CONCURRENCY', 8)
+        self.min_delay = settings.getfloat('ADAPTIVE_MIN_DELAY', 0.)
+        self.max_delay = settings.getfloat('ADAPTIVE_MAX_DELAY', 60.)
+        self.delay_step = settings.getfloat('ADAPTIVE_DELAY_STEP', 0.05)
+        self.target_latency = settings.getfloat('ADAPTIVE_TARGET_LATENCY', 3.)
+        self.max_error_rate = settings.getfloat('ADAPTIVE_MAX_ERROR_RATE', 0.1)
+        self.stats_interval = settings.getfloat('ADAPTIVE_STATS_INTERVAL', 60.)
+
+        self.throttles = dict()  # {slot key: DomainThrottle}
+        self.stats_task = None
+        self.stats_time = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_opened(self, spider):
+        self.min_concurrency = getattr(spider, 'min_concurrency', self.min_concurrency)
+        self.max_concurrency = getattr(spider, 'max_concurrency', self.max_concurrency)
+        self.min_delay = getattr(spider, 'min_download_delay', self.min_delay)
+        self.max_delay = getattr(spider, 'max_download_delay', self.max_delay)
+        self.target_latency = getattr(spider, 'target_latency', self.target_latency)
+        self.stats_time = time.time()
+        self.stats_task = LoopingCall(self.update_stats, spider)
+        self.stats_task.start(self.stats_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.stats_task is not None and self.stats_task.running:
+            self.stats_task.stop()
+        self.update_stats(spider)
+
+    def __get_slot(self, request):
+        """
+        Returns:
+            Tuple[Optional[str], Optional[Slot]]: The downloader slot of a downloaded request, and its key.
+        """
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def __get_throttle(self, key, slot):
+        throttle = self.throttles.get(key)
+        if throttle is None:
+            throttle = self.throttles[key] = DomainThrottle(
+                min(max(slot.concurrency, self.min_concurrency), self.max_concurrency),
+                min(max(slot.delay, self.min_delay), self.max_delay))
+        return throttle
+
+    def __increase(self, throttle):
+        if throttle.delay > self.min_delay:
+            throttle.delay = max(self.min_delay, throttle.delay - self.delay_step)
+        else:
+            throttle.concurrency = min(self.max_concurrency, throttle.concurrency + 1 / throttle.concurrency)
+
+    def __decrease(self, throttle, request, retry_after=None):
+        if request.meta.get('adaptive_sent_at', 0.) >= throttle.last_decrease:
+            throttle.last_decrease = time.time()
+            self.stats.inc_value('adaptive/decreases')
+            if throttle.concurrency > self.min_concurrency:
+                throttle.concurrency = max(self.min_concurrency, throttle.concurrency / 2)
+            else:
+                throttle.delay = min(self.max_delay, max(throttle.delay * 2, self.delay_step * 10))
+        if retry_after is not None:
+            throttle.delay = max(throttle.delay, min(retry_after, self.max_delay))
+
+    @staticmethod
+    def __apply(throttle, slot):
+        slot.concurrency = max(1, int(throttle.concurrency))
+        slot.delay = throttle.delay
+
+    def __update(self, request, error, retry_after=None, congested=False):
+        """
+        Adjusts the slot of a downloaded request.
+
+        Args:
+            request (scrapy.Request):
+                The request.
+            error (bool):
+                Did the download fail (an exception or a 5xx/429 response)?
+            retry_after (Optional[float]):
+                The seconds to wait from the Retry-After header.
+            congested (bool):
+                Is it an explicit overload signal (429/503 or a download exception)?
+        """
+        key, slot = self.__get_slot(request)
+        if slot is None:
+            return  # Not downloaded (e.g. a cached response)
+        throttle = self.__get_throttle(key, slot)
+        throttle.responses += 1
+        throttle.error_rate += self.LATENCY_SMOOTHING * (error - throttle.error_rate)
+        latency = request.meta.get('download_latency')
+        if latency is not None and not any(request.meta.get(meta_key) for meta_key in self.RENDER_META_KEYS):
+            throttle.latency = latency if throttle.latency is None else \
+                throttle.latency + self.LATENCY_SMOOTHING * (latency - throttle.latency)
+
+        if (congested or throttle.error_rate > self.max_error_rate or
+                (throttle.latency is not None and throttle.latency > self.target_latency)):
+            self.__decrease(throttle, request, retry_after)
+        elif not error:
+            self.__increase(throttle)
+        self.__apply(throttle, slot)
+
+    def process_request(self, request, spider):
+        request.meta['adaptive_sent_at'] = time.time()
+
+    def process_response(self, request, response, spider):
+        congested = response.status in (429, 503)
+        self.__update(request, error=congested or response.status >= 500,
+                      retry_after=get_retry_after(response) if congested else None, congested=congested)
         return response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, IgnoreRequest):
+            self.__update(request, error=True, congested=True)
+
+    def update_stats(self, spider):
+        """
+        Sets (and logs) the current concurrency, delay, latency and rate of each domain.
+        """
+        now = time.time()
+        minutes = max(now - self.stats_time, 1e-6) / 60
+        self.stats_time = now
+        for key, throttle in self.throttles.items():
+            rate = throttle.responses / minutes
+            throttle.responses = 0
+            self.stats.set_value(f'adaptive/{key}/concurrency', int(throttle.concurrency))
+            self.stats.set_value(f'adaptive/{key}/delay', round(throttle.delay, 3))
+            self.stats.set_value(f'adaptive/{key}/latency', round(throttle.latency or 0., 3))
+            self.stats.set_value(f'adaptive/{key}/responses_per_minute', round(rate, 1))
+            spider.logger.info(f'{key}: {rate: .1f} responses/min, concurrency {int(throttle.concurrency)}, '
+                               f'delay {throttle.delay: .2f}s, latency {throttle.latency or 0.: .2f}s')
@@ -11,93 +11,83 @@ from scrapy.signalmanager import dispatcher
 
 from news_crawler import misc
 from news_crawler.misc import sort_dict_by_keys
-from news_crawler.spiders.blog_spider import BlogSpider
+from news_crawler.source_registry import add_sources_to_process, load_sources
 
 # TODO-URGENT: Do something about JavaScript loaded webpages
 # docker pull scrapinghub/splash
 # docker run -p 8050:8050 scrapinghub/splash
 # docker run -it -p 8050:8050 scrapinghub/splash --max-timeout 3600
 
-# TODO: Use https://doc.scrapy.org/en/latest/topics/autothrottle.html
 
-
-def get_results(*add_to_process_functions):
-    # Init results
-    temp_results = defaultdict(dict)
-
-    def crawler_results(signal, sender, item, response, spider):
-        url = item.pop('url')
-        temp_results[spider.base_url][url] = {  # Unique by url
-            **item
-        }
-
-    dispatcher.connect(crawler_results, signal=signals.item_scraped)
-
-    # Init and start process
-    process = CrawlerProcess(get_project_settings())
-    for add_to_process_func in add_to_process_functions:
-        add_to_process_func(process)
-    process.start()  # the script will block here until the crawling is finished
-
-    # Preprocess results
+def save_results_json(source_results, results_json_path):
+    """
+    Saves the results as a single JSON, sorted by source and by news URL.
+
+    Args:
+        source_results (Dict[str, Dict[str, Dict[str, Any]]]):
+            The results of each source, of format:
+                {base_url: {news_url: {'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}}}
+        results_json_path (str):
+            The path of the JSON.
+    Returns:
+        Dict[str, Dict[str, Any]]:
+            The saved results, of format:
+                {base_url: {'Cnt': int, 'results': {news_url: news_page_dict}}}
+    """
     results = {
         source: {
             "Cnt": len(res_dict),
             "results": misc.sort_dict_by_keys(res_dict)
         }
-        for source, res_dict in temp_results.items()
+        for source, res_dict in source_results.items()
     }
     results = sort_dict_by_keys(results)
-    del temp_results
 
-    # Save and return results
-    with open("results.json", "w") as fout:
+    with open(results_json_path, "w") as fout:
         json.dump(results, fout, indent=4)
     return results
 
 
-# def __add_bitdefender_scrollable_to_process(process):
-#     process.crawl(ScrollableSpider,
-#                   base_url="https://www.bitdefender.com/blog/labs/",
-#                   article_locator_query=".article-thumb__link")
-
-
-def add_bitdefender_to_process(process):
-    process.crawl(BlogSpider,
-                  base_url="https://www.bitdefender.com/blog/labs/tag/antimalware-research/",
-                  article_locator_query=".article-thumb__link",
-                  content_locator_query_list="div.col-lg-8 > div.single-post__content.mb-5",
-                  next_locator_query="a.button-view-all.button-view-all--tags.d-inline-block.mx-2",
-                  next_contains_text='›')
-
+def get_results(sources, results_json_path=None):
+    """
+    Crawls the sources in this process. The items are streamed by the JsonLinesPipeline to JSONL_OUTPUT_DIR
+    while crawling. To crawl many sources on all the cores, see crawl_scheduler.crawl_sources().
+
+    Args:
+        sources (List[Dict[str, Any]]):
+            The sources to crawl, from the source registry (see source_registry.load_sources()).
+        results_json_path (Optional[str]):
+            If provided, the results are also kept in memory and saved as a single sorted JSON, at this path.
+    Returns:
+        Tuple[Dict[str, Dict[str, Any]], Optional[Dict[str, Dict[str, Any]]]]:
+            The stats of each source (by name), and the results, only if results_json_path was provided.
+    """
+    # Init results
+    temp_results = defaultdict(dict)
 
-def add_zyte_results_to_process(process):
-    process.crawl(BlogSpider,
-                  base_url="https://www.zyte.com/blog/",
-                  article_locator_query=".oxy-post-title",
-                  content_locator_query_list="div#div_block-73-674.ct-div-block > div#blog-body.ct-text-block",
-                  next_locator_query="a.next")
+    def crawler_results(signal, sender, item, response, spider):
+        temp_results[spider.base_url][item['url']] = {  # Unique by url
+            key: value for key, value in item.items() if key != 'url'
+        }
 
+    if results_json_path:
+        dispatcher.connect(crawler_results, signal=signals.item_scraped)
 
-def add_tomsguide_results_to_process(process):
-    process.crawl(BlogSpider,
-                  base_url="https://www.tomsguide.com/news/archive/",
-                  article_locator_query="li.day-article > a[href]",
-                  content_locator_query_list="section.content-wrapper > div#article-body",
-                  next_locator_query="ul.smaller.indented.basic-list > li > ul > li > a")
+    # Init and start process
+    process = CrawlerProcess(get_project_settings())
+    crawlers = add_sources_to_process(process, sources)
+    process.start()  # the script will block here until the crawling is finished
+    source_stats = {name: crawler.stats.get_stats() for name, crawler in crawlers.items()}
 
+    if not results_json_path:
+        return source_stats, None
 
-# def add_custom_tomsguide_results_to_process(process):
-#     process.crawl(BlogSpider,
-#                   base_url="https://www.tomsguide.com/news/archive/2008/11",
-#                   article_locator_query="li.day-article > a[href]",
-#                   content_locator_query_list="section.content-wrapper > div#article-body",
-#                   next_locator_query="ul.smaller.indented.basic-list > li > ul > li > a")
+    # Save and return results
+    results = save_results_json(temp_results, results_json_path)
+    del temp_results
+    return source_stats, results
 
 
 if __name__ == '__main__':
-    get_results(
-        add_bitdefender_to_process,
-        # add_tomsguide_results_to_process,  # TODO: Remove text from 'aside' tags
-        add_zyte_results_to_process,
-    )
+    # Crawls the enabled sources of the registry in this process (see crawl_scheduler for many sources)
+    get_results(load_sources())
@@ -2,12 +2,267 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-
+import gzip
+import json
+import logging
+import os
+import re
+from io import BytesIO
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.internet.task import deferLater
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool, readBody
+from twisted.web.http_headers import Headers
+
+logger = logging.getLogger(__name__)
+
+non_alnum_re = re.compile(r'[^A-Za-z0-9]+')
+
+JSONL_EXTENSIONS = {
+    None: '.jsonl',
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
 
 
 class NewsCrawlerPipeline:
     def process_item(self, item, spider):
         return item
+
+
+def source_dir_name(base_url):
+    """
+    Args:
+        base_url (str): The base URL of a source (spider).
+    Returns:
+        str: The name of the directory where the results of the source are written.
+    """
+    return non_alnum_re.sub('_', base_url.split('://', 1)[-1]).strip('_')
+
+
+def open_jsonl(path, mode, compression=None):
+    """
+    Opens a (possibly compressed) JSON Lines file in text mode.
+
+    Args:
+        path (str): The file path.
+        mode (str): 'r', 'w' or 'a'.
+        compression (Optional[str]): None, 'gzip' or 'zstd'.
+    Returns:
+        TextIO: The opened file.
+    """
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        import zstandard  # Optional dependency, only needed for zstd compression
+        return zstandard.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class JsonLinesPipeline:
+    """
+    Appends the scraped items to per-source JSON Lines files, as soon as they are scraped,
+    instead of keeping the whole crawl in memory.
+    The files are rotated every JSONL_ROTATE_ITEMS items, and the closed parts can be used while the crawl goes on.
+
+    Layout: JSONL_OUTPUT_DIR/<source_dir_name(spider.base_url)>/part-00000.jsonl[.gz|.zst]
+    Each line is: {'source': base_url, 'url': str, 'title': str, 'content': str, 'contained_urls': {URL: URL_TITLE}}
+    """
+
+    def __init__(self, output_dir, compression=None, rotate_items=10000):
+        if compression not in JSONL_EXTENSIONS:
+            raise Exception(f"Unknown JSONL_COMPRESSION {compression!r}, use one of {list(JSONL_EXTENSIONS)}")
+
+        self.output_dir = output_dir
+        self.compression = compression
+        self.rotate_items = rotate_items
+
+        self.files = dict()  # {base_url: opened file}
+        self.part_indexes = dict()  # {base_url: current part index}
+        self.part_items = dict()  # {base_url: items written in the current part}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(output_dir=crawler.settings.get('JSONL_OUTPUT_DIR', 'results'),
+                   compression=crawler.settings.get('JSONL_COMPRESSION') or None,
+                   rotate_items=crawler.settings.getint('JSONL_ROTATE_ITEMS', 10000))
+
+    def __source_dir(self, base_url):
+        return os.path.join(self.output_dir, source_dir_name(base_url))
+
+    def __open_next_part(self, base_url):
+        """
+        Closes the current part of the source (if any), and opens the next one.
+        The part numbering continues after the existing files, so older crawls are never overwritten.
+        """
+        if base_url in self.files:
+            self.files.pop(base_url).close()
+            part_index = self.part_indexes[base_url] + 1
+        else:
+            source_dir = self.__source_dir(base_url)
+            os.makedirs(source_dir, exist_ok=True)
+            existing = [int(name[len('part-'):].split('.')[0])
+                        for name in os.listdir(source_dir) if name.startswith('part-')]
+            part_index = max(existing, default=-1) + 1
+
+        path = os.path.join(self.__source_dir(base_url),
+                            f'part-{part_index:05d}{JSONL_EXTENSIONS[self.compression]}')
+        self.files[base_url] = open_jsonl(path, 'w', self.compression)
+        self.part_indexes[base_url] = part_index
+        self.part_items[base_url] = 0
+
+    def process_item(self, item, spider):
+        base_url = spider.base_url
+        if base_url not in self.files or (self.rotate_items and self.part_items[base_url] >= self.rotate_items):
+            self.__open_next_part(base_url)
+
+        fout = self.files[base_url]
+        fout.write(json.dumps({'source': base_url, **ItemAdapter(item).asdict()}) + '\n')
+        if self.compression is None:
+            fout.flush()
+        self.part_items[base_url] += 1
+        return item
+
+    def close_spider(self, spider):
+        fout = self.files.pop(spider.base_url, None)
+        if fout is not None:
+            fout.close()
+
+
+class IngestPipeline:
+    """
+    Pushes the scraped items to the running news_clustering service (its ingest endpoint) in batches,
+    so they can be found as similar news seconds after they are scraped, instead of after the next service start.
+    A batch is sent when it has INGEST_BATCH_SIZE items, or INGEST_MAX_DELAY seconds after its first item.
+    The rejected batches (503, the service has too many pending news) and the failed sends are retried
+    with exponential backoff (honoring Retry-After), at most INGEST_MAX_RETRIES times; then the batch is dropped
+    (its items are still in the JSON Lines results, which the service loads at its next start).
+    While INGEST_MAX_PENDING_ITEMS items aren't sent, the item processing waits (backpressure on the crawl).
+
+    Stats: ingest/sent_items, ingest/retries, ingest/dropped_items
+    """
+
+    def __init__(self, ingest_url, stats, batch_size=100, max_delay=2.0, max_pending_items=2000, max_retries=5,
+                 retry_delay=1.0, max_retry_delay=30.0, timeout=30.0):
+        self.ingest_url = ingest_url.encode('utf-8')
+        self.stats = stats
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending_items = max_pending_items
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.timeout = timeout
+
+        self.batch = []
+        self.pending_items = 0  # The items in the batch or being sent
+        self.send_call = None  # The delayed call that sends the batch
+        self.sends = set()  # The Deferreds of the batches being sent
+        self.waiters = []  # The Deferreds of the items waiting for the pending items to drop (backpressure)
+        self.reactor = None
+        self.pool = None
+        self.agent = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.get('INGEST_URL'):
+            raise NotConfigured
+        return cls(settings.get('INGEST_URL'), crawler.stats,
+                   batch_size=settings.getint('INGEST_BATCH_SIZE', 100),
+                   max_delay=settings.getfloat('INGEST_MAX_DELAY', 2.0),
+                   max_pending_items=settings.getint('INGEST_MAX_PENDING_ITEMS', 2000),
+                   max_retries=settings.getint('INGEST_MAX_RETRIES', 5),
+                   retry_delay=settings.getfloat('INGEST_RETRY_DELAY', 1.0),
+                   max_retry_delay=settings.getfloat('INGEST_MAX_RETRY_DELAY', 30.0),
+                   timeout=settings.getfloat('INGEST_TIMEOUT', 30.0))
+
+    def open_spider(self, spider):
+        from twisted.internet import reactor  # Imported here, so the reactor installed by Scrapy is used
+        self.reactor = reactor
+        self.pool = HTTPConnectionPool(reactor)  # Keeps the connections to the service alive between the batches
+        self.agent = Agent(reactor, connectTimeout=self.timeout, pool=self.pool)
+
+    async def process_item(self, item, spider):
+        while self.pending_items >= self.max_pending_items:
+            waiter = Deferred()
+            self.waiters.append(waiter)
+            await maybe_deferred_to_future(waiter)
+
+        item_dict = ItemAdapter(item).asdict()
+        if item_dict.get('url'):
+            self.batch.append({key: item_dict.get(key) for key in ('url', 'title', 'content', 'contained_urls')})
+            self.pending_items += 1
+            if len(self.batch) >= self.batch_size:
+                self.__send_batch()
+            elif self.send_call is None:
+                self.send_call = self.reactor.callLater(self.max_delay, self.__send_batch)
+        return item
+
+    def __send_batch(self):
+        if self.send_call is not None and self.send_call.active():
+            self.send_call.cancel()
+        self.send_call = None
+        batch, self.batch = self.batch, []
+        if batch:
+            sending = deferred_from_coro(self.__send(batch))
+            self.sends.add(sending)
+            sending.addBoth(lambda _: self.sends.discard(sending))
+
+    async def __post(self, body):
+        """
+        Returns:
+            Tuple[int, Optional[float]]: The response status, and its Retry-After seconds (if any).
+        """
+        request = self.agent.request(b'POST', self.ingest_url, Headers({'Content-Type': ['application/json']}),
+                                     FileBodyProducer(BytesIO(body)))
+        request.addTimeout(self.timeout, self.reactor)
+        response = await maybe_deferred_to_future(request)
+        await maybe_deferred_to_future(readBody(response))
+        retry_after = response.headers.getRawHeaders('Retry-After')
+        try:
+            return response.code, float(retry_after[0]) if retry_after else None
+        except ValueError:
+            return response.code, None
+
+    async def __send(self, batch):
+        body = json.dumps(batch).encode('utf-8')
+        retry_after = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    delay_s = min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1))
+                    delay_s = max(delay_s, min(retry_after or 0, self.max_retry_delay))
+                    self.stats.inc_value('ingest/retries')
+                    await maybe_deferred_to_future(deferLater(self.reactor, delay_s, lambda: None))
+                try:
+                    status, retry_after = await self.__post(body)
+                except Exception as e:
+                    reason, retry_after = repr(e), None
+                    continue
+                if status == 202:
+                    self.stats.inc_value('ingest/sent_items', len(batch))
+                    return
+                reason = f'HTTP {status}'
+                if status < 500:
+                    break  # An invalid or too large batch, it can't succeed when retried
+            logger.warning(f'Could not ingest {len(batch)} items ({reason}), they are only in the results files')
+            self.stats.inc_value('ingest/dropped_items', len(batch))
+        finally:
+            self.pending_items -= len(batch)
+            waiters, self.waiters = self.waiters, []
+            for waiter in waiters:
+                waiter.callback(None)
+
+    def close_spider(self, spider):
+        """
+        Sends the last batch, and waits for all the batches to be sent (or dropped).
+        """
+        self.__send_batch()
+        closing = DeferredList(list(self.sends))
+        closing.addBoth(lambda _: self.pool.closeCachedConnections())
+        return closing
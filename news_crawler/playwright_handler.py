@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.http import HtmlResponse
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+
+logger = logging.getLogger(__name__)
+
+# Records the time of the last DOM mutation, so we know when the page stopped changing after a scroll
+OBSERVE_MUTATIONS_SCRIPT = """
+() => {
+    window.__lastMutationAt = Date.now();
+    window.__scrolledAt = 0;
+    new MutationObserver(() => { window.__lastMutationAt = Date.now(); })
+        .observe(document.documentElement, {childList: true, subtree: true});
+}
+"""
+SCROLL_SCRIPT = """
+() => {
+    window.__scrolledAt = Date.now();
+    window.scrollBy(0, document.documentElement.scrollHeight);
+}
+"""
+QUIET_FOR_SCRIPT = "() => Date.now() - Math.max(window.__lastMutationAt, window.__scrolledAt)"
+# The body is the decoded page content, so these headers of the network response don't describe it
+# (HttpCompressionMiddleware would try to decompress the plain HTML)
+DECODED_BODY_DROPPED_HEADERS = ('content-encoding', 'content-length')
+
+
+class BrowserPool:
+    """
+    One headless Chromium per process, shared by the PlaywrightDownloadHandlers of all the crawlers
+    (so the spiders of a CrawlerProcess use the same warm browser), with a cap on the concurrently open pages.
+    The browser is started at the first request, and closed when the last handler is closed.
+    """
+
+    def __init__(self):
+        self.handlers_cnt = 0
+        self.max_pages = None
+        self.blocked_resource_types = frozenset()
+
+        self._lock = None
+        self._pages_semaphore = None
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    def register(self, settings):
+        self.handlers_cnt += 1
+        if self.max_pages is None:
+            self.max_pages = settings.getint('PLAYWRIGHT_MAX_PAGES', 4)
+            self.blocked_resource_types = frozenset(settings.getlist('PLAYWRIGHT_BLOCKED_RESOURCE_TYPES'))
+
+    async def __block_resources(self, route):
+        if route.request.resource_type in self.blocked_resource_types:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def __ensure_started(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._pages_semaphore = asyncio.Semaphore(self.max_pages)
+        async with self._lock:
+            if self._context is not None:
+                return
+            from playwright.async_api import async_playwright  # Optional dependency, only for rendered requests
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch()
+            self._context = await self._browser.new_context()
+            if self.blocked_resource_types:
+                await self._context.route('**/*', self.__block_resources)
+            logger.info(f'Started the headless browser (max {self.max_pages} pages)')
+
+    async def new_page(self):
+        """
+        Waits for a free page slot, and opens a page. The page must be given back with close_page().
+        """
+        await self.__ensure_started()
+        await self._pages_semaphore.acquire()
+        try:
+            return await self._context.new_page()
+        except Exception:
+            self._pages_semaphore.release()
+            raise
+
+    async def close_page(self, page):
+        try:
+            await page.close()
+        finally:
+            self._pages_semaphore.release()
+
+    async def release(self):
+        self.handlers_cnt -= 1
+        if self.handlers_cnt > 0 or self._playwright is None:
+            return
+        if self._browser is not None:
+            await self._browser.close()
+        await self._playwright.stop()
+        self._playwright = self._browser = self._context = None
+        logger.info('Closed the headless browser')
+
+
+browser_pool = BrowserPool()
+
+
+class PlaywrightDownloadHandler:
+    """
+    Download handler that renders the requests with meta {'playwright': True} in the shared headless browser,
+    and downloads all the other requests with the default HTTP handler.
+    Needs the asyncio Twisted reactor.
+
+    Request meta:
+        playwright (bool):
+            Render the request in the browser.
+        playwright_scroll (Optional[Dict[str, Any]]):
+            Scroll down while new content is loaded, of format:
+                {'item_selector': CSS_QUERY, 'max_scrolls': int}
+            Scrolling stops when a scroll doesn't add new items matching item_selector.
+    """
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        self.http_handler = HTTP11DownloadHandler(settings, crawler)
+        self.navigation_timeout_ms = settings.getfloat('PLAYWRIGHT_NAVIGATION_TIMEOUT', 60) * 1000
+        self.scroll_settle_s = settings.getfloat('PLAYWRIGHT_SCROLL_SETTLE', 1.5)
+        self.scroll_timeout_s = settings.getfloat('PLAYWRIGHT_SCROLL_TIMEOUT', 30)
+        browser_pool.register(settings)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def download_request(self, request, spider):
+        if not request.meta.get('playwright'):
+            return self.http_handler.download_request(request, spider)
+        return deferred_from_coro(self.__download_rendered(request))
+
+    async def __download_rendered(self, request):
+        page = await browser_pool.new_page()
+        try:
+            pw_response = await page.goto(request.url, wait_until='domcontentloaded',
+                                          timeout=self.navigation_timeout_ms)
+
+            scroll = request.meta.get('playwright_scroll')
+            if scroll:
+                await self.__scroll_until_settled(page,
+                                                  item_selector=scroll['item_selector'],
+                                                  max_scrolls=scroll.get('max_scrolls', 100))
+
+            body = await page.content()
+            headers = None
+            if pw_response:
+                headers = {name: value for name, value in (await pw_response.all_headers()).items()
+                           if name.lower() not in DECODED_BODY_DROPPED_HEADERS}
+            return HtmlResponse(url=page.url,
+                                status=pw_response.status if pw_response else 200,
+                                headers=headers,
+                                body=body,
+                                encoding='utf-8',
+                                request=request,
+                                flags=['playwright'])
+        finally:
+            await browser_pool.close_page(page)
+
+    @staticmethod
+    def __track_requests(page):
+        """
+        Counts the requests of the page that are still loading.
+
+        Returns:
+            Dict[str, int]: {'in_flight': int}, updated while the page loads.
+        """
+        counter = {'in_flight': 0}
+
+        def started(_):
+            counter['in_flight'] += 1
+
+        def finished(_):
+            counter['in_flight'] -= 1
+
+        page.on('request', started)
+        page.on('requestfinished', finished)
+        page.on('requestfailed', finished)
+        return counter
+
+    async def __wait_settled(self, page, requests_counter):
+        """
+        Waits until there are no requests in flight and the DOM didn't change for PLAYWRIGHT_SCROLL_SETTLE seconds
+        (or until PLAYWRIGHT_SCROLL_TIMEOUT, for pages that never settle).
+        """
+        settle_ms = self.scroll_settle_s * 1000
+        deadline = time.monotonic() + self.scroll_timeout_s
+        while time.monotonic() < deadline:
+            if requests_counter['in_flight'] <= 0 and await page.evaluate(QUIET_FOR_SCRIPT) >= settle_ms:
+                return
+            await asyncio.sleep(0.1)
+        logger.debug(f'{page.url} did not settle in {self.scroll_timeout_s}s')
+
+    async def __scroll_until_settled(self, page, item_selector, max_scrolls):
+        requests_counter = self.__track_requests(page)
+        await page.evaluate(OBSERVE_MUTATIONS_SCRIPT)
+
+        old_count = await page.locator(item_selector).count()
+        for _ in range(max_scrolls):
+            await page.evaluate(SCROLL_SCRIPT)
+            await self.__wait_settled(page, requests_counter)
+
+            count = await page.locator(item_selector).count()
+            logger.debug(f'{page.url}: {count} items after scrolling')
+            if count == old_count:
+                break
+            old_count = count
+
+    def close(self):
+        return deferred_from_coro(self.__close())
+
+    async def __close(self):
+        await browser_pool.release()
+        await maybe_deferred_to_future(self.http_handler.close())
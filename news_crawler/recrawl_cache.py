@@ -0,0 +1,231 @@
+import json
+import sqlite3
+import time
+import zlib
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from itemadapter import ItemAdapter
+
+SQLITE_TIMEOUT = 30  # Seconds a write waits for the other crawl processes to flush theirs
+CACHE_URL_META_KEY = 'recrawl_cache_url'  # The URL first requested, kept by the redirected requests
+
+
+class RecrawlCacheStore:
+    _opened = dict()  # {path: RecrawlCacheStore}, so the middleware and the pipelines share a connection
+
+    def __init__(self, path, commit_every=100):
+        """
+        SQLite store of the validators (ETag/Last-Modified), compressed bodies and parsed items of the crawled URLs.
+        One file for the whole cache, instead of one file per response.
+
+        Args:
+            path (str):
+                The SQLite database path.
+            commit_every (int):
+                After how many writes they are written (they are also written when closing).
+                They are kept in memory until then, and written in one short transaction,
+                so the other crawl processes sharing the database aren't locked out meanwhile
+                (a response read before its write is just requested again without validators).
+        Returns:
+            RecrawlCacheStore:
+                The opened store
+        """
+        self.connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                body BLOB,
+                item TEXT,
+                updated_at REAL
+            )
+        ''')
+        self.path = path
+        self.commit_every = commit_every
+        self.pending_writes = []  # The (statement, parameters) not written yet
+        self.users_cnt = 0
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens the store of a path, or returns the already opened one. Every open() must be matched by a close().
+
+        Args:
+            path (str): The SQLite database path.
+        Returns:
+            RecrawlCacheStore: The store.
+        """
+        if path not in cls._opened:
+            cls._opened[path] = cls(path)
+        store = cls._opened[path]
+        store.users_cnt += 1
+        return store
+
+    def __write(self, statement, parameters):
+        self.pending_writes.append((statement, parameters))
+        if len(self.pending_writes) >= self.commit_every:
+            self.__flush()
+
+    def __flush(self):
+        if self.pending_writes:
+            with self.connection:
+                for statement, parameters in self.pending_writes:
+                    self.connection.execute(statement, parameters)
+            self.pending_writes.clear()
+
+    def get(self, url):
+        """
+        Args:
+            url (str): The URL.
+        Returns:
+            Optional[Dict[str, Any]]: The cached entry, of format:
+                {'etag': str, 'last_modified': str, 'headers': Dict[str, List[str]], 'body': bytes,
+                'item': Optional[Dict[str, Any]]}
+        """
+        row = self.connection.execute(
+            'SELECT etag, last_modified, headers, body, item FROM responses WHERE url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, headers, body, item = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'headers': json.loads(headers),
+            'body': zlib.decompress(body),
+            'item': json.loads(item) if item else None,
+        }
+
+    def put_response(self, url, etag, last_modified, headers, body):
+        """
+        Stores the validators and the body of a response. The stored item of the URL is dropped, as it's outdated.
+        """
+        self.__write('''
+            INSERT OR REPLACE INTO responses (url, etag, last_modified, headers, body, item, updated_at)
+            VALUES (?, ?, ?, ?, ?, NULL, ?)
+        ''', (url, etag, last_modified, json.dumps(headers), zlib.compress(body), time.time()))
+
+    def put_item(self, url, item):
+        """
+        Stores the parsed item of a URL, if its response is cached (Splash responses aren't).
+        """
+        self.__write('UPDATE responses SET item = ? WHERE url = ?', (json.dumps(item), url))
+
+    def close(self):
+        self.__flush()
+        self.users_cnt -= 1
+        if self.users_cnt <= 0:
+            self.connection.close()
+            self._opened.pop(self.path, None)
+
+
+def decode_headers(headers):
+    return {key.decode('latin-1'): [v.decode('latin-1') for v in values] for key, values in headers.items()}
+
+
+class ConditionalRequestMiddleware:
+    """
+    Downloader middleware for recrawls: sends If-None-Match/If-Modified-Since for the URLs cached in RECRAWL_CACHE_PATH.
+    On a 304, the cached body is returned as a 200 response (flagged 'not_modified'),
+    with the stored parsed item in meta['cached_item'] (if there is one), so the spider can reuse it.
+    The responses are cached under the URL first requested (not the one they were redirected to),
+    which is the URL of the items the RecrawlCachePipeline stores next to them.
+    Splash requests are not cached.
+    """
+
+    def __init__(self, store, stats):
+        self.store = store
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('RECRAWL_CACHE_ENABLED'):
+            raise NotConfigured
+        o = cls(RecrawlCacheStore.open(crawler.settings.get('RECRAWL_CACHE_PATH')), crawler.stats)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_closed(self, spider):
+        self.store.close()
+
+    @staticmethod
+    def __is_cacheable(request):
+        return request.method == 'GET' and 'splash' not in request.meta and not request.meta.get('dont_cache')
+
+    def process_request(self, request, spider):
+        if not self.__is_cacheable(request):
+            return None
+
+        # Set before the RedirectMiddleware, which copies the meta to the redirected requests
+        cache_url = request.meta.setdefault(CACHE_URL_META_KEY, request.url)
+        cached = self.store.get(cache_url)
+        if cached is None:
+            return None
+
+        request.meta['recrawl_cache'] = cached
+        if cached['etag'] and b'If-None-Match' not in request.headers:
+            request.headers['If-None-Match'] = cached['etag']
+        if cached['last_modified'] and b'If-Modified-Since' not in request.headers:
+            request.headers['If-Modified-Since'] = cached['last_modified']
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self.__is_cacheable(request):
+            return response
+
+        cached = request.meta.pop('recrawl_cache', None)
+        if response.status == 304 and cached is not None:
+            self.stats.inc_value('recrawl_cache/not_modified')
+            if cached['item'] is not None:
+                request.meta['cached_item'] = cached['item']
+            headers = Headers(cached['headers'])
+            respcls = responsetypes.from_args(headers=headers, url=request.url, body=cached['body'])
+            return respcls(url=request.url, status=200, headers=headers, body=cached['body'],
+                           request=request, flags=['cached', 'not_modified'])
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status == 200 and (etag or last_modified):
+            self.store.put_response(url=request.meta.get(CACHE_URL_META_KEY, request.url),
+                                    etag=etag.decode('latin-1') if etag else None,
+                                    last_modified=last_modified.decode('latin-1') if last_modified else None,
+                                    headers=decode_headers(response.headers),
+                                    body=response.body)
+            self.stats.inc_value('recrawl_cache/stored')
+        return response
+
+
+class RecrawlCachePipeline:
+    """
+    Stores the scraped items next to their cached responses, so they can be reused when the page is not modified.
+    The items are stored under their 'url', the URL their article was requested with (before any redirect).
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('RECRAWL_CACHE_ENABLED'):
+            raise NotConfigured
+        return cls(crawler.settings.get('RECRAWL_CACHE_PATH'))
+
+    def open_spider(self, spider):
+        self.store = RecrawlCacheStore.open(self.cache_path)
+
+    def close_spider(self, spider):
+        self.store.close()
+
+    def process_item(self, item, spider):
+        item_dict = ItemAdapter(item).asdict()
+        if item_dict.get('url'):
+            self.store.put_item(item_dict['url'], item_dict)
+        return item
@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from urllib.parse import urlparse
+
+digits_re = re.compile(r'\d+')
+
+STATIC = 'static'
+SPLASH = 'splash'
+ADAPTIVE = 'adaptive'
+
+
+def url_path_pattern(url):
+    """
+    Groups the URLs of a site that are (probably) rendered the same way:
+    the domain and the "directory" of the path, with the numbers replaced.
+
+    Example:
+        https://www.bitdefender.com/blog/labs/5-times-more/ -> www.bitdefender.com/blog/labs/*
+
+    Args:
+        url (str): The URL.
+    Returns:
+        str: The URL pattern.
+    """
+    parsed = urlparse(url)
+    segments = [s for s in parsed.path.split('/') if s]
+    directory = '/'.join(digits_re.sub('{n}', s) for s in segments[:-1])
+    return f'{parsed.hostname}/{directory}/*' if directory else f'{parsed.hostname}/*'
+
+
+class RenderRouter:
+    def __init__(self, routes_path=None):
+        """
+        Remembers, per URL pattern, whether the static HTML had enough content or Splash rendering was needed,
+        so only the first articles of a pattern are probed statically.
+        The routes file is shared by the spiders (also of other crawl processes): only the counts recorded
+        by this router are added to it when saving, so the routes learned by the others are kept.
+
+        Args:
+            routes_path (Optional[str]):
+                A JSON file where the routes are kept between crawls.
+        Returns:
+            RenderRouter:
+                The initialized router
+        """
+        self.routes_path = routes_path
+        self.counts = self.__load()  # {url_pattern: {route: count}}
+        self.new_counts = defaultdict(lambda: {STATIC: 0, SPLASH: 0})  # Recorded since the last save
+        if self.counts:
+            logging.info(f'Loaded {len(self.counts)} render routes from {routes_path}')
+
+    def __load(self):
+        """
+        Returns:
+            DefaultDict[str, Dict[str, int]]: The route counts in the routes file (if any).
+        """
+        counts = defaultdict(lambda: {STATIC: 0, SPLASH: 0})
+        if self.routes_path and os.path.exists(self.routes_path):
+            with open(self.routes_path, 'r') as fin:
+                for pattern, pattern_counts in json.load(fin).items():
+                    counts[pattern].update(pattern_counts)
+        return counts
+
+    def get_route(self, url):
+        """
+        Args:
+            url (str): The article URL.
+        Returns:
+            Optional[str]: STATIC or SPLASH, or None if the pattern of the URL wasn't seen yet (so it must be probed).
+        """
+        pattern = url_path_pattern(url)
+        if pattern not in self.counts:
+            return None
+        counts = self.counts[pattern]
+        return SPLASH if counts[SPLASH] > counts[STATIC] else STATIC
+
+    def record(self, url, route):
+        """
+        Records which route worked for an article.
+
+        Args:
+            url (str): The article URL.
+            route (str): STATIC or SPLASH.
+        """
+        pattern = url_path_pattern(url)
+        self.counts[pattern][route] += 1
+        self.new_counts[pattern][route] += 1
+
+    def save(self):
+        """
+        Adds the recorded counts to the current ones of the routes file (that other spiders may have saved since
+        it was loaded), and atomically replaces it.
+        """
+        if not self.routes_path or not self.new_counts:
+            return
+        counts = self.__load()
+        for pattern, new_counts in self.new_counts.items():
+            for route, count in new_counts.items():
+                counts[pattern][route] = counts[pattern].get(route, 0) + count
+
+        tmp_routes_path = f'{self.routes_path}.{os.getpid()}.tmp'
+        with open(tmp_routes_path, 'w') as fout:
+            json.dump(counts, fout, indent=4)
+        os.replace(tmp_routes_path, self.routes_path)
+        self.counts = counts
+        self.new_counts.clear()
@@ -24,14 +24,30 @@ ROBOTSTXT_OBEY = True
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-DOWNLOAD_DELAY = 0.5
+DOWNLOAD_DELAY = 0.5  # The initial delay of a domain, then adjusted by the AdaptiveConcurrencyMiddleware
 RANDOMIZE_DOWNLOAD_DELAY = True
 RETRY_TIMES = 100
-RETRY_DELAY = 1
+RETRY_DELAY = 1  # The first retry delay of a domain, doubled for each consecutive retryable response
+RETRY_MAX_DELAY = 60
+RETRY_JITTER = 0.5
+RETRY_BUDGET_RATIO = 0.2  # Retries per domain: at most RETRY_BUDGET_MIN_RETRIES + RETRY_BUDGET_RATIO * responses
+RETRY_BUDGET_MIN_RETRIES = 10
+# Holds the delayed retries until they are due, instead of in the downloader (needed by the retry delays)
+SCHEDULER = 'news_crawler.delayed_scheduler.DelayedRequestScheduler'
 # The download delay setting will honor only one of:
-# CONCURRENT_REQUESTS_PER_DOMAIN = 1000  # default: 8
+CONCURRENT_REQUESTS_PER_DOMAIN = 2  # The initial concurrency of a domain, then adjusted (default: 8)
 # CONCURRENT_REQUESTS_PER_IP = 16
 
+# The AdaptiveConcurrencyMiddleware limits (a spider can declare its own, see the middleware)
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_MAX_CONCURRENCY = 8
+ADAPTIVE_MIN_DELAY = 0.
+ADAPTIVE_MAX_DELAY = 60.
+ADAPTIVE_DELAY_STEP = 0.05  # The delay decrease per successful response
+ADAPTIVE_TARGET_LATENCY = 3.  # Seconds, over this the domain is backed off
+ADAPTIVE_MAX_ERROR_RATE = 0.1  # Of the recent responses (moving average)
+ADAPTIVE_STATS_INTERVAL = 60.  # Seconds between the per-domain stats updates
+
 # Disable cookies (enabled by default)
 # COOKIES_ENABLED = False
 
@@ -52,9 +68,28 @@ RETRY_DELAY = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-# ITEM_PIPELINES = {
-#    'news_crawler.pipelines.NewsCrawlerPipeline': 300,
-# }
+ITEM_PIPELINES = {
+    'news_crawler.pipelines.JsonLinesPipeline': 300,
+    'news_crawler.recrawl_cache.RecrawlCachePipeline': 400,
+    'news_crawler.pipelines.IngestPipeline': 500,
+}
+
+# Streamed results: JSONL_OUTPUT_DIR/<source>/part-NNNNN.jsonl[.gz|.zst]
+JSONL_OUTPUT_DIR = 'results'
+# 'zstd' needs the optional zstandard package (pip install zstandard), in the crawler and in news_clustering
+JSONL_COMPRESSION = None  # None, 'gzip' or 'zstd'
+JSONL_ROTATE_ITEMS = 10000  # Items per part file (0 = never rotate)
+
+# Push the scraped items to the running news_clustering service, so they are searchable while the crawl goes on
+# (e.g. 'http://127.0.0.1:8000/news_clustering/ingest'; None = only the JSON Lines results)
+INGEST_URL = None
+INGEST_BATCH_SIZE = 100  # Items per request (the service accepts at most 1000)
+INGEST_MAX_DELAY = 2.0  # Seconds a scraped item can wait for its batch to fill up
+INGEST_MAX_PENDING_ITEMS = 2000  # Over this, the item processing waits for the batches to be sent
+INGEST_MAX_RETRIES = 5  # Then the batch is dropped (it's still in the results files)
+INGEST_RETRY_DELAY = 1.0  # Doubled at every retry of a batch
+INGEST_MAX_RETRY_DELAY = 30.0
+INGEST_TIMEOUT = 30.0
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -69,6 +104,17 @@ RETRY_DELAY = 1
 # Enable showing throttling stats for every response received:
 # AUTOTHROTTLE_DEBUG = False
 
+# Conditional requests for recrawls: ETag/Last-Modified, bodies and parsed items are kept in one SQLite file,
+# and a 304 reuses them (see news_crawler/recrawl_cache.py)
+RECRAWL_CACHE_ENABLED = True
+RECRAWL_CACHE_PATH = 'recrawl_cache.sqlite3'
+
+# Incremental crawls: skip the articles already scraped from a source, and stop paginating after
+# FRONTIER_OVERLAP_PAGES consecutive listing pages with only known articles
+FRONTIER_ENABLED = True
+FRONTIER_PATH = 'frontier.sqlite3'
+FRONTIER_OVERLAP_PAGES = 1
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 # HTTPCACHE_ENABLED = True
@@ -79,14 +125,35 @@ RETRY_DELAY = 1
 
 # JavaScript rendering
 
+# Headless browser, for the requests with meta {'playwright': True} (e.g. the ScrollableSpider).
+# The other requests are downloaded by the default HTTP handler.
+DOWNLOAD_HANDLERS = {
+    'http': 'news_crawler.playwright_handler.PlaywrightDownloadHandler',
+    'https': 'news_crawler.playwright_handler.PlaywrightDownloadHandler',
+}
+TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'  # Needed by the async Playwright API
+PLAYWRIGHT_MAX_PAGES = 4  # Concurrent pages in the browser shared by all the spiders of the process
+PLAYWRIGHT_BLOCKED_RESOURCE_TYPES = ['image', 'font', 'media']
+PLAYWRIGHT_NAVIGATION_TIMEOUT = 60
+PLAYWRIGHT_SCROLL_SETTLE = 1.5  # Seconds without DOM mutations and requests, after which a scroll is done
+PLAYWRIGHT_SCROLL_TIMEOUT = 30
+
 SPLASH_URL = 'http://127.0.0.1:8050/'
 # SPLASH_URL = 'http://192.168.59.103:8050'
 
+# How the BlogSpider articles are downloaded: 'splash', 'static' or 'adaptive'
+# (static first, escalating to Splash when there is less than RENDER_MIN_CONTENT_CHARS of content)
+RENDER_MODE = 'adaptive'
+RENDER_MIN_CONTENT_CHARS = 500
+RENDER_ROUTES_PATH = 'render_routes.json'  # The remembered route per URL pattern
+
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
     'news_crawler.middlewares.CustomRetryMiddleware': 550,
+    'news_crawler.middlewares.AdaptiveConcurrencyMiddleware': 560,  # Sees the 429/503 responses before the retries
+    'news_crawler.recrawl_cache.ConditionalRequestMiddleware': 580,  # Sees the decompressed bodies
 
     'scrapy_splash.SplashCookiesMiddleware': 723,
     'scrapy_splash.SplashMiddleware': 725,
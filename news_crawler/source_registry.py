@@ -0,0 +1,80 @@
+import json
+import os
+from urllib.parse import urlparse
+
+from news_crawler.spiders.blog_spider import BlogSpider
+
+DEFAULT_SOURCES_PATH = os.path.join(os.path.dirname(__file__), 'sources.json')
+REQUIRED_KEYS = ('name', 'base_url', 'article_locator_query', 'content_locator_query_list')
+REGISTRY_ONLY_KEYS = ('name', 'enabled', 'notes')  # Not passed to the spider
+
+
+def load_sources(path=DEFAULT_SOURCES_PATH, names=None):
+    """
+    Loads the sources of a registry: a JSON (or YAML) list of the BlogSpider arguments of each source, of format:
+        [{'name': str, 'base_url': str, 'article_locator_query': str, 'content_locator_query_list': str | List[str],
+          'next_locator_query': str, 'next_contains_text': str, 'enabled': bool, 'notes': str, ...}]
+    The other keys are passed to the spider too (e.g. render_mode, overlap_pages, max_concurrency).
+
+    Args:
+        path (str):
+            The registry path (.json, or .yaml/.yml, which needs the pyyaml package).
+        names (Optional[List[str]]):
+            If provided, only these sources are loaded (even if they are disabled).
+    Returns:
+        List[Dict[str, Any]]:
+            The enabled (or the named) sources.
+    """
+    with open(path, 'r', encoding='utf-8') as fin:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml  # Optional dependency, only needed for YAML registries
+            sources = yaml.safe_load(fin)
+        else:
+            sources = json.load(fin)
+
+    seen_names = set()
+    for source in sources:
+        missing_keys = [key for key in REQUIRED_KEYS if not source.get(key)]
+        if missing_keys:
+            raise Exception(f'The source {source.get("name") or source.get("base_url")} has no {missing_keys}')
+        if source['name'] in seen_names:
+            raise Exception(f'The source name {source["name"]} is used more than once in {path}')
+        seen_names.add(source['name'])
+
+    if names:
+        unknown_names = set(names) - seen_names
+        if unknown_names:
+            raise Exception(f'Unknown sources {sorted(unknown_names)}, the sources of {path} are {sorted(seen_names)}')
+        return [source for source in sources if source['name'] in names]
+    return [source for source in sources if source.get('enabled', True)]
+
+
+def get_source_domain(source):
+    """
+    Args:
+        source (Dict[str, Any]): A registry source.
+    Returns:
+        str: The domain of the source.
+    """
+    return urlparse(source['base_url']).hostname or ''
+
+
+def add_sources_to_process(process, sources):
+    """
+    Adds a BlogSpider crawl of each source to a CrawlerProcess.
+
+    Args:
+        process (scrapy.crawler.CrawlerProcess):
+            The process.
+        sources (List[Dict[str, Any]]):
+            The registry sources.
+    Returns:
+        Dict[str, scrapy.crawler.Crawler]:
+            The crawlers, by source name (their stats can be read when the process is finished).
+    """
+    crawlers = dict()
+    for source in sources:
+        crawler = process.create_crawler(BlogSpider)
+        process.crawl(crawler, **{key: value for key, value in source.items() if key not in REGISTRY_ONLY_KEYS})
+        crawlers[source['name']] = crawler
+    return crawlers
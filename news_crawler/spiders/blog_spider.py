@@ -1,9 +1,12 @@
 import json
 import time
-from scrapy import Spider
+from scrapy import Spider, signals
 from scrapy.http import Response
 import re
 
+from news_crawler import render_router
+from news_crawler.frontier import SeenUrlIndex
+from news_crawler.render_router import RenderRouter
 from news_crawler.spiders.base_spider import BaseSpider
 
 # TODO-URGENT: Do something about JavaScript loaded webpages
@@ -21,7 +24,21 @@ class BlogSpider(BaseSpider):
                  content_locator_query_list=None,
                  next_locator_query=None,
                  next_contains_text=None,
+                 render_mode=None,
+                 overlap_pages=None,
                  *args, **kwargs):
+        """
+        Args:
+            render_mode (Optional[str]):
+                How the articles are downloaded (defaults to the RENDER_MODE setting):
+                    'splash': always rendered by Splash;
+                    'static': never rendered (same as the old FOLLOW_STATIC argument);
+                    'adaptive': downloaded statically first, and rendered by Splash only if the static HTML
+                        doesn't have RENDER_MIN_CONTENT_CHARS of content. The result is remembered per URL pattern.
+            overlap_pages (Optional[int]):
+                If FRONTIER_ENABLED, the already scraped articles are skipped, and the pagination stops after
+                this many consecutive listing pages with only known articles (defaults to FRONTIER_OVERLAP_PAGES).
+        """
         self.base_url = base_url
         self.start_urls = [base_url]
         self.key = key
@@ -34,6 +51,57 @@ class BlogSpider(BaseSpider):
             content_locator_query_list = [content_locator_query_list]
         self.content_locator_query_list = content_locator_query_list
 
+        if getattr(self, 'FOLLOW_STATIC', None):
+            render_mode = render_router.STATIC
+        self._render_mode = render_mode
+        self._render_router = None
+        self._overlap_pages = overlap_pages
+        self._frontier = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(BlogSpider, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        return spider
+
+    @property
+    def render_mode(self):
+        return self._render_mode or self.settings.get('RENDER_MODE', render_router.SPLASH)
+
+    @property
+    def render_router(self):
+        if self._render_router is None:
+            self._render_router = RenderRouter(routes_path=self.settings.get('RENDER_ROUTES_PATH'))
+        return self._render_router
+
+    @property
+    def frontier(self):
+        """
+        Returns:
+            Optional[SeenUrlIndex]: The articles already scraped from this source, if FRONTIER_ENABLED.
+        """
+        if self._frontier is None and self.settings.getbool('FRONTIER_ENABLED'):
+            self._frontier = SeenUrlIndex(self.settings.get('FRONTIER_PATH'), self.base_url)
+        return self._frontier
+
+    @property
+    def overlap_pages(self):
+        if self._overlap_pages is not None:
+            return int(self._overlap_pages)
+        return self.settings.getint('FRONTIER_OVERLAP_PAGES', 1)
+
+    def item_scraped(self, item, response, spider):
+        if spider is self and self.frontier is not None:
+            url = item.get('url') or response.meta.get('url')
+            if url:
+                self.frontier.add(url)
+
+    def closed(self, reason):
+        if self._render_router is not None:
+            self._render_router.save()
+        if self._frontier is not None:
+            self._frontier.close()
+
     def content_parse_elem(self, response: Response, **kwargs):
         content = ' '.join([
             ' '.join(response.css(clq + ' :not(script)').css('::text').getall())
@@ -58,26 +126,74 @@ class BlogSpider(BaseSpider):
         return res
 
     def content_parse(self, response, **kwargs):
-        return self.content_parse_elem(response=response,
-                                       **kwargs)
+        cached_item = response.meta.get('cached_item')
+        if cached_item:  # Not modified since the last crawl (see ConditionalRequestMiddleware)
+            self.crawler.stats.inc_value('recrawl_cache/item_reused')
+            return cached_item
+
+        res = self.content_parse_elem(response=response,
+                                      **kwargs)
+        if self.render_mode != render_router.ADAPTIVE or 'splash' in response.meta:
+            return res
+
+        url = response.meta['url']
+        if len(res['content']) >= self.settings.getint('RENDER_MIN_CONTENT_CHARS', 500):
+            self.render_router.record(url, render_router.STATIC)
+            self.crawler.stats.inc_value('render_router/static')
+            return res
+
+        # The static HTML isn't enough, so escalate to Splash
+        self.render_router.record(url, render_router.SPLASH)
+        self.crawler.stats.inc_value('render_router/escalated')
+        return self.follow_dynamically(response, self.content_parse, url=url, meta={
+            key: response.meta[key] for key in ('title', 'url', 'delay_retries_by')
+        })
+
+    def follow_article(self, response, href, url, meta):
+        """
+        Follows an article, statically or through Splash, depending on the render mode.
+        """
+        render_mode = self.render_mode
+        if render_mode == render_router.ADAPTIVE:
+            render_mode = self.render_router.get_route(url) or render_router.STATIC
+            if render_mode == render_router.SPLASH:
+                self.crawler.stats.inc_value('render_router/splash')
+
+        if render_mode == render_router.STATIC:
+            return response.follow(href, self.content_parse, meta=meta)
+        return self.follow_dynamically(response, self.content_parse, url=url, meta=meta)
 
     def parse(self, response, **kwargs):
+        frontier = self.frontier
+        articles_cnt = new_articles_cnt = 0
         for a in response.css(self.article_locator_query):
             href = a.attrib['href']
             url = response.urljoin(href)
+            articles_cnt += 1
+            if frontier is not None and url in frontier:
+                self.crawler.stats.inc_value('frontier/skipped')
+                continue
+            new_articles_cnt += 1
+
             meta = {
                 'title': a.css('::text').get().strip(),
                 'url': url,
                 'delay_retries_by': self.settings.getfloat('RETRY_DELAY'),
             }
 
-            if 'FOLLOW_STATIC' not in kwargs:
-                yield self.follow_dynamically(response, self.content_parse, url=url, meta=meta)
-            else:
-                yield response.follow(href, self.content_parse, meta=meta)
+            yield self.follow_article(response, href, url, meta)
+
+        # Count the consecutive listing pages that only have already scraped articles
+        known_pages = 0
+        if frontier is not None and articles_cnt and not new_articles_cnt:
+            known_pages = response.meta.get('frontier_known_pages', 0) + 1
+            if known_pages > self.overlap_pages:
+                self.crawler.stats.inc_value('frontier/stopped_pagination')
+                return
 
         meta = {
             'delay_retries_by': self.settings.getfloat('RETRY_DELAY'),
+            'frontier_known_pages': known_pages,
         }
         for next_href in response.css(self.next_locator_query):
             if (not self.next_contains_text or